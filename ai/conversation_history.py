@@ -0,0 +1,128 @@
+"""
+История разговора с учетом бюджета токенов
+"""
+
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional
+
+# Служебные токены разметки чата на одно сообщение (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка числа токенов без токенизатора модели.
+    Считаем по байтам UTF-8: ~4 байта на токен для латиницы и ~2 символа
+    кириллицы на токен, что с запасом покрывает BPE-токенизаторы Qwen/Llama.
+    """
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+class ConversationHistory:
+    """Хранилище сообщений с инкрементальным подсчетом токенов"""
+
+    def __init__(self, max_tokens: int, max_messages: int = 50, trim_ratio: float = 0.75):
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+
+        # При переполнении обрезаем с запасом до этой доли лимита, чтобы начало
+        # истории (и префикс промпта в KV-кэше) менялось редко, а не на каждом сообщении
+        self.trim_ratio = trim_ratio
+
+        self.messages: Deque[Dict[str, str]] = deque()
+        self.token_counts: Deque[int] = deque()
+        self.total_tokens = 0
+
+    def append(self, role: str, content: str) -> Dict[str, str]:
+        """Добавляет сообщение и обрезает историю под бюджет; возвращает добавленное сообщение"""
+        tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        message = {
+            'role': role,
+            'content': content
+        }
+
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.total_tokens += tokens
+
+        self.trim()
+        return message
+
+    def insert_after(self, anchor: Dict[str, str], role: str, content: str) -> bool:
+        """
+        Вставляет сообщение сразу после anchor (после него могли появиться
+        более новые сообщения). False, если anchor уже удален из истории
+        """
+        position = self._position(anchor)
+        if position is None:
+            return False
+
+        tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        self.messages.insert(position + 1, {
+            'role': role,
+            'content': content
+        })
+        self.token_counts.insert(position + 1, tokens)
+        self.total_tokens += tokens
+
+        self.trim()
+        return True
+
+    def remove(self, message: Dict[str, str]) -> bool:
+        """Удаляет сообщение из истории; False, если его уже нет"""
+        position = self._position(message)
+        if position is None:
+            return False
+
+        del self.messages[position]
+        self.total_tokens -= self.token_counts[position]
+        del self.token_counts[position]
+        return True
+
+    def trim(self) -> int:
+        """Удаляет самые старые сообщения, если история превысила лимиты"""
+        if self.total_tokens <= self.max_tokens and len(self.messages) <= self.max_messages:
+            return 0
+
+        target_tokens = int(self.max_tokens * self.trim_ratio)
+        target_messages = max(1, int(self.max_messages * self.trim_ratio))
+        removed = 0
+
+        # Последнее сообщение (текущий запрос) сохраняем всегда
+        while len(self.messages) > 1 and (
+            self.total_tokens > target_tokens or len(self.messages) > target_messages
+        ):
+            self.messages.popleft()
+            self.total_tokens -= self.token_counts.popleft()
+            removed += 1
+
+        return removed
+
+    def set_limits(self, max_tokens: int, max_messages: int) -> None:
+        """Изменяет лимиты истории"""
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.trim()
+
+    def clear(self) -> None:
+        """Очищает историю"""
+        self.messages.clear()
+        self.token_counts.clear()
+        self.total_tokens = 0
+
+    def to_list(self) -> List[Dict[str, str]]:
+        """Возвращает копию сообщений в виде списка"""
+        return list(self.messages)
+
+    def _position(self, message: Dict[str, str]) -> Optional[int]:
+        """Позиция сообщения (сравнение по объекту, поиск с конца)"""
+        for position in range(len(self.messages) - 1, -1, -1):
+            if self.messages[position] is message:
+                return position
+        return None
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return iter(self.messages)
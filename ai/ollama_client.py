@@ -2,11 +2,118 @@
 Клиент для работы с Ollama API
 """
 
-import asyncio
+import time
+import threading
 import ollama
-from typing import List, Dict, Optional, AsyncGenerator
+from typing import Any, Callable, List, Dict, Optional, Iterator
 from config.config_manager import config
 from utils.logger import logger
+from utils.tracing import tracer
+from .conversation_history import ConversationHistory, estimate_tokens
+
+# Пометка ответа, прерванного пользователем
+INTERRUPTED_SUFFIX = " …"
+
+
+class ModelRegistry:
+    """Кэш списка моделей Ollama с фоновой проверкой доступности сервера"""
+    
+    def __init__(self, client: ollama.Client, ttl: float = 60.0, probe_interval: float = 30.0):
+        self.client = client
+        self.ttl = ttl
+        self.probe_interval = probe_interval
+        
+        self.models: List[str] = []
+        self.server_available = False
+        self.last_refresh = 0.0
+        
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[bool, List[str]], None]] = []
+        self._stop_event = threading.Event()
+        self._probe_thread: Optional[threading.Thread] = None
+    
+    def refresh(self) -> bool:
+        """Запрашивает список моделей у сервера и уведомляет об изменениях"""
+        try:
+            response = self.client.list()
+            models = [model['name'] for model in response['models']]
+            available = True
+        except Exception as e:
+            if self.server_available:
+                logger.error(f"Ollama сервер недоступен: {e}")
+            models = []
+            available = False
+        
+        with self._lock:
+            changed = available != self.server_available or models != self.models
+            self.models = models
+            self.server_available = available
+            self.last_refresh = time.monotonic()
+            listeners = list(self._listeners)
+        
+        if changed:
+            logger.info(f"Состояние Ollama изменилось. Доступен: {available}, модели: {models}")
+            for listener in listeners:
+                try:
+                    listener(available, models)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика состояния Ollama: {e}")
+        
+        return available
+    
+    def is_stale(self) -> bool:
+        """Проверяет, устарел ли кэш"""
+        return self.last_refresh == 0.0 or time.monotonic() - self.last_refresh > self.ttl
+    
+    def get_models(self, force_refresh: bool = False) -> List[str]:
+        """Возвращает список моделей, обновляя кэш только по истечении TTL"""
+        if force_refresh or self.is_stale():
+            self.refresh()
+        with self._lock:
+            return list(self.models)
+    
+    def has_model(self, model_name: str) -> bool:
+        """Проверяет наличие модели по кэшу без сетевого запроса"""
+        # Пока кэш не заполнен ни разу, один раз опрашиваем сервер синхронно
+        if self.last_refresh == 0.0:
+            self.refresh()
+        with self._lock:
+            return self.server_available and model_name in self.models
+    
+    def add_listener(self, listener: Callable[[bool, List[str]], None]) -> None:
+        """
+        Подписывает обработчик на изменение доступности сервера или списка моделей.
+        Если сервер уже опрошен, обработчик сразу получает текущее состояние
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            refreshed = self.last_refresh != 0.0
+            available = self.server_available
+            models = list(self.models)
+        
+        if refreshed:
+            try:
+                listener(available, models)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика состояния Ollama: {e}")
+    
+    def start(self) -> None:
+        """Запускает фоновую проверку сервера"""
+        if self._probe_thread is not None and self._probe_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._probe_thread = threading.Thread(target=self._probe_loop, daemon=True)
+        self._probe_thread.start()
+    
+    def stop(self) -> None:
+        """Останавливает фоновую проверку сервера"""
+        self._stop_event.set()
+    
+    def _probe_loop(self) -> None:
+        """Периодически обновляет кэш моделей"""
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.probe_interval)
 
 
 class OllamaClient:
@@ -16,64 +123,141 @@ class OllamaClient:
         self.host = config.get('ai.ollama_host', 'http://localhost:11434')
         self.model = config.get('ai.model', 'qwen3:30b')
         self.client = ollama.Client(host=self.host)
-        self.conversation_history: List[Dict[str, str]] = []
-        self.max_history = config.get('personality.conversation_memory', 50)
         
-        # Системный промпт
+        # Кэш моделей: горячий путь отправки сообщения не делает лишних HTTP-запросов
+        self.registry = ModelRegistry(
+            self.client,
+            ttl=config.get('ai.models_cache_ttl', 60),
+            probe_interval=config.get('ai.health_check_interval', 30)
+        )
+        self.registry.start()
+        
+        # Системный промпт (статичный: от него зависит переиспользование KV-кэша)
         self.system_prompt = config.get('personality.system_prompt', '')
         
+        # Изменчивое состояние персонажа (настроение и т.п.), добавляется в конец промпта
+        self.state_prompt_provider: Optional[Callable[[], str]] = None
+        
+        # Сколько модель остается загруженной в памяти после запроса
+        self.keep_alive = config.get('ai.keep_alive', '30m')
+        
+        # История с бюджетом токенов, производным от num_ctx; прерванная генерация
+        # может завершаться параллельно с новой, поэтому доступ под блокировкой
+        self.history_lock = threading.Lock()
+        self.conversation_history = ConversationHistory(
+            max_tokens=self.get_history_budget(),
+            max_messages=config.get('personality.conversation_memory', 50),
+            trim_ratio=config.get('ai.history_trim_ratio', 0.75)
+        )
+        
         logger.info(f"Ollama клиент инициализирован. Хост: {self.host}, Модель: {self.model}")
     
     def is_available(self) -> bool:
-        """Проверяет доступность Ollama сервера"""
-        try:
-            models = self.client.list()
-            available_models = [model['name'] for model in models['models']]
-            
-            if self.model not in available_models:
-                logger.warning(f"Модель {self.model} не найдена. Доступные модели: {available_models}")
-                return False
-            
-            return True
-        except Exception as e:
-            logger.error(f"Ollama сервер недоступен: {e}")
-            return False
+        """Проверяет доступность Ollama сервера и модели (по кэшу)"""
+        return self.registry.has_model(self.model)
+    
+    def set_host(self, host: str) -> None:
+        """Переключает клиент на другой сервер Ollama"""
+        if host == self.host:
+            return
+        
+        self.host = host
+        self.client = ollama.Client(host=self.host)
+        self.registry.client = self.client
+        self.registry.refresh()
+        logger.info(f"Хост Ollama изменен на: {host}")
+    
+    @property
+    def max_history(self) -> int:
+        """Максимальное количество сообщений в истории"""
+        return self.conversation_history.max_messages
+    
+    @max_history.setter
+    def max_history(self, value: int) -> None:
+        self.conversation_history.set_limits(self.conversation_history.max_tokens, value)
+    
+    def get_history_budget(self) -> int:
+        """Вычисляет бюджет токенов для истории: контекст минус системный промпт и запас на ответ"""
+        num_ctx = config.get('ai.max_tokens', 1024)
+        reserve = config.get('ai.response_reserve', 256)
+        system_tokens = estimate_tokens(self.system_prompt) if self.system_prompt else 0
+        return max(0, num_ctx - reserve - system_tokens)
+    
+    def get_options(self) -> Dict[str, Any]:
+        """Параметры модели; должны совпадать во всех запросах, иначе Ollama перезагрузит модель"""
+        return {
+            'temperature': config.get('ai.temperature', 0.7),
+            'num_ctx': config.get('ai.max_tokens', 1024)
+        }
     
     def add_to_history(self, role: str, content: str) -> None:
         """Добавляет сообщение в историю разговора"""
-        self.conversation_history.append({
-            'role': role,
-            'content': content
-        })
-        
-        # Ограничиваем размер истории
-        if len(self.conversation_history) > self.max_history:
-            # Сохраняем системный промпт, удаляем старые сообщения
-            system_messages = [msg for msg in self.conversation_history if msg['role'] == 'system']
-            user_assistant_messages = [msg for msg in self.conversation_history if msg['role'] != 'system']
-            
-            # Оставляем только последние сообщения
-            keep_count = self.max_history - len(system_messages)
-            user_assistant_messages = user_assistant_messages[-keep_count:]
-            
-            self.conversation_history = system_messages + user_assistant_messages
+        with self.history_lock:
+            self.conversation_history.append(role, content)
     
     def get_messages(self) -> List[Dict[str, str]]:
         """Формирует список сообщений для отправки в Ollama"""
         messages = []
         
-        # Добавляем системный промпт, если он не в истории
-        if self.system_prompt and not any(msg['role'] == 'system' for msg in self.conversation_history):
+        with self.history_lock:
+            # Бюджет пересчитываем на случай смены промпта или размера контекста
+            self.conversation_history.set_limits(self.get_history_budget(), self.max_history)
+            if self.conversation_history.total_tokens > self.conversation_history.max_tokens:
+                logger.warning(
+                    f"Сообщение не помещается в контекст: ~{self.conversation_history.total_tokens} токенов "
+                    f"при бюджете {self.conversation_history.max_tokens}"
+                )
+            history = self.conversation_history.to_list()
+        
+        # Статичный системный промпт всегда первым: общий префикс запросов
+        # остается неизменным, и Ollama не пересчитывает его заново
+        if self.system_prompt:
             messages.append({
                 'role': 'system', 
                 'content': self.system_prompt
             })
         
         # Добавляем историю разговора
-        messages.extend(self.conversation_history)
+        messages.extend(history)
+        
+        # Изменчивое состояние вставляем перед последним сообщением пользователя,
+        # чтобы оно не ломало префикс следующих запросов
+        state_prompt = self.state_prompt_provider() if self.state_prompt_provider else ''
+        if state_prompt and messages and messages[-1]['role'] == 'user':
+            messages.insert(len(messages) - 1, {
+                'role': 'system',
+                'content': state_prompt
+            })
         
         return messages
     
+    def preload(self) -> bool:
+        """Загружает модель и прогревает KV-кэш системного промпта"""
+        try:
+            start_time = time.monotonic()
+            
+            messages = []
+            if self.system_prompt:
+                messages.append({'role': 'system', 'content': self.system_prompt})
+            
+            # Те же options, что и в рабочих запросах; генерируем один токен
+            options = self.get_options()
+            options['num_predict'] = 1
+            
+            self.client.chat(
+                model=self.model,
+                messages=messages,
+                options=options,
+                keep_alive=self.keep_alive
+            )
+            
+            logger.info(f"Модель {self.model} предзагружена за {time.monotonic() - start_time:.1f} с")
+            return True
+            
+        except Exception as e:
+            logger.warning(f"Не удалось предзагрузить модель {self.model}: {e}")
+            return False
+    
     def generate_response(self, user_input: str) -> str:
         """Генерирует ответ на пользователский ввод"""
         try:
@@ -89,10 +273,8 @@ class OllamaClient:
             response = self.client.chat(
                 model=self.model,
                 messages=messages,
-                options={
-                    'temperature': config.get('ai.temperature', 0.7),
-                    'num_ctx': config.get('ai.max_tokens', 1024)
-                }
+                options=self.get_options(),
+                keep_alive=self.keep_alive
             )
             
             assistant_response = response['message']['content']
@@ -109,33 +291,64 @@ class OllamaClient:
             logger.error(error_msg)
             return f"Извини, произошла ошибка: {str(e)}"
     
-    async def generate_response_stream(self, user_input: str) -> AsyncGenerator[str, None]:
-        """Генерирует ответ потоком (для анимации печати)"""
+    def generate_response_stream(self, user_input: str,
+                                 cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """
+        Генерирует ответ потоком, отдавая токены по мере поступления.
+        Если cancel_event установлен, HTTP-поток закрывается на следующем
+        чанке, и Ollama прекращает генерацию на своей стороне
+        """
+        turn = tracer.current()
+        response_parts: List[str] = []
+        user_message = None
         try:
             # Добавляем сообщение пользователя в историю
-            self.add_to_history('user', user_input)
+            with self.history_lock:
+                user_message = self.conversation_history.append('user', user_input)
             
             # Формируем сообщения для Ollama
             messages = self.get_messages()
             
             logger.info(f"Отправка потокового запроса в Ollama: {user_input[:50]}...")
             
-            response_text = ""
+            if turn is not None:
+                turn.mark('llm_request')
             
             # Отправляем запрос с потоковой передачей
-            for chunk in self.client.chat(
+            stream = self.client.chat(
                 model=self.model,
                 messages=messages,
                 stream=True,
-                options={
-                    'temperature': config.get('ai.temperature', 0.7),
-                    'num_ctx': config.get('ai.max_tokens', 1024)
-                }
-            ):
-                if 'message' in chunk and 'content' in chunk['message']:
-                    content = chunk['message']['content']
-                    response_text += content
-                    yield content
+                options=self.get_options(),
+                keep_alive=self.keep_alive
+            )
+            
+            try:
+                for chunk in stream:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    
+                    content = chunk.get('message', {}).get('content', '')
+                    if content:
+                        if turn is not None:
+                            turn.mark('llm_first_token')
+                        response_parts.append(content)
+                        yield content
+                    
+                    # Последний чанк содержит статистику генерации на стороне сервера
+                    if chunk.get('done') and turn is not None:
+                        turn.mark('llm_done')
+                        turn.set_ollama_stats(chunk)
+            finally:
+                # Закрытие генератора закрывает HTTP-соединение
+                stream.close()
+            
+            if cancel_event is not None and cancel_event.is_set():
+                self.close_unanswered(user_message, ''.join(response_parts))
+                logger.info("Потоковая генерация прервана")
+                return
+            
+            response_text = ''.join(response_parts)
             
             # Добавляем полный ответ в историю
             self.add_to_history('assistant', response_text)
@@ -145,19 +358,49 @@ class OllamaClient:
         except Exception as e:
             error_msg = f"Ошибка при потоковой генерации: {e}"
             logger.error(error_msg)
-            yield f"Извини, произошла ошибка: {str(e)}"
+            if user_message is not None:
+                self.close_unanswered(user_message, ''.join(response_parts))
+            raise
+    
+    def close_unanswered(self, user_message: Dict[str, str], partial_response: str) -> None:
+        """
+        Закрывает прерванный ход, чтобы в истории не оставалось двух запросов
+        пользователя подряд: недоговоренный ответ (с пометкой) ставится сразу
+        после запроса - следующий запрос мог уже добавить свое сообщение, -
+        а запрос без единого токена ответа удаляется
+        """
+        with self.history_lock:
+            if partial_response:
+                self.conversation_history.insert_after(
+                    user_message, 'assistant', partial_response + INTERRUPTED_SUFFIX
+                )
+            else:
+                self.conversation_history.remove(user_message)
+    
+    def restore_history(self, messages: List[Dict[str, str]]) -> None:
+        """Восстанавливает историю разговора (например, из сохраненного чата)"""
+        with self.history_lock:
+            self.conversation_history.clear()
+            for message in messages:
+                self.conversation_history.append(message['role'], message['content'])
+            restored = len(self.conversation_history)
+        logger.info(f"История разговора восстановлена: {restored} сообщений")
     
     def clear_history(self) -> None:
         """Очищает историю разговора"""
-        self.conversation_history.clear()
+        with self.history_lock:
+            self.conversation_history.clear()
         logger.info("История разговора очищена")
     
     def set_model(self, model_name: str) -> bool:
         """Изменяет используемую модель"""
         try:
             # Проверяем доступность модели
-            models = self.client.list()
-            available_models = [model['name'] for model in models['models']]
+            available_models = self.registry.get_models()
+            
+            # Модель могла появиться после последнего обновления кэша
+            if model_name not in available_models:
+                available_models = self.registry.get_models(force_refresh=True)
             
             if model_name not in available_models:
                 logger.error(f"Модель {model_name} не найдена. Доступные: {available_models}")
@@ -166,17 +409,15 @@ class OllamaClient:
             self.model = model_name
             config.set('ai.model', model_name)
             logger.info(f"Модель изменена на: {model_name}")
+            
+            # Загружаем новую модель заранее, не блокируя вызывающий поток
+            threading.Thread(target=self.preload, daemon=True).start()
             return True
             
         except Exception as e:
             logger.error(f"Ошибка при смене модели: {e}")
             return False
     
-    def get_available_models(self) -> List[str]:
+    def get_available_models(self, force_refresh: bool = False) -> List[str]:
         """Получает список доступных моделей"""
-        try:
-            models = self.client.list()
-            return [model['name'] for model in models['models']]
-        except Exception as e:
-            logger.error(f"Ошибка получения списка моделей: {e}")
-            return []
+        return self.registry.get_models(force_refresh)
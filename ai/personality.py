@@ -4,8 +4,8 @@
 
 import random
 from typing import Dict, List, Optional, Any
-from ..config.config_manager import config
-from ..utils.logger import logger
+from config.config_manager import config
+from utils.logger import logger
 
 
 class PersonalityManager:
@@ -126,13 +126,19 @@ class PersonalityManager:
         """Возвращает расширенный системный промпт с текущим состоянием"""
         base_prompt = self.current_personality["system_prompt"]
         
+        return f"{base_prompt}\n\n{self.get_state_prompt()}"
+    
+    def get_state_prompt(self) -> str:
+        """
+        Возвращает только изменчивую часть промпта (настроение, эмоция, темы).
+        Передается в OllamaClient.state_prompt_provider отдельно от статичного
+        системного промпта, чтобы не сбрасывать кэш префикса в Ollama
+        """
         # Добавляем информацию о настроении и состоянии
         mood_desc = self.get_mood_description()
         emotion_desc = self.get_emotion_description()
         
-        enhanced_prompt = f"""{base_prompt}
-
-Текущее состояние персонажа:
+        state_prompt = f"""Текущее состояние персонажа:
 - Настроение: {mood_desc}
 - Эмоция: {emotion_desc}
 - Количество взаимодействий: {self.interaction_count}
@@ -140,7 +146,7 @@ class PersonalityManager:
 
 Учитывай это состояние в своих ответах, но не упоминай его явно."""
         
-        return enhanced_prompt
+        return state_prompt
     
     def get_mood_description(self) -> str:
         """Описывает текущее настроение"""
@@ -0,0 +1,189 @@
+"""
+Бенчмарк клиентской части ИИ: OllamaClient и путь ответа GUI (ResponseThread)
+против локальной имитации Ollama. Накладные расходы клиента считаются как
+разница между измеренным временем и задержками, заданными серверу
+
+    python -m benchmarks.bench_ollama --requests 20 --first-token-delay 0.1 --tokens-per-second 100 --gui
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import apply_overrides, percentile, quiet_logging, write_report
+from benchmarks.fake_ollama import FakeOllamaServer
+
+PROMPTS = [
+    "Привет! Как дела?",
+    "Посоветуй игру на вечер.",
+    "Расскажи что-нибудь интересное про космос.",
+]
+
+
+def stats(values: List[float]) -> Dict[str, float]:
+    """p50/p95/max в миллисекундах"""
+    if not values:
+        return {}
+    return {
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2)
+    }
+
+
+def run_client(client, server: FakeOllamaServer, requests: int) -> Dict[str, Any]:
+    """Замеряет потоковую генерацию OllamaClient напрямую"""
+    ttft: List[float] = []
+    totals: List[float] = []
+    gaps: List[float] = []
+    errors = 0
+
+    for index in range(requests):
+        # Пустая история: размер промпта одинаков во всех запросах
+        client.clear_history()
+        start = time.perf_counter()
+        first = last = None
+        try:
+            for _ in client.generate_response_stream(PROMPTS[index % len(PROMPTS)]):
+                now = time.perf_counter()
+                if first is None:
+                    first = now
+                else:
+                    gaps.append(now - last)
+                last = now
+        except Exception:
+            errors += 1
+            continue
+
+        if first is not None:
+            ttft.append(first - start)
+            totals.append(last - start)
+
+    expected_total = server.first_token_delay + (server.response_tokens - 1) / server.tokens_per_second
+    return {
+        'requests': requests,
+        'errors': errors,
+        'ttft': stats(ttft),
+        'total': stats(totals),
+        'inter_token': stats(gaps),
+        # Время сверх заданного серверу: HTTP, разбор NDJSON, история, генератор
+        'ttft_overhead': stats([value - server.first_token_delay for value in ttft]),
+        'total_overhead': stats([value - expected_total for value in totals])
+    }
+
+
+def run_gui_path(client, server: FakeOllamaServer, requests: int) -> Dict[str, Any]:
+    """Замеряет путь GUI: ResponseThread и доставку сигналов в главный поток"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtCore import QCoreApplication, QEventLoop
+    from gui.main_window import ResponseThread
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+
+    ttft: List[float] = []
+    totals: List[float] = []
+    errors = 0
+
+    for index in range(requests):
+        client.clear_history()
+        loop = QEventLoop()
+        marks: Dict[str, float] = {}
+
+        def on_token(token: str) -> None:
+            marks.setdefault('first', time.perf_counter())
+
+        def on_ready(text: str) -> None:
+            marks['done'] = time.perf_counter()
+            loop.quit()
+
+        def on_error(message: str) -> None:
+            marks['error'] = time.perf_counter()
+            loop.quit()
+
+        thread = ResponseThread(client, PROMPTS[index % len(PROMPTS)])
+        thread.token_received.connect(on_token)
+        thread.response_ready.connect(on_ready)
+        thread.error_occurred.connect(on_error)
+
+        start = time.perf_counter()
+        thread.start()
+        loop.exec_()
+        thread.wait()
+        # Доставляем оставшиеся события потока (finished), чтобы они не попали в следующий замер
+        app.processEvents()
+
+        if 'error' in marks or 'first' not in marks:
+            errors += 1
+            continue
+        ttft.append(marks['first'] - start)
+        totals.append(marks['done'] - start)
+
+    expected_total = server.first_token_delay + (server.response_tokens - 1) / server.tokens_per_second
+    return {
+        'requests': requests,
+        'errors': errors,
+        'ttft': stats(ttft),
+        'total': stats(totals),
+        'ttft_overhead': stats([value - server.first_token_delay for value in ttft]),
+        'total_overhead': stats([value - expected_total for value in totals])
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк OllamaClient против имитации Ollama")
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--first-token-delay', type=float, default=0.1)
+    parser.add_argument('--tokens-per-second', type=float, default=100.0)
+    parser.add_argument('--response-tokens', type=int, default=60)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--disconnect-rate', type=float, default=0.0)
+    parser.add_argument('--gui', action='store_true', help="дополнительно замерить путь ResponseThread")
+    parser.add_argument('--output', help="файл JSON-отчета (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    server = FakeOllamaServer(
+        first_token_delay=args.first_token_delay,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        failure_rate=args.failure_rate,
+        disconnect_rate=args.disconnect_rate
+    )
+    url = server.start()
+
+    apply_overrides({'ai.ollama_host': url, 'ai.model': server.models[0]})
+    quiet_logging()
+
+    from ai.ollama_client import OllamaClient
+
+    client = OllamaClient()
+    try:
+        settings = {
+            'first_token_delay': args.first_token_delay,
+            'tokens_per_second': args.tokens_per_second,
+            'response_tokens': args.response_tokens,
+            'failure_rate': args.failure_rate,
+            'disconnect_rate': args.disconnect_rate
+        }
+        runs = []
+
+        print("Прогон: OllamaClient", file=sys.stderr)
+        runs.append({'settings': dict(settings, path='client'),
+                     'result': run_client(client, server, args.requests)})
+
+        if args.gui:
+            print("Прогон: ResponseThread", file=sys.stderr)
+            runs.append({'settings': dict(settings, path='gui'),
+                         'result': run_gui_path(client, server, args.requests)})
+
+        runs.append({'settings': {'path': 'server'}, 'result': server.get_stats()})
+        write_report('ollama', runs, args.output)
+
+    finally:
+        client.registry.stop()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
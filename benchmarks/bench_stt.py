@@ -0,0 +1,124 @@
+"""
+Бенчмарк распознавания речи: RTF, задержка, WER, CPU и память для разных размеров блока
+
+    python -m benchmarks.bench_stt --generate-wavs      # один раз: WAV из корпуса через TTS
+    python -m benchmarks.bench_stt --chunk-sizes 2000,4096,8000 --output stt.json
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import (
+    apply_overrides, parse_list, quiet_logging, run_isolated, summarize, timed, write_report
+)
+from benchmarks.corpus import (
+    STT_DATA_DIR, TRANSCRIPTS_FILE, TTS_CORPUS, load_stt_set, resample, word_error_rate, write_wav
+)
+
+
+def generate_wavs(data_dir: str = STT_DATA_DIR, sample_rate: int = 16000) -> int:
+    """Синтезирует корпус в WAV для распознавания (нужна модель TTS)"""
+    quiet_logging()
+    from tts.silero_tts import SileroTTS
+
+    tts = SileroTTS()
+    try:
+        if not tts.wait_ready(timeout=600):
+            print("Модель TTS не загрузилась", file=sys.stderr)
+            return 0
+
+        os.makedirs(data_dir, exist_ok=True)
+        transcripts = {}
+        for index, text in enumerate(TTS_CORPUS):
+            audio = tts.synthesize_audio(text)
+            if audio is None:
+                continue
+            name = f"corpus_{index:02d}.wav"
+            write_wav(os.path.join(data_dir, name), resample(audio, tts.sample_rate, sample_rate), sample_rate)
+            transcripts[name] = text
+
+        with open(os.path.join(data_dir, TRANSCRIPTS_FILE), 'w', encoding='utf-8') as f:
+            json.dump(transcripts, f, indent=4, ensure_ascii=False)
+
+        print(f"Создано файлов: {len(transcripts)} в {data_dir}", file=sys.stderr)
+        return len(transcripts)
+
+    finally:
+        tts.close()
+
+
+def run_setting(overrides: Dict[str, Any], files: Dict[str, str], repeat: int) -> Dict[str, Any]:
+    """Распознает набор файлов с одной настройкой (выполняется в отдельном процессе)"""
+    apply_overrides(overrides)
+    quiet_logging()
+
+    from stt.vosk_stt import VoskSTT
+
+    stt = VoskSTT(init_microphone=False)
+    load_start = time.perf_counter()
+    if not stt.wait_ready(timeout=600):
+        return {'settings': overrides, 'error': 'Модель Vosk не загрузилась'}
+    load_seconds = time.perf_counter() - load_start
+
+    latencies: List[float] = []
+    audio_seconds: List[float] = []
+    errors: List[float] = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    for _ in range(repeat):
+        for path, reference in files.items():
+            with wave.open(path, 'rb') as wf:
+                duration = wf.getnframes() / wf.getframerate()
+
+            text, elapsed = timed(lambda: stt.recognize_file(path))
+            latencies.append(elapsed)
+            audio_seconds.append(duration)
+            if reference:
+                errors.append(word_error_rate(reference, text or ''))
+
+    result = summarize(
+        latencies, audio_seconds,
+        cpu_seconds=time.process_time() - cpu_start,
+        wall_seconds=time.perf_counter() - wall_start
+    )
+    result['load_seconds'] = round(load_seconds, 3)
+    if errors:
+        result['wer'] = round(sum(errors) / len(errors), 4)
+    return {'settings': overrides, 'result': result}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк Vosk STT")
+    parser.add_argument('--data-dir', default=STT_DATA_DIR, help="каталог с WAV и transcripts.json")
+    parser.add_argument('--generate-wavs', action='store_true', help="синтезировать WAV из корпуса и выйти")
+    parser.add_argument('--chunk-sizes', default='4096', help="stt.chunk_size через запятую")
+    parser.add_argument('--repeat', type=int, default=3, help="повторов набора")
+    parser.add_argument('--output', help="файл JSON-отчета (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    if args.generate_wavs:
+        generate_wavs(args.data_dir)
+        return
+
+    files = load_stt_set(args.data_dir)
+    if not files:
+        print(f"Нет WAV в {args.data_dir}. Запустите с --generate-wavs или положите файлы вручную", file=sys.stderr)
+        sys.exit(1)
+
+    runs = []
+    for chunk_size in parse_list(args.chunk_sizes):
+        overrides = {'stt.chunk_size': chunk_size}
+        print(f"Прогон: {overrides}", file=sys.stderr)
+        runs.append(run_isolated(run_setting, overrides, files, args.repeat))
+
+    write_report('stt', runs, args.output)
+
+
+if __name__ == '__main__':
+    main()
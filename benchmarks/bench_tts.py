@@ -0,0 +1,83 @@
+"""
+Бенчмарк синтеза речи: RTF, задержка, CPU и память для разных настроек tts.engine
+
+    python -m benchmarks.bench_tts --workers 1,2 --threads 0,1 --output tts.json
+"""
+
+import sys
+import time
+import argparse
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import (
+    apply_overrides, parse_list, quiet_logging, run_isolated, summarize, timed, write_report
+)
+from benchmarks.corpus import TTS_CORPUS
+
+
+def run_setting(overrides: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """Прогоняет корпус с одной настройкой (выполняется в отдельном процессе)"""
+    # Меряем синтез, а не кэш: без кэша нет и фоновой предзагрузки фраз
+    apply_overrides({**overrides, 'tts.cache_enabled': False})
+    quiet_logging()
+
+    from tts.silero_tts import SileroTTS
+
+    tts = SileroTTS()
+    try:
+        if not tts.wait_ready(timeout=600):
+            return {'settings': overrides, 'error': 'Модель TTS не загрузилась'}
+
+        latencies: List[float] = []
+        audio_seconds: List[float] = []
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+
+        for _ in range(repeat):
+            for text in TTS_CORPUS:
+                audio, elapsed = timed(lambda: tts.synthesize_audio(text))
+                if audio is None:
+                    continue
+                latencies.append(elapsed)
+                audio_seconds.append(len(audio) / tts.sample_rate)
+
+        result = summarize(
+            latencies, audio_seconds,
+            cpu_seconds=time.process_time() - cpu_start,
+            wall_seconds=time.perf_counter() - wall_start
+        )
+        result['load_seconds'] = round(tts.load_time or 0.0, 3)
+        result['engine_report'] = tts.engine_report
+        return {'settings': overrides, 'result': result}
+
+    finally:
+        tts.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк Silero TTS")
+    parser.add_argument('--workers', default='2', help="tts.engine.workers через запятую")
+    parser.add_argument('--threads', default='0', help="tts.engine.threads через запятую (0 - авто)")
+    parser.add_argument('--jit-freeze', action='store_true', help="включить torch.jit.freeze")
+    parser.add_argument('--speed', type=float, default=1.0, help="tts.speed")
+    parser.add_argument('--repeat', type=int, default=3, help="повторов корпуса")
+    parser.add_argument('--output', help="файл JSON-отчета (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for workers in parse_list(args.workers):
+        for threads in parse_list(args.threads):
+            overrides = {
+                'tts.engine.workers': workers,
+                'tts.engine.threads': threads,
+                'tts.engine.jit_freeze': args.jit_freeze,
+                'tts.speed': args.speed
+            }
+            print(f"Прогон: {overrides}", file=sys.stderr)
+            runs.append(run_isolated(run_setting, overrides, args.repeat))
+
+    write_report('tts', runs, args.output)
+
+
+if __name__ == '__main__':
+    main()
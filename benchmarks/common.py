@@ -0,0 +1,117 @@
+"""
+Общие функции бенчмарков: метрики, переопределение конфигурации, отчет в JSON
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# Бенчмарки запускаются из корня проекта: python -m benchmarks.bench_tts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль с линейной интерполяцией"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb() -> float:
+    """Пиковый объем резидентной памяти процесса в МБ"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def summarize(latencies: List[float], audio_seconds: List[float],
+              cpu_seconds: float, wall_seconds: float) -> Dict[str, float]:
+    """Сводка по прогону: RTF, перцентили задержки, загрузка CPU и память"""
+    total_audio = sum(audio_seconds)
+    return {
+        'items': len(latencies),
+        'audio_seconds': round(total_audio, 3),
+        'rtf': round(sum(latencies) / total_audio, 4) if total_audio else None,
+        'latency_p50': round(percentile(latencies, 50), 4),
+        'latency_p95': round(percentile(latencies, 95), 4),
+        'latency_max': round(max(latencies), 4) if latencies else 0.0,
+        'cpu_seconds': round(cpu_seconds, 3),
+        # Среднее число занятых ядер за прогон
+        'cpu_utilization': round(cpu_seconds / wall_seconds, 2) if wall_seconds else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+
+
+def apply_overrides(overrides: Dict[str, Any]) -> None:
+    """Переопределяет значения конфигурации в памяти, не сохраняя файл"""
+    from config.config_manager import config
+
+    for key_path, value in overrides.items():
+        section = config.config
+        keys = key_path.split('.')
+        for key in keys[:-1]:
+            section = section.setdefault(key, {})
+        section[keys[-1]] = value
+
+
+def quiet_logging() -> None:
+    """Оставляет в выводе бенчмарка только предупреждения и ошибки"""
+    import logging
+    from utils.logger import logger
+    logger.setLevel(logging.WARNING)
+
+
+def run_isolated(func: Callable[..., Dict[str, Any]], *args) -> Dict[str, Any]:
+    """
+    Выполняет прогон в отдельном процессе: пиковая память и число потоков
+    torch не переходят от одной настройки к другой
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(func, *args).result()
+
+
+def timed(func: Callable[[], Any]) -> tuple:
+    """Выполняет функцию и возвращает (результат, время в секундах)"""
+    start_time = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start_time
+
+
+def write_report(name: str, runs: List[Dict[str, Any]], output: Optional[str]) -> None:
+    """Пишет отчет в JSON (в файл или stdout)"""
+    report = {
+        'benchmark': name,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count()
+        },
+        'runs': runs
+    }
+
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"Отчет сохранен: {output}")
+    else:
+        print(text)
+
+
+def parse_list(value: str, cast: Callable[[str], Any] = int) -> List[Any]:
+    """Разбирает список значений через запятую"""
+    return [cast(item) for item in value.split(',') if item.strip()]
@@ -0,0 +1,86 @@
+"""
+Фиксированный корпус для бенчмарков синтеза и распознавания речи
+"""
+
+import os
+import re
+import json
+import wave
+import numpy as np
+from typing import Dict, List
+
+# Тексты разной длины: короткие реплики, обычные ответы и длинный абзац
+TTS_CORPUS: List[str] = [
+    "Привет!",
+    "Как дела?",
+    "Сегодня отличный день, чтобы поиграть во что-нибудь новое.",
+    "Я нашла для тебя три игры, которые могут понравиться: стратегию, головоломку и кооперативный шутер.",
+    "Если хочешь, я расскажу про каждую подробнее и помогу выбрать, с какой начать вечер.",
+    "Знаешь, мне кажется, что лучшие истории в играх получаются тогда, когда у игрока есть настоящий выбор. "
+    "Не просто хорошая или плохая концовка, а решения, которые меняют отношения с персонажами, "
+    "открывают новые места и заставляют задуматься. Поэтому я так люблю ролевые игры с нелинейным сюжетом, "
+    "где каждое прохождение немного отличается от предыдущего.",
+]
+
+STT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'stt')
+TRANSCRIPTS_FILE = 'transcripts.json'
+
+
+def load_stt_set(data_dir: str = STT_DATA_DIR) -> Dict[str, str]:
+    """Возвращает {путь к WAV: эталонный текст} (текст пустой, если не задан)"""
+    transcripts: Dict[str, str] = {}
+    try:
+        with open(os.path.join(data_dir, TRANSCRIPTS_FILE), 'r', encoding='utf-8') as f:
+            transcripts = json.load(f)
+    except FileNotFoundError:
+        pass
+
+    files = sorted(name for name in os.listdir(data_dir) if name.endswith('.wav')) if os.path.isdir(data_dir) else []
+    return {os.path.join(data_dir, name): transcripts.get(name, '') for name in files}
+
+
+def resample(audio: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Простая передискретизация (усреднение при целом коэффициенте, иначе линейная интерполяция)"""
+    if source_rate == target_rate:
+        return audio
+    if source_rate % target_rate == 0:
+        factor = source_rate // target_rate
+        usable = len(audio) // factor * factor
+        return audio[:usable].reshape(-1, factor).mean(axis=1)
+    positions = np.arange(0, len(audio), source_rate / target_rate)
+    return np.interp(positions, np.arange(len(audio)), audio)
+
+
+def write_wav(path: str, audio: np.ndarray, sample_rate: int) -> None:
+    """Сохраняет float-аудио как 16-битный моно WAV"""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
+
+
+def normalize_words(text: str) -> List[str]:
+    """Слова в нижнем регистре без пунктуации (ё приравнивается к е)"""
+    return re.findall(r'\w+', text.lower().replace('ё', 'е'))
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """WER: расстояние Левенштейна по словам, деленное на число слов эталона"""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / len(ref)
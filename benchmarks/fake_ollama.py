@@ -0,0 +1,293 @@
+"""
+Локальная замена сервера Ollama для бенчмарков и нагрузочных тестов.
+Отдает /api/tags и потоковые /api/chat и /api/generate в формате Ollama
+с настраиваемой задержкой первого токена, скоростью и внедрением ошибок
+
+    python -m benchmarks.fake_ollama --port 11435 --first-token-delay 0.3 --tokens-per-second 40
+"""
+
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# Текст ответа: повторяется по кругу, пока не наберется нужное число токенов
+RESPONSE_WORDS = (
+    "Конечно! Давай разберемся вместе. Сначала стоит посмотреть на общую картину, "
+    "а потом перейти к деталям. Мне кажется, самое интересное здесь - это то, "
+    "как все части связаны между собой."
+).split()
+
+
+class FakeOllamaServer:
+    """HTTP-сервер, имитирующий API Ollama"""
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 models: Optional[List[str]] = None,
+                 first_token_delay: float = 0.2,
+                 tokens_per_second: float = 50.0,
+                 response_tokens: int = 60,
+                 failure_rate: float = 0.0,
+                 disconnect_rate: float = 0.0,
+                 seed: Optional[int] = 0):
+        self.models = models or ['fake:latest']
+        self.first_token_delay = first_token_delay
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+
+        # Доля запросов с ответом 500 и доля потоков, обрываемых на середине
+        self.failure_rate = failure_rate
+        self.disconnect_rate = disconnect_rate
+        self.random = random.Random(seed)
+
+        self.requests = 0
+        self.failures = 0
+        self.disconnects = 0
+        self._lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """Запускает сервер в фоновом потоке и возвращает его адрес"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        """Останавливает сервер"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'disconnects': self.disconnects
+        }
+
+    def _roll(self, rate: float) -> bool:
+        """Случайное событие с заданной вероятностью (детерминировано seed)"""
+        with self._lock:
+            return rate > 0 and self.random.random() < rate
+
+    def _tokens(self, count: int) -> List[str]:
+        """Токены ответа: слова с ведущим пробелом, как у настоящих моделей"""
+        return [
+            (' ' if i else '') + RESPONSE_WORDS[i % len(RESPONSE_WORDS)]
+            for i in range(count)
+        ]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Чанки отправляются сразу, без задержки Нейгла
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                # Журнал запросов не нужен: он искажает замеры
+                pass
+
+            def do_GET(self):
+                if self.path in ('/api/tags', '/api/tags/'):
+                    self._send_json(200, {'models': [
+                        {
+                            'name': name,
+                            'model': name,
+                            'modified_at': '2024-01-01T00:00:00Z',
+                            'size': 0,
+                            'digest': '0' * 64,
+                            'details': {'format': 'gguf', 'family': 'fake'}
+                        }
+                        for name in server.models
+                    ]})
+                elif self.path in ('/api/version', '/'):
+                    self._send_json(200, {'version': '0.0.0-fake'})
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except json.JSONDecodeError:
+                    self._send_json(400, {'error': 'invalid json'})
+                    return
+
+                with server._lock:
+                    server.requests += 1
+
+                if self.path not in ('/api/chat', '/api/generate'):
+                    self._send_json(404, {'error': 'not found'})
+                    return
+
+                if body.get('model') not in server.models:
+                    self._send_json(404, {'error': f"model '{body.get('model')}' not found"})
+                    return
+
+                if server._roll(server.failure_rate):
+                    with server._lock:
+                        server.failures += 1
+                    self._send_json(500, {'error': 'injected failure'})
+                    return
+
+                self._generate(body, chat=self.path == '/api/chat')
+
+            def _generate(self, body: Dict[str, Any], chat: bool) -> None:
+                options = body.get('options') or {}
+                count = options.get('num_predict') or server.response_tokens
+                if count < 0:
+                    count = server.response_tokens
+                tokens = server._tokens(count)
+
+                if chat:
+                    prompt = ''.join(message.get('content', '') for message in body.get('messages', []))
+                else:
+                    prompt = body.get('prompt', '')
+
+                start = time.perf_counter()
+                # Имитация обработки промпта
+                time.sleep(server.first_token_delay)
+                prompt_done = time.perf_counter()
+
+                interval = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+                disconnect_at = self._disconnect_point(count)
+
+                if not body.get('stream', True):
+                    time.sleep(interval * count)
+                    payload = self._final(body, chat, prompt, count, start, prompt_done)
+                    payload.update(self._content(chat, ''.join(tokens)))
+                    self._send_json(200, payload)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                try:
+                    for index, token in enumerate(tokens):
+                        if index:
+                            time.sleep(interval)
+                        if index == disconnect_at:
+                            with server._lock:
+                                server.disconnects += 1
+                            # Обрыв соединения без завершающего чанка
+                            self.close_connection = True
+                            return
+                        chunk = {
+                            'model': body.get('model'),
+                            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                            'done': False
+                        }
+                        chunk.update(self._content(chat, token))
+                        self._write_chunk(chunk)
+
+                    final = self._final(body, chat, prompt, count, start, prompt_done)
+                    final.update(self._content(chat, ''))
+                    self._write_chunk(final)
+                    self.wfile.write(b'0\r\n\r\n')
+                    self.wfile.flush()
+
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент закрыл поток (отмена генерации)
+                    self.close_connection = True
+
+            def _disconnect_point(self, count: int) -> Optional[int]:
+                if count > 1 and server._roll(server.disconnect_rate):
+                    return count // 2
+                return None
+
+            @staticmethod
+            def _content(chat: bool, text: str) -> Dict[str, Any]:
+                if chat:
+                    return {'message': {'role': 'assistant', 'content': text}}
+                return {'response': text}
+
+            @staticmethod
+            def _final(body: Dict[str, Any], chat: bool, prompt: str, count: int,
+                       start: float, prompt_done: float) -> Dict[str, Any]:
+                now = time.perf_counter()
+                return {
+                    'model': body.get('model'),
+                    'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    'done': True,
+                    'done_reason': 'stop',
+                    'total_duration': int((now - start) * 1e9),
+                    'load_duration': 0,
+                    'prompt_eval_count': max(1, len(prompt) // 4),
+                    'prompt_eval_duration': int((prompt_done - start) * 1e9),
+                    'eval_count': count,
+                    'eval_duration': int((now - prompt_done) * 1e9)
+                }
+
+            def _write_chunk(self, payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n'
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+
+            def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Имитация сервера Ollama")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--models', default='fake:latest', help="имена моделей через запятую")
+    parser.add_argument('--first-token-delay', type=float, default=0.2, help="секунды до первого токена")
+    parser.add_argument('--tokens-per-second', type=float, default=50.0)
+    parser.add_argument('--response-tokens', type=int, default=60)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="доля запросов с ошибкой 500")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help="доля потоков, обрываемых на середине")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = FakeOllamaServer(
+        host=args.host,
+        port=args.port,
+        models=[name for name in args.models.split(',') if name],
+        first_token_delay=args.first_token_delay,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        failure_rate=args.failure_rate,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed
+    )
+    print(f"Имитация Ollama запущена: {server.url}", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Статистика: {server.get_stats()}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
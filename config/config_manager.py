@@ -1,18 +1,28 @@
 """
-Менеджер конфигурации для приложения Sakura AI
+Менеджер конфигурации для приложения Sakura AI.
+Изменения применяются в памяти сразу, а файл переписывается в фоне:
+несколько изменений подряд сливаются в одну атомарную запись
 """
 
 import os
+import copy
 import json
+import time
 import yaml
-from typing import Any, Dict, Optional
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
 from .default_config import DEFAULT_CONFIG
 
 
 class ConfigManager:
     """Менеджер конфигурации с поддержкой JSON и YAML"""
 
-    def __init__(self, config_file: str = "config.json"):
+    def __init__(self, config_file: str = "config.json",
+                 save_delay: float = 1.0,
+                 max_save_delay: float = 5.0):
         # ИСПРАВЛЕНИЕ: Создаем абсолютный путь к файлу конфигурации
         if not os.path.isabs(config_file):
             # Если путь относительный, создаем его в папке приложения
@@ -21,9 +31,24 @@ class ConfigManager:
         else:
             self.config_file = config_file
 
-        self.config = DEFAULT_CONFIG.copy()
+        # Отложенная запись: пауза после последнего изменения и предельная задержка
+        self.save_delay = save_delay
+        self.max_save_delay = max_save_delay
+
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._dirty = False
+        self._dirty_since = 0.0
+        self._save_due = 0.0
+        self._batch_depth = 0
+
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
         self.load_config()
 
+        # Несохраненные изменения дописываются при выходе
+        atexit.register(self.flush)
+
     def load_config(self) -> None:
         """Загружает конфигурацию из файла"""
         if not os.path.exists(self.config_file):
@@ -49,23 +74,48 @@ class ConfigManager:
             print("Используется конфигурация по умолчанию")
 
     def save_config(self) -> None:
-        """Сохраняет конфигурацию в файл"""
+        """Сохраняет конфигурацию в файл немедленно (атомарно: временный файл + замена)"""
+        temp_file = None
         try:
             # ИСПРАВЛЕНИЕ: Проверяем и создаем директорию только если она не пустая
             config_dir = os.path.dirname(self.config_file)
             if config_dir:  # Проверка, что директория не пустая
                 os.makedirs(config_dir, exist_ok=True)
 
-            # Сохраняем файл
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                if self.config_file.endswith('.yaml') or self.config_file.endswith('.yml'):
-                    yaml.dump(self.config, f, default_flow_style=False, allow_unicode=True)
-                else:
-                    json.dump(self.config, f, indent=4, ensure_ascii=False)
+            with self._save_lock:
+                # Снимок берется под блокировкой записи: более старый снимок
+                # не может перезаписать более новый
+                with self._lock:
+                    self._cancel_timer()
+                    snapshot = copy.deepcopy(self.config)
+                    self._dirty = False
+
+                # Пишем во временный файл рядом и подменяем им старый:
+                # при сбое на диске остается либо старая, либо новая версия целиком
+                fd, temp_file = tempfile.mkstemp(
+                    dir=config_dir or None,
+                    prefix=os.path.basename(self.config_file) + '.',
+                    suffix='.tmp'
+                )
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    if self.config_file.endswith('.yaml') or self.config_file.endswith('.yml'):
+                        yaml.dump(snapshot, f, default_flow_style=False, allow_unicode=True)
+                    else:
+                        json.dump(snapshot, f, indent=4, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                mode = os.stat(self.config_file).st_mode & 0o777 if os.path.exists(self.config_file) else 0o644
+                os.chmod(temp_file, mode)
+                os.replace(temp_file, self.config_file)
+                temp_file = None
 
             print(f"Конфигурация сохранена в: {self.config_file}")
 
         except Exception as e:
+            with self._lock:
+                self._dirty = True
+            if temp_file and os.path.exists(temp_file):
+                os.remove(temp_file)
             print(f"Ошибка сохранения конфигурации: {e}")
             print(f"Путь к файлу: '{self.config_file}'")
             print(f"Директория: '{os.path.dirname(self.config_file)}'")
@@ -91,15 +141,82 @@ class ConfigManager:
         keys = key_path.split('.')
         config = self.config
 
-        # Переходим к предпоследнему уровню
-        for key in keys[:-1]:
-            if key not in config:
-                config[key] = {}
-            config = config[key]
+        with self._lock:
+            # Переходим к предпоследнему уровню
+            for key in keys[:-1]:
+                if key not in config:
+                    config[key] = {}
+                config = config[key]
+
+            # Устанавливаем значение
+            config[keys[-1]] = value
+            self._schedule_save()
+
+    @contextmanager
+    def batch(self) -> Iterator['ConfigManager']:
+        """
+        Группирует изменения: файл сохраняется один раз после выхода из блока
+        (with config.batch(): config.set(...); config.set(...))
+        """
+        with self._lock:
+            self._batch_depth += 1
+            self._cancel_timer()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0 and self._dirty:
+                    self._schedule_save()
+
+    def flush(self) -> None:
+        """Немедленно сохраняет отложенные изменения"""
+        with self._lock:
+            dirty = self._dirty
+            self._cancel_timer()
+        if dirty:
+            self.save_config()
+
+    def has_pending_changes(self) -> bool:
+        """Есть ли изменения, еще не записанные в файл"""
+        return self._dirty
+
+    def _schedule_save(self) -> None:
+        """Отмечает конфигурацию измененной и откладывает запись файла"""
+        with self._lock:
+            now = time.monotonic()
+            if not self._dirty:
+                self._dirty = True
+                self._dirty_since = now
+
+            if self._batch_depth > 0:
+                return
+
+            # Каждое изменение сдвигает запись, но не дальше предельной задержки
+            self._save_due = min(now + self.save_delay, self._dirty_since + self.max_save_delay)
+            if self._timer is None:
+                self._start_timer(self._save_due - now)
+
+    def _start_timer(self, delay: float) -> None:
+        self._timer = threading.Timer(max(0.0, delay), self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        """Срабатывание таймера: сохраняем или дожидаемся сдвинутого срока"""
+        with self._lock:
+            if self._timer is None or self._batch_depth > 0:
+                return
+            remaining = self._save_due - time.monotonic()
+            if remaining > 0:
+                self._start_timer(remaining)
+                return
+        self.flush()
 
-        # Устанавливаем значение
-        config[keys[-1]] = value
-        self.save_config()
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
 
     def _deep_update(self, base_dict: Dict, update_dict: Dict) -> None:
         """Рекурсивно обновляет словарь"""
@@ -111,8 +228,9 @@ class ConfigManager:
 
     def reset_to_default(self) -> None:
         """Сбрасывает конфигурацию к значениям по умолчанию"""
-        self.config = DEFAULT_CONFIG.copy()
-        self.save_config()
+        with self._lock:
+            self.config = copy.deepcopy(DEFAULT_CONFIG)
+            self._schedule_save()
 
     def get_section(self, section: str) -> Dict:
         """Получает целую секцию конфигурации"""
@@ -120,11 +238,12 @@ class ConfigManager:
 
     def update_section(self, section: str, updates: Dict) -> None:
         """Обновляет секцию конфигурации"""
-        if section not in self.config:
-            self.config[section] = {}
+        with self._lock:
+            if section not in self.config:
+                self.config[section] = {}
 
-        self.config[section].update(updates)
-        self.save_config()
+            self.config[section].update(updates)
+            self._schedule_save()
 
     def get_config_file_path(self) -> str:
         """Возвращает путь к файлу конфигурации"""
@@ -132,6 +251,7 @@ class ConfigManager:
 
     def create_backup(self) -> bool:
         """Создает резервную копию конфигурации"""
+        self.flush()
         try:
             if os.path.exists(self.config_file):
                 backup_file = self.config_file + '.backup'
@@ -9,7 +9,12 @@ DEFAULT_CONFIG = {
         "ollama_host": "http://localhost:11434",
         "timeout": 30,
         "temperature": 0.7,
-        "max_tokens": 1024
+        "max_tokens": 1024,
+        "response_reserve": 256,  # токены контекста, оставляемые под ответ модели
+        "history_trim_ratio": 0.75,  # до какой доли бюджета обрезать историю при переполнении
+        "keep_alive": "30m",  # время удержания модели в памяти Ollama
+        "models_cache_ttl": 60,  # секунды жизни кэша списка моделей
+        "health_check_interval": 30  # период фоновой проверки сервера, секунды
     },
     
     # TTS настройки (Silero)
@@ -20,7 +25,31 @@ DEFAULT_CONFIG = {
         "sample_rate": 48000,
         "device": "cpu",
         "volume": 0.8,
-        "speed": 1.0
+        "speed": 1.0,
+        "models_dir": "models/silero",  # локальные .pt пакеты моделей
+        "auto_download": True,  # скачать пакет, если его нет локально
+        "model_url": "",  # адрес пакета для моделей не из встроенного списка
+        "model_sha256": "",  # закрепленная контрольная сумма пакета
+        "allow_hub_fallback": True,  # использовать torch.hub, если локальная загрузка не удалась
+        "cache_enabled": True,  # кэш синтезированных фраз
+        "cache_dir": "cache/tts",
+        "cache_max_mb": 200,  # ограничение размера кэша на диске
+        "cache_memory_items": 64,  # фраз в памяти (LRU)
+        "cache_dtype": "int16",  # формат хранения: int16 или float32
+        "cache_max_text_length": 200,  # более длинные тексты не кэшируются
+        "prefetch_phrases": [],  # фразы, синтезируемые в кэш после загрузки модели
+        "player_buffer_seconds": 30,  # размер кольцевого буфера вывода
+        "player_blocksize": 0,  # кадров на callback (0 - выбирает драйвер)
+        "player_latency": "low",  # задержка аудиоустройства: low, high или секунды
+        "max_chunk_chars": 500,  # длинный текст синтезируется фрагментами не длиннее этого
+        "engine": {
+            "threads": 0,  # потоков torch (0 - ядра делятся поровну между воркерами)
+            "workers": 2,  # фрагментов, синтезируемых параллельно
+            "inference_mode": True,  # torch.inference_mode вместо no_grad
+            "jit_freeze": False,  # torch.jit.freeze для TorchScript-модели
+            "warmup": True,  # прогрев при загрузке с замером RTF до и после
+            "warmup_text": "Привет! Проверка синтеза речи."
+        }
     },
     
     # STT настройки (Vosk)
@@ -30,7 +59,10 @@ DEFAULT_CONFIG = {
         "sample_rate": 16000,
         "channels": 1,
         "chunk_size": 4096,
-        "auto_download": True
+        "auto_download": True,
+        "queue_size": 50,  # блоков аудио в очереди распознавания (при переполнении старые отбрасываются)
+        "vad_enabled": False,  # передавать в Vosk только участки с речью
+        "vad_pre_roll": 0.5  # секунды аудио до начала речи, которые тоже отправляются в Vosk
     },
     
     # Аудио настройки
@@ -49,7 +81,9 @@ DEFAULT_CONFIG = {
         "window_size": [800, 600],
         "window_position": [100, 100],
         "always_on_top": False,
-        "minimize_to_tray": True
+        "minimize_to_tray": True,
+        "chat_max_messages": 20000,  # сообщений в окне чата, старые удаляются
+        "update_interval_ms": 16  # не чаще одного обновления текста и прокрутки за этот интервал
     },
     
     # Персонаж
@@ -64,6 +98,22 @@ DEFAULT_CONFIG = {
         "level": "INFO",
         "file": "logs/sakura_ai.log",
         "max_size": "10MB",
-        "backups": 5
+        "backups": 5,
+        "queue_size": 10000  # записей в очереди фоновой записи лога (при переполнении отбрасываются)
+    },
+    
+    # Трассировка задержек ходов разговора (STT → LLM → TTS)
+    "tracing": {
+        "enabled": True,
+        "file": "logs/trace.jsonl"  # журнал ходов в формате JSON Lines
+    },
+    
+    # Постоянная история чата (SQLite)
+    "history": {
+        "enabled": True,
+        "db_file": "data/chat_history.db",
+        "page_size": 100,  # сообщений на страницу при прокрутке вверх
+        "batch_size": 100,  # максимум сообщений в одной транзакции записи
+        "flush_interval": 0.5  # секунды накопления пачки перед записью
     }
 }
@@ -0,0 +1,145 @@
+"""
+Мост событий между фоновыми движками (STT, TTS, Ollama) и GUI.
+Движки вызывают методы post_* из любых потоков и не ждут интерфейс:
+события доставляются в поток GUI сигналами через очередь событий Qt
+"""
+
+import time
+import itertools
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from PyQt5.QtCore import QObject, pyqtSignal, Qt
+
+
+class EventBridge(QObject):
+    """
+    Сигналы событий движков с порядковыми номерами (seq).
+
+    Частичные результаты распознавания не накапливаются в очереди: хранится
+    только последний, а более старые недоставленные отбрасываются. Частичный
+    результат, устаревший относительно уже отправленного финального, тоже
+    отбрасывается. Остальные события доставляются все и по порядку
+    """
+
+    # Распознавание речи: seq, текст
+    stt_partial = pyqtSignal(int, str)
+    stt_final = pyqtSignal(int, str)
+    stt_error = pyqtSignal(int, str)
+
+    # Готовность движка после загрузки модели: имя ("stt", "tts"), доступность
+    component_ready = pyqtSignal(str, bool)
+
+    # Озвучивание: seq, id высказывания (и признак отмены для окончания)
+    speech_started = pyqtSignal(int, int)
+    speech_finished = pyqtSignal(int, int, bool)
+    tts_error = pyqtSignal(int, str)
+
+    # Доступность Ollama и список моделей
+    ai_status = pyqtSignal(bool, list)
+
+    # Завершенный ход разговора с замерами этапов
+    trace = pyqtSignal(dict)
+
+    # Внутренний сигнал: появился новый частичный результат
+    _partial_posted = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self._latest_partial: Optional[Tuple[int, str]] = None
+        self._partial_scheduled = False
+        self._last_final_seq = 0
+
+        # Доставка в слот моста всегда через очередь, даже из потока GUI
+        self._partial_posted.connect(self._deliver_partial, Qt.QueuedConnection)
+
+        self.posted: Dict[str, int] = {}
+        self.dropped_partials = 0
+        self.stale_partials = 0
+        self.partial_latency_max = 0.0
+        self._partial_posted_at = 0.0
+
+    # --- Методы для фоновых потоков ---
+
+    def post_stt_partial(self, text: str) -> None:
+        """Частичный результат распознавания (более старый недоставленный заменяется)"""
+        seq = self._count('stt_partial')
+        with self._lock:
+            if self._latest_partial is not None:
+                self.dropped_partials += 1
+            self._latest_partial = (seq, text)
+            self._partial_posted_at = time.monotonic()
+            if self._partial_scheduled:
+                return
+            self._partial_scheduled = True
+        self._partial_posted.emit()
+
+    def post_stt_final(self, text: str) -> None:
+        """Финальный результат распознавания"""
+        seq = self._count('stt_final')
+        with self._lock:
+            self._last_final_seq = seq
+        self.stt_final.emit(seq, text)
+
+    def post_stt_error(self, message: str) -> None:
+        self.stt_error.emit(self._count('stt_error'), message)
+
+    def post_component_ready(self, name: str, available: bool) -> None:
+        self._count('component_ready')
+        self.component_ready.emit(name, available)
+
+    def post_speech_started(self, utt_id: int) -> None:
+        self.speech_started.emit(self._count('speech_started'), utt_id)
+
+    def post_speech_finished(self, utt_id: int, cancelled: bool) -> None:
+        self.speech_finished.emit(self._count('speech_finished'), utt_id, cancelled)
+
+    def post_tts_error(self, message: str) -> None:
+        self.tts_error.emit(self._count('tts_error'), message)
+
+    def post_ai_status(self, available: bool, models: List[str]) -> None:
+        self._count('ai_status')
+        self.ai_status.emit(available, list(models))
+
+    def post_trace(self, record: Dict[str, Any]) -> None:
+        self._count('trace')
+        self.trace.emit(record)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики событий"""
+        return {
+            'posted': dict(self.posted),
+            'dropped_partials': self.dropped_partials,
+            'stale_partials': self.stale_partials,
+            'partial_latency_max_ms': round(self.partial_latency_max * 1000, 2)
+        }
+
+    # --- Поток GUI ---
+
+    def _deliver_partial(self) -> None:
+        """Доставляет последний частичный результат (выполняется в потоке GUI)"""
+        with self._lock:
+            latest = self._latest_partial
+            self._latest_partial = None
+            self._partial_scheduled = False
+            last_final_seq = self._last_final_seq
+            latency = time.monotonic() - self._partial_posted_at
+
+        if latest is None:
+            return
+        seq, text = latest
+        # Частичный результат фразы, для которой уже пришел финальный
+        if seq < last_final_seq:
+            self.stale_partials += 1
+            return
+
+        self.partial_latency_max = max(self.partial_latency_max, latency)
+        self.stt_partial.emit(seq, text)
+
+    def _count(self, name: str) -> int:
+        seq = next(self._seq)
+        with self._lock:
+            self.posted[name] = self.posted.get(name, 0) + 1
+        return seq
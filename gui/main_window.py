@@ -4,6 +4,7 @@
 
 import sys
 import asyncio
+import threading
 from typing import Optional
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
@@ -15,16 +16,23 @@ from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QSize
 from PyQt5.QtGui import QFont, QIcon, QPixmap
 
 from .settings_dialog import SettingsDialog
-from .widgets.chat_widget import ChatWidget
-from ai.ollama_client import OllamaClient
+from .widgets.chat_widget import ChatWidget, ChatMessage
+from .update_coalescer import UpdateCoalescer
+from .event_bridge import EventBridge
+from ai.ollama_client import OllamaClient, INTERRUPTED_SUFFIX
+from ai.personality import personality_manager
 from tts.silero_tts import SileroTTS
+from tts.speech_pipeline import SpeechPipeline
 from stt.vosk_stt import VoskSTT
 from config.config_manager import config
 from utils.logger import logger
+from utils.tracing import tracer
+from storage.chat_history import ChatHistoryStore
 
 
 class ResponseThread(QThread):
-    """Поток для генерации ответов ИИ"""
+    """Поток для потоковой генерации ответов ИИ"""
+    token_received = pyqtSignal(str)
     response_ready = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     
@@ -32,13 +40,27 @@ class ResponseThread(QThread):
         super().__init__()
         self.ollama_client = ollama_client
         self.user_input = user_input
+        self.cancel_event = threading.Event()
+    
+    def cancel(self):
+        """Прерывает генерацию (поток завершится на следующем токене)"""
+        self.cancel_event.set()
+    
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
     
     def run(self):
         try:
-            response = self.ollama_client.generate_response(self.user_input)
-            self.response_ready.emit(response)
+            parts = []
+            for token in self.ollama_client.generate_response_stream(self.user_input, self.cancel_event):
+                parts.append(token)
+                self.token_received.emit(token)
+            
+            if not self.is_cancelled():
+                self.response_ready.emit(''.join(parts))
         except Exception as e:
-            self.error_occurred.emit(str(e))
+            if not self.is_cancelled():
+                self.error_occurred.emit(str(e))
 
 
 class MainWindow(QMainWindow):
@@ -49,19 +71,43 @@ class MainWindow(QMainWindow):
         
         # Инициализация компонентов
         self.ollama_client = OllamaClient()
+        
+        # Настроение персонажа передается отдельно от статичного системного промпта
+        personality_manager.load_personality_state()
+        self.ollama_client.state_prompt_provider = personality_manager.get_state_prompt
+        
         self.tts = SileroTTS()
         self.stt = VoskSTT()
+        self.history_store = self.open_history_store()
+        
+        # События движков приходят из их потоков и доставляются в поток GUI через мост
+        self.events = EventBridge(self)
         
         # Состояние приложения
         self.is_listening = False
         self.is_muted = False
         self.current_response_thread: Optional[ResponseThread] = None
+        self.streaming_message: Optional[ChatMessage] = None
+        self.speech_pipeline: Optional[SpeechPipeline] = None
+        self.current_turn = None
+        self.speaking_utterance: Optional[int] = None
+        self.ready_announced = False
+        
+        # Прерванные потоки держим до завершения, иначе QThread уничтожится на ходу
+        self.cancelled_threads = []
+        
+        # Частые обновления (статус, токены, прокрутка) применяются раз за кадр
+        self.ui_updates = UpdateCoalescer(config.get('gui.update_interval_ms', 16), self)
         
         # Настройка окна
         self.setup_ui()
         self.setup_connections()
         self.setup_system_tray()
         self.load_settings()
+        self.restore_history()
+        
+        # Загружаем модель в память Ollama заранее, чтобы первый ответ не ждал загрузки
+        threading.Thread(target=self.ollama_client.preload, daemon=True).start()
         
         # Проверка готовности компонентов
         QTimer.singleShot(1000, self.check_components)
@@ -81,7 +127,7 @@ class MainWindow(QMainWindow):
         main_layout = QVBoxLayout(central_widget)
         
         # Виджет чата
-        self.chat_widget = ChatWidget()
+        self.chat_widget = ChatWidget(self.ui_updates)
         main_layout.addWidget(self.chat_widget)
         
         # Панель ввода
@@ -140,6 +186,22 @@ class MainWindow(QMainWindow):
         """)
         control_layout.addWidget(self.mic_button)
         
+        # Кнопка остановки ответа
+        self.stop_button = QPushButton("⏹ Стоп")
+        self.stop_button.setMinimumSize(100, 35)
+        self.stop_button.setStyleSheet("""
+            QPushButton {
+                background-color: #795548;
+                color: white;
+                border: none;
+                border-radius: 5px;
+            }
+            QPushButton:hover {
+                background-color: #5D4037;
+            }
+        """)
+        control_layout.addWidget(self.stop_button)
+        
         # Кнопка заглушения
         self.mute_button = QPushButton("🔊 Звук")
         self.mute_button.setMinimumSize(100, 35)
@@ -197,9 +259,17 @@ class MainWindow(QMainWindow):
         self.setStatusBar(self.status_bar)
         
         # Индикатор состояния
-        self.status_label = QLabel("Готов")
+        self.status_label = QLabel("Готов")  # меняется через set_status
         self.status_bar.addWidget(self.status_label)
         
+        # Доступность ИИ (обновляется фоновой проверкой Ollama)
+        self.ai_status_label = QLabel("")
+        self.status_bar.addPermanentWidget(self.ai_status_label)
+        
+        # Задержки последнего хода (подробности во всплывающей подсказке)
+        self.trace_label = QLabel("")
+        self.status_bar.addPermanentWidget(self.trace_label)
+        
         # Прогресс бар
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
@@ -218,6 +288,11 @@ class MainWindow(QMainWindow):
         export_action = QAction("Экспорт чата", self)
         file_menu.addAction(export_action)
         
+        search_action = QAction("Поиск по истории", self)
+        search_action.setShortcut("Ctrl+F")
+        search_action.triggered.connect(self.chat_widget.show_search)
+        file_menu.addAction(search_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction("Выход", self)
@@ -246,15 +321,42 @@ class MainWindow(QMainWindow):
         # Кнопки
         self.send_button.clicked.connect(self.send_message)
         self.mic_button.clicked.connect(self.toggle_listening)
+        self.stop_button.clicked.connect(self.stop_response)
         self.mute_button.clicked.connect(self.toggle_mute)
         self.clear_button.clicked.connect(self.clear_history)
         self.settings_button.clicked.connect(self.show_settings)
         
+        # Слоты выполняются в потоке GUI, движки только публикуют события в мост
+        self.events.ai_status.connect(self.on_ai_status_changed)
+        self.events.trace.connect(self.on_trace_ready)
+        self.events.stt_partial.connect(self.on_partial_speech)
+        self.events.stt_final.connect(self.on_final_speech)
+        self.events.stt_error.connect(self.on_speech_error)
+        self.events.component_ready.connect(self.on_component_ready)
+        self.events.speech_started.connect(self.on_tts_started)
+        self.events.speech_finished.connect(self.on_tts_finished)
+        self.events.tts_error.connect(self.on_tts_error)
+        
+        # Уведомления о доступности Ollama
+        self.ollama_client.registry.add_listener(self.events.post_ai_status)
+        
+        # Замеры задержек ходов разговора
+        tracer.add_listener(self.events.post_trace)
+        
         # STT callbacks
         self.stt.set_callbacks(
-            on_partial=self.on_partial_speech,
-            on_final=self.on_final_speech,
-            on_error=self.on_speech_error
+            on_partial=self.events.post_stt_partial,
+            on_final=self.events.post_stt_final,
+            on_error=self.events.post_stt_error,
+            on_ready=lambda available: self.events.post_component_ready('stt', available)
+        )
+        
+        # TTS callbacks
+        self.tts.set_callbacks(
+            on_ready=lambda available: self.events.post_component_ready('tts', available),
+            on_speech_started=self.events.post_speech_started,
+            on_speech_finished=self.events.post_speech_finished,
+            on_error=self.events.post_tts_error
         )
     
     def setup_system_tray(self):
@@ -276,6 +378,42 @@ class MainWindow(QMainWindow):
             self.tray_icon.setContextMenu(tray_menu)
             self.tray_icon.activated.connect(self.on_tray_activated)
     
+    def open_history_store(self) -> Optional[ChatHistoryStore]:
+        """Открывает постоянную историю чата"""
+        if not config.get('history.enabled', True):
+            return None
+        try:
+            return ChatHistoryStore(
+                config.get('history.db_file', 'data/chat_history.db'),
+                batch_size=config.get('history.batch_size', 100),
+                flush_interval=config.get('history.flush_interval', 0.5)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка открытия истории чата: {e}")
+            return None
+    
+    def restore_history(self):
+        """Показывает последнюю страницу истории и восстанавливает контекст модели"""
+        if self.history_store is None:
+            return
+        try:
+            self.chat_widget.set_history_store(self.history_store, config.get('history.page_size', 100))
+            self.ollama_client.restore_history(
+                self.history_store.load_context(config.get('personality.conversation_memory', 50))
+            )
+        except Exception as e:
+            logger.error(f"Ошибка восстановления истории чата: {e}")
+    
+    def store_message(self, role: str, chat_message: ChatMessage, content: Optional[str] = None):
+        """Сохраняет сообщение в постоянную историю (запись идет в фоне)"""
+        if self.history_store is None:
+            return
+        record = self.history_store.append(
+            role, content if content is not None else chat_message.message,
+            chat_message.timestamp.timestamp()
+        )
+        chat_message.record_id = record.id
+    
     def load_settings(self):
         """Загрузка настроек"""
         # Размер и позиция окна
@@ -337,12 +475,31 @@ class MainWindow(QMainWindow):
             status_parts.append("STT ✗")
         
         status_text = " | ".join(status_parts)
-        self.status_label.setText(status_text)
+        self.set_status(status_text)
         
         # Если все компоненты готовы
-        if all("✓" in part for part in status_parts):
+        if all("✓" in part for part in status_parts) and not self.ready_announced:
+            self.ready_announced = True
             self.chat_widget.add_system_message("Сакура готова к общению! 🌸")
     
+    def on_component_ready(self, name: str, available: bool):
+        """Движок закончил загрузку модели"""
+        logger.info(f"Компонент {name} {'готов' if available else 'недоступен'}")
+        self.check_components()
+    
+    def set_status(self, text: str):
+        """Текст строки состояния; при частых изменениях показывается последний за кадр"""
+        self.ui_updates.set_value('status', self.status_label.setText, text)
+    
+    def on_ai_status_changed(self, available: bool, models: list):
+        """Обработка изменения доступности Ollama"""
+        if self.ollama_client.model in models:
+            self.ai_status_label.setText("AI ✓")
+        elif available:
+            self.ai_status_label.setText("AI: модель не найдена")
+        else:
+            self.ai_status_label.setText("AI ✗")
+    
     def send_message(self):
         """Отправка сообщения"""
         text = self.input_field.text().strip()
@@ -353,7 +510,8 @@ class MainWindow(QMainWindow):
         self.input_field.clear()
         
         # Добавление сообщения пользователя
-        self.chat_widget.add_user_message(text)
+        chat_message = self.chat_widget.add_user_message(text)
+        self.store_message('user', chat_message)
         
         # Отправка запроса ИИ
         self.process_user_input(text)
@@ -364,39 +522,139 @@ class MainWindow(QMainWindow):
             self.chat_widget.add_error_message("ИИ недоступен")
             return
         
+        # Новое сообщение прерывает текущий ответ, чтобы не ждать устаревшую генерацию
+        self.cancel_response()
+        self.current_turn = tracer.claim_turn()
+        
         # Показать прогресс
         self.progress_bar.setVisible(True)
-        self.status_label.setText("Сакура думает...")
+        self.set_status("Сакура думает...")
         
         # Запуск потока генерации ответа
+        self.streaming_message = None
         self.current_response_thread = ResponseThread(self.ollama_client, text)
+        self.current_response_thread.token_received.connect(self.on_response_token)
         self.current_response_thread.response_ready.connect(self.on_response_ready)
         self.current_response_thread.error_occurred.connect(self.on_response_error)
         self.current_response_thread.start()
     
+    def cancel_response(self) -> bool:
+        """Прерывает текущую генерацию и озвучивание; возвращает True, если было что прерывать"""
+        thread = self.current_response_thread
+        had_activity = thread is not None or self.speech_pipeline is not None
+        
+        if thread is not None:
+            thread.cancel()
+            
+            # Токены прерванного потока, уже стоящие в очереди событий, игнорируем
+            thread.token_received.disconnect()
+            thread.response_ready.disconnect()
+            thread.error_occurred.disconnect()
+            
+            if thread.isRunning():
+                self.cancelled_threads.append(thread)
+                thread.finished.connect(lambda: self.cancelled_threads.remove(thread))
+            self.current_response_thread = None
+            
+            logger.info("Генерация ответа прервана")
+        
+        if self.streaming_message is not None:
+            # Недоговоренный ответ сохраняется с пометкой, как и в контексте модели
+            self.chat_widget.append_to_message(self.streaming_message, INTERRUPTED_SUFFIX)
+            self.store_message('assistant', self.streaming_message)
+            self.streaming_message = None
+        
+        if self.speech_pipeline is not None:
+            self.speech_pipeline = None
+        self.tts.stop()
+        
+        tracer.finish_turn(self.current_turn, status='cancelled')
+        self.current_turn = None
+        
+        self.progress_bar.setVisible(False)
+        return had_activity
+    
+    def stop_response(self):
+        """Остановка ответа по кнопке"""
+        if self.cancel_response():
+            self.set_status("Остановлено")
+    
+    def on_response_token(self, token: str):
+        """Отображение очередного токена ответа"""
+        if self.streaming_message is None:
+            # Первый токен: создаем сообщение, которое будет расти по мере генерации
+            self.progress_bar.setVisible(False)
+            self.set_status("Сакура отвечает...")
+            self.streaming_message = self.chat_widget.add_assistant_message(token)
+            
+            # Озвучиваем по предложениям, не дожидаясь конца генерации
+            if not self.is_muted and self.tts.is_available():
+                self.speech_pipeline = self.tts.start_stream()
+        else:
+            self.chat_widget.append_to_message(self.streaming_message, token)
+        
+        if self.speech_pipeline is not None:
+            self.speech_pipeline.feed(token)
+    
     def on_response_ready(self, response: str):
         """Обработка готового ответа"""
         # Скрыть прогресс
         self.progress_bar.setVisible(False)
-        self.status_label.setText("Готов")
-        
-        # Добавить ответ в чат
-        self.chat_widget.add_assistant_message(response)
-        
-        # Озвучить ответ (если не заглушено)
-        if not self.is_muted and self.tts.is_available():
+        self.set_status("Готов")
+        
+        # Текст уже выведен потоком; сообщение создается, только если токенов не было
+        chat_message = self.streaming_message
+        if chat_message is None:
+            chat_message = self.chat_widget.add_assistant_message(response)
+        self.store_message('assistant', chat_message, response)
+        self.streaming_message = None
+        
+        if self.current_response_thread is not None:
+            personality_manager.process_interaction(self.current_response_thread.user_input, response)
+        
+        # Дозвучиваем остаток текста (если не заглушено)
+        if self.speech_pipeline is not None:
+            self.speech_pipeline.finish()
+            self.speech_pipeline = None
+        elif not self.is_muted and self.tts.is_available():
             self.tts.speak(response)
+        else:
+            # Озвучивания не будет: ход заканчивается вместе с текстом
+            tracer.finish_turn(self.current_turn)
         
+        # Дальше ход завершает конвейер озвучивания
+        self.current_turn = None
         self.current_response_thread = None
     
     def on_response_error(self, error: str):
         """Обработка ошибки генерации ответа"""
         self.progress_bar.setVisible(False)
-        self.status_label.setText("Ошибка")
+        self.set_status("Ошибка")
         
         self.chat_widget.add_error_message(f"Ошибка: {error}")
+        self.streaming_message = None
+        if self.speech_pipeline is not None:
+            self.speech_pipeline.finish()
+            self.speech_pipeline = None
+        tracer.finish_turn(self.current_turn, status='error')
+        self.current_turn = None
         self.current_response_thread = None
     
+    def on_trace_ready(self, record: dict):
+        """Показ задержек завершенного хода в строке состояния"""
+        summary = record.get('summary', {})
+        if 'to_first_audio' in summary:
+            text = f"Ход #{record['turn_id']}: до звука {summary['to_first_audio']:.2f} с"
+        elif 'time_to_first_token' in summary:
+            text = f"Ход #{record['turn_id']}: первый токен {summary['time_to_first_token']:.2f} с"
+        else:
+            return
+        
+        details = [f"{key}: {value:.3f} с" for key, value in summary.items()]
+        details += [f"{key}: {value}" for key, value in record.get('attributes', {}).items()]
+        self.trace_label.setText(text)
+        self.trace_label.setToolTip(f"Ход #{record['turn_id']} ({record['source']}, {record['status']})\n" + "\n".join(details))
+    
     def toggle_listening(self):
         """Переключение прослушивания"""
         if not self.stt.is_available():
@@ -414,7 +672,7 @@ class MainWindow(QMainWindow):
         if self.stt.start_listening():
             self.is_listening = True
             self.mic_button.setText("🎤 Остановить")
-            self.status_label.setText("Слушаю...")
+            self.set_status("Слушаю...")
             self.chat_widget.add_system_message("Начинаю слушать...")
         else:
             self.mic_button.setChecked(False)
@@ -425,7 +683,7 @@ class MainWindow(QMainWindow):
         self.stt.stop_listening()
         self.is_listening = False
         self.mic_button.setText("🎤 Слушать")
-        self.status_label.setText("Готов")
+        self.set_status("Готов")
     
     def toggle_mute(self):
         """Переключение звука"""
@@ -434,6 +692,7 @@ class MainWindow(QMainWindow):
         if self.is_muted:
             self.mute_button.setText("🔇 Заглушено")
             self.tts.stop()
+            self.speech_pipeline = None
         else:
             self.mute_button.setText("🔊 Звук")
     
@@ -450,6 +709,8 @@ class MainWindow(QMainWindow):
         if reply == QMessageBox.Yes:
             self.chat_widget.clear()
             self.ollama_client.clear_history()
+            if self.history_store is not None:
+                self.history_store.reset_context()
             self.chat_widget.add_system_message("История очищена")
     
     def show_settings(self):
@@ -478,22 +739,40 @@ class MainWindow(QMainWindow):
             """
         )
     
-    def on_partial_speech(self, text: str):
+    def on_partial_speech(self, seq: int, text: str):
         """Обработка частичного результата распознавания"""
         if text:
-            self.status_label.setText(f"Слышу: {text}")
+            self.set_status(f"Слышу: {text}")
     
-    def on_final_speech(self, text: str):
+    def on_final_speech(self, seq: int, text: str):
         """Обработка финального результата распознавания"""
         if text:
             logger.info(f"Распознана речь: {text}")
             self.input_field.setText(text)
             self.send_message()
     
-    def on_speech_error(self, error: str):
+    def on_speech_error(self, seq: int, error: str):
         """Обработка ошибки распознавания"""
         logger.error(f"Ошибка распознавания речи: {error}")
-        self.status_label.setText("Ошибка распознавания")
+        self.set_status("Ошибка распознавания")
+    
+    def on_tts_started(self, seq: int, utt_id: int):
+        """Начало озвучивания ответа"""
+        self.speaking_utterance = utt_id
+        self.set_status("Сакура говорит...")
+    
+    def on_tts_finished(self, seq: int, utt_id: int, cancelled: bool):
+        """Окончание озвучивания ответа"""
+        if utt_id != self.speaking_utterance:
+            return
+        self.speaking_utterance = None
+        # Прерванное озвучивание уже сменило статус (новый запрос или остановка)
+        if not cancelled and self.current_response_thread is None:
+            self.set_status("Готов")
+    
+    def on_tts_error(self, seq: int, error: str):
+        """Ошибка озвучивания"""
+        self.set_status("Ошибка озвучивания")
     
     def on_tray_activated(self, reason):
         """Обработка активации трея"""
@@ -519,15 +798,25 @@ class MainWindow(QMainWindow):
                 )
         else:
             # Сохранить настройки окна
-            config.set('gui.window_size', [self.width(), self.height()])
-            config.set('gui.window_position', [self.x(), self.y()])
+            with config.batch():
+                config.set('gui.window_size', [self.width(), self.height()])
+                config.set('gui.window_position', [self.x(), self.y()])
+                personality_manager.save_personality_state()
             
             # Остановить компоненты
             if self.is_listening:
                 self.stop_listening()
             
-            if self.current_response_thread:
-                self.current_response_thread.wait()
+            self.cancel_response()
+            for thread in list(self.cancelled_threads):
+                thread.wait()
+            
+            self.ollama_client.registry.stop()
+            self.tts.close()
+            logger.info(f"Обновления интерфейса: {self.ui_updates.get_stats()}")
+            logger.info(f"События движков: {self.events.get_stats()}")
+            if self.history_store is not None:
+                self.history_store.close()
             
             event.accept()
     def apply_theme(self, theme: str):
@@ -620,54 +909,3 @@ class MainWindow(QMainWindow):
         if dialog.exec_() == dialog.Accepted:
             # Настройки уже применены через сигнал
             logger.info("Диалог настроек закрыт с применением")
-
-    ## Добавьте в ChatWidget метод apply_theme:
-
-    def apply_theme(self, theme: str):
-        """Применение темы к виджету чата"""
-        if theme == 'dark':
-            self.setStyleSheet("""
-                QScrollArea {
-                    border: none;
-                    background-color: #2b2b2b;
-                }
-                QWidget {
-                    background-color: #2b2b2b;
-                }
-                QScrollBar:vertical {
-                    background-color: #3c3c3c;
-                    width: 12px;
-                    border-radius: 6px;
-                }
-                QScrollBar::handle:vertical {
-                    background-color: #606060;
-                    border-radius: 6px;
-                    min-height: 20px;
-                }
-                QScrollBar::handle:vertical:hover {
-                    background-color: #707070;
-                }
-            """)
-        elif theme == 'light':
-            self.setStyleSheet("""
-                QScrollArea {
-                    border: none;
-                    background-color: #ffffff;
-                }
-                QWidget {
-                    background-color: #ffffff;
-                }
-                QScrollBar:vertical {
-                    background-color: #f0f0f0;
-                    width: 12px;
-                    border-radius: 6px;
-                }
-                QScrollBar::handle:vertical {
-                    background-color: #c0c0c0;
-                    border-radius: 6px;
-                    min-height: 20px;
-                }
-                QScrollBar::handle:vertical:hover {
-                    background-color: #a0a0a0;
-                }
-            """)
@@ -54,7 +54,7 @@ class SettingsDialog(QDialog):
         self.tab_widget.addTab(self.personality_tab, "Личность ИИ")
 
         # Вкладка "Модули"
-        self.modules_tab = ModulesTab()
+        self.modules_tab = ModulesTab(self.main_window.tts if self.main_window else None)
         self.tab_widget.addTab(self.modules_tab, "Модули")
 
         layout.addWidget(self.tab_widget)
@@ -133,9 +133,11 @@ class SettingsDialog(QDialog):
     def save_settings(self):
         """Сохранение настроек"""
         try:
-            self.general_tab.save_settings()
-            self.personality_tab.save_settings()
-            self.modules_tab.save_settings()
+            # Все изменения вкладок записываются в файл одним сохранением
+            with config.batch():
+                self.general_tab.save_settings()
+                self.personality_tab.save_settings()
+                self.modules_tab.save_settings()
 
             logger.info("Настройки сохранены")
             return True
@@ -186,7 +188,7 @@ class SettingsDialog(QDialog):
             ollama_client = self.main_window.ollama_client
 
             # Обновляем настройки клиента
-            ollama_client.host = config.get('ai.ollama_host', 'http://localhost:11434')
+            ollama_client.set_host(config.get('ai.ollama_host', 'http://localhost:11434'))
             new_model = config.get('ai.model', 'qwen3:30b')
 
             # Если модель изменилась, обновляем её
@@ -0,0 +1,130 @@
+"""
+Слияние частых обновлений интерфейса: текст статуса, перерисовка
+дописываемого ответа, прокрутка применяются не чаще одного раза за кадр (~16 мс)
+"""
+
+import time
+from typing import Any, Callable, Dict, Hashable
+from PyQt5.QtCore import QObject, QTimer, Qt
+from utils.logger import logger
+
+# Виды отложенных обновлений
+VALUE = 'value'  # применяется только последнее значение
+CALL = 'call'    # вызов без аргументов, повторные запросы сливаются
+
+
+class _Pending:
+    """Отложенное обновление по одному ключу"""
+
+    __slots__ = ('kind', 'callback', 'payload')
+
+    def __init__(self, kind: str, callback: Callable, payload: Any):
+        self.kind = kind
+        self.callback = callback
+        self.payload = payload
+
+
+class UpdateCoalescer(QObject):
+    """
+    Буфер обновлений интерфейса. Обновления с одинаковым ключом сливаются,
+    а все накопленные применяются одним проходом по таймеру кадра.
+    Используется только из потока GUI
+    """
+
+    def __init__(self, interval_ms: int = 16, parent=None):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000
+
+        self.pending: Dict[Hashable, _Pending] = {}
+        self.last_flush = 0.0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.flush)
+
+        # Метрики
+        self.submitted = 0
+        self.applied = 0
+        self.dropped = 0  # значения и вызовы, вытесненные более новыми
+        self.frames = 0
+        self.frame_time_total = 0.0
+        self.frame_time_max = 0.0
+
+    def set_value(self, key: Hashable, callback: Callable[[Any], None], value: Any) -> None:
+        """Откладывает callback(value); если обновление с этим ключом уже ждет, оно заменяется"""
+        self._submit(key, VALUE, callback, value)
+
+    def request(self, key: Hashable, callback: Callable[[], None]) -> None:
+        """Откладывает callback(); повторные запросы до ближайшего кадра сливаются в один"""
+        self._submit(key, CALL, callback, None)
+
+    def cancel(self, key: Hashable) -> None:
+        """Отменяет отложенное обновление"""
+        self.pending.pop(key, None)
+
+    def flush(self, key: Hashable = None) -> None:
+        """Применяет отложенные обновления: все или одно по ключу"""
+        if key is not None:
+            entry = self.pending.pop(key, None)
+            if entry is not None:
+                self._apply(key, entry)
+            return
+
+        self.timer.stop()
+        if not self.pending:
+            return
+
+        start = time.perf_counter()
+        # Обновления, запрошенные из callback, попадут в следующий кадр
+        batch = self.pending
+        self.pending = {}
+        for batch_key, entry in batch.items():
+            self._apply(batch_key, entry)
+
+        self.last_flush = time.perf_counter()
+        elapsed = self.last_flush - start
+        self.frames += 1
+        self.frame_time_total += elapsed
+        self.frame_time_max = max(self.frame_time_max, elapsed)
+
+        if self.pending:
+            self._schedule()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика слияния обновлений"""
+        return {
+            'submitted': self.submitted,
+            'applied': self.applied,
+            'dropped': self.dropped,
+            'frames': self.frames,
+            'coalesce_ratio': round(1 - self.applied / self.submitted, 3) if self.submitted else 0.0,
+            'avg_frame_ms': round(self.frame_time_total / self.frames * 1000, 3) if self.frames else 0.0,
+            'max_frame_ms': round(self.frame_time_max * 1000, 3)
+        }
+
+    def _submit(self, key: Hashable, kind: str, callback: Callable, payload: Any) -> None:
+        self.submitted += 1
+        entry = self.pending.get(key)
+
+        self.pending[key] = _Pending(kind, callback, payload)
+        if entry is not None:
+            self.dropped += 1
+
+        if not self.timer.isActive():
+            self._schedule()
+
+    def _schedule(self) -> None:
+        """Запускает таймер так, чтобы между применениями прошло не меньше кадра"""
+        delay = self.last_flush + self.interval - time.perf_counter()
+        self.timer.start(max(0, int(delay * 1000)))
+
+    def _apply(self, key: Hashable, entry: _Pending) -> None:
+        try:
+            if entry.kind == VALUE:
+                entry.callback(entry.payload)
+            else:
+                entry.callback()
+            self.applied += 1
+        except Exception as e:
+            logger.error(f"Ошибка обновления интерфейса ({key}): {e}")
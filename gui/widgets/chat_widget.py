@@ -1,260 +1,679 @@
 """
-Виджет чата для отображения сообщений
+Виджет чата для отображения сообщений.
+Сообщения хранятся в модели, а рисуются делегатом: виджеты на каждое
+сообщение не создаются, отрисовываются только видимые строки
 """
 
+import itertools
+from collections import OrderedDict
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QTextEdit, QScrollArea, 
-    QLabel, QFrame, QHBoxLayout, QSizePolicy
+    QWidget, QVBoxLayout, QListView, QStyledItemDelegate, QStyle,
+    QStyleOptionViewItem, QAbstractItemView, QApplication, QMenu,
+    QLineEdit, QListWidget, QListWidgetItem, QShortcut, QMessageBox
 )
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal
-from PyQt5.QtGui import QFont, QTextCursor, QPixmap, QColor, QPalette
+from PyQt5.QtCore import (
+    Qt, QTimer, pyqtSignal, QAbstractListModel, QModelIndex,
+    QPoint, QPointF, QRectF, QSize
+)
+from PyQt5.QtGui import QFont, QFontMetrics, QColor, QPainter, QPen, QTextLayout, QTextOption, QKeySequence
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
+from config.config_manager import config
+from storage.search_index import InvertedIndex, fold_text, tokenize
+from ..update_coalescer import UpdateCoalescer
+
+
+class ChatMessage:
+    """Одно сообщение чата"""
 
+    __slots__ = ('uid', 'message', 'sender', 'timestamp', 'revision', 'highlighted', 'height_cache', 'record_id')
+
+    _uids = itertools.count(1)
 
-class MessageWidget(QFrame):
-    """Виджет для отображения одного сообщения"""
-    
     def __init__(self, message: str, sender: str, timestamp: Optional[datetime] = None):
-        super().__init__()
+        self.uid = next(self._uids)
         self.message = message
         self.sender = sender
         self.timestamp = timestamp or datetime.now()
-        
-        self.setup_ui()
-    
-    def setup_ui(self):
-        """Настройка интерфейса сообщения"""
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(10, 8, 10, 8)
-        
-        # Заголовок с именем отправителя и временем
-        header_layout = QHBoxLayout()
-        
-        sender_label = QLabel(self.sender)
-        sender_label.setFont(QFont("Arial", 10, QFont.Bold))
-        
-        time_label = QLabel(self.timestamp.strftime("%H:%M"))
-        time_label.setFont(QFont("Arial", 9))
-        time_label.setStyleSheet("color: #888888;")
-        
-        header_layout.addWidget(sender_label)
-        header_layout.addStretch()
-        header_layout.addWidget(time_label)
-        
-        layout.addLayout(header_layout)
-        
-        # Текст сообщения
-        message_label = QLabel(self.message)
-        message_label.setWordWrap(True)
-        message_label.setFont(QFont("Arial", 11))
-        message_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
-        
-        layout.addWidget(message_label)
-        
-        # Стиль в зависимости от отправителя
-        self.apply_style()
-    
-    def apply_style(self):
-        """Применение стиля в зависимости от отправителя"""
-        if self.sender == "Вы":
-            # Сообщения пользователя - справа, синий фон
-            self.setStyleSheet("""
-                MessageWidget {
-                    background-color: #1976D2;
-                    color: white;
-                    border-radius: 10px;
-                    margin-left: 50px;
-                    margin-right: 10px;
-                }
-            """)
-        elif self.sender == "Сакура":
-            # Сообщения ИИ - слева, фиолетовый фон
-            self.setStyleSheet("""
-                MessageWidget {
-                    background-color: #7B1FA2;
-                    color: white;
-                    border-radius: 10px;
-                    margin-left: 10px;
-                    margin-right: 50px;
-                }
-            """)
-        elif self.sender == "Система":
-            # Системные сообщения - центр, серый фон
-            self.setStyleSheet("""
-                MessageWidget {
-                    background-color: #424242;
-                    color: #CCCCCC;
-                    border-radius: 8px;
-                    margin-left: 30px;
-                    margin-right: 30px;
-                    font-style: italic;
-                }
-            """)
+        # Номер правки текста: по нему сбрасываются кэши раскладки
+        self.revision = 0
+        self.highlighted = False
+        # (ширина, правка, высота строки)
+        self.height_cache: Optional[Tuple[int, int, int]] = None
+        # id в постоянной истории (если сообщение сохранено)
+        self.record_id: Optional[int] = None
+
+    def append_text(self, text: str):
+        """Дописывает текст в конец сообщения (для потоковых ответов)"""
+        self.message += text
+        self.revision += 1
+
+
+# Оформление по отправителю: фон, цвет текста, отступы слева/справа, радиус, курсив
+MESSAGE_STYLES = {
+    "Вы": {'background': '#1976D2', 'color': '#FFFFFF', 'margins': (50, 10), 'radius': 10, 'italic': False},
+    "Сакура": {'background': '#7B1FA2', 'color': '#FFFFFF', 'margins': (10, 50), 'radius': 10, 'italic': False},
+    "Система": {'background': '#424242', 'color': '#CCCCCC', 'margins': (30, 30), 'radius': 8, 'italic': True},
+}
+# Ошибки и прочие отправители
+DEFAULT_STYLE = {'background': '#D32F2F', 'color': '#FFFFFF', 'margins': (20, 20), 'radius': 8, 'italic': False}
+
+MessageRole = Qt.UserRole + 1
+
+# Отправитель по роли сохраненного сообщения
+ROLE_SENDERS = {'user': "Вы", 'assistant': "Сакура", 'system': "Система", 'error': "Ошибка"}
+
+
+class ChatModel(QAbstractListModel):
+    """Модель списка сообщений"""
+
+    def __init__(self, max_messages: int = 20000, parent=None):
+        super().__init__(parent)
+        self.messages: List[ChatMessage] = []
+        self.max_messages = max_messages
+        # Сквозная позиция сообщения по uid: номер строки = позиция - row_offset,
+        # так удаление старых сообщений не требует пересчета словаря
+        self.rows: Dict[int, int] = {}
+        self.row_offset = 0
+
+        # Индекс для поиска по загруженным сообщениям; дописанные сообщения
+        # переиндексируются перед ближайшим поиском, а не на каждый токен.
+        # Строится при первом поиске: с подключенной историей ищет база, и он не нужен
+        self.search_index = InvertedIndex()
+        self.stale_uids: Set[int] = set()
+        self.indexed = False
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid() or index.row() >= len(self.messages):
+            return None
+        message = self.messages[index.row()]
+        if role == Qt.DisplayRole:
+            return message.message
+        if role == Qt.ToolTipRole:
+            return message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        if role == MessageRole:
+            return message
+        return None
+
+    def append(self, message: ChatMessage) -> None:
+        """Добавляет сообщение в конец"""
+        row = len(self.messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.messages.append(message)
+        self.rows[message.uid] = row + self.row_offset
+        if self.indexed:
+            self.search_index.add(message.uid, message.message)
+        self.endInsertRows()
+        self._trim()
+
+    def prepend(self, messages: List[ChatMessage]) -> None:
+        """Добавляет более старые сообщения в начало"""
+        if not messages:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(messages) - 1)
+        self.messages[0:0] = messages
+        self.row_offset -= len(messages)
+        for row, message in enumerate(messages):
+            self.rows[message.uid] = row + self.row_offset
+            if self.indexed:
+                self.search_index.add(message.uid, message.message)
+        self.endInsertRows()
+
+    def row_of(self, message: ChatMessage) -> int:
+        """Номер строки сообщения или -1"""
+        position = self.rows.get(message.uid)
+        return -1 if position is None else position - self.row_offset
+
+    def index_of(self, message: ChatMessage) -> QModelIndex:
+        row = self.row_of(message)
+        return self.index(row) if row >= 0 else QModelIndex()
+
+    def message_changed(self, message: ChatMessage) -> None:
+        """Сообщает представлению, что сообщение изменилось"""
+        index = self.index_of(message)
+        if index.isValid():
+            if self.indexed:
+                self.stale_uids.add(message.uid)
+            self.dataChanged.emit(index, index)
+
+    def search(self, query: str, limit: int = 50) -> List[ChatMessage]:
+        """Поиск по загруженным сообщениям (слова по префиксу) в порядке релевантности"""
+        if not self.indexed:
+            for message in self.messages:
+                self.search_index.add(message.uid, message.message)
+            self.indexed = True
+            self.stale_uids.clear()
+
+        for uid in self.stale_uids:
+            row = self.rows.get(uid)
+            if row is not None:
+                message = self.messages[row - self.row_offset]
+                self.search_index.add(uid, message.message)
+        self.stale_uids.clear()
+
+        return [
+            self.messages[self.rows[uid] - self.row_offset]
+            for uid, score in self.search_index.search(query, limit)
+        ]
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.messages.clear()
+        self.rows.clear()
+        self.row_offset = 0
+        self.search_index.clear()
+        self.stale_uids.clear()
+        self.endResetModel()
+
+    def _trim(self) -> None:
+        """Удаляет старые сообщения сверх лимита (пачкой, а не по одному)"""
+        excess = len(self.messages) - self.max_messages
+        if excess <= max(1, self.max_messages // 10):
+            return
+        self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+        for message in self.messages[:excess]:
+            self.rows.pop(message.uid, None)
+            self.search_index.remove(message.uid)
+            self.stale_uids.discard(message.uid)
+        del self.messages[:excess]
+        self.row_offset += excess
+        self.endRemoveRows()
+
+
+class ChatDelegate(QStyledItemDelegate):
+    """Рисует сообщения пузырями; раскладка текста кэшируется по ширине"""
+
+    PADDING_X = 10
+    PADDING_Y = 8
+    SPACING = 8  # между сообщениями
+    HEADER_GAP = 4
+
+    def __init__(self, view: QListView, layout_cache_size: int = 256):
+        super().__init__(view)
+        self.view = view
+        self.header_font = QFont("Arial", 10, QFont.Bold)
+        self.time_font = QFont("Arial", 9)
+        self.body_font = QFont("Arial", 11)
+        self.italic_font = QFont(self.body_font)
+        self.italic_font.setItalic(True)
+        self.header_height = max(QFontMetrics(self.header_font).height(), QFontMetrics(self.time_font).height())
+
+        # Раскладки нужны только видимым строкам: храним последние использованные
+        self.layouts: "OrderedDict[Tuple[int, int, int], QTextLayout]" = OrderedDict()
+        self.layout_cache_size = layout_cache_size
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        message: ChatMessage = index.data(MessageRole)
+        if message is None:
+            return QSize(0, 0)
+
+        width = self._row_width()
+        cached = message.height_cache
+        if cached is not None and cached[0] == width and cached[1] == message.revision:
+            return QSize(width, cached[2])
+
+        layout = self._layout(message, self._text_width(message, width))
+        height = (int(layout.boundingRect().height()) + self.header_height + self.HEADER_GAP
+                  + 2 * self.PADDING_Y + self.SPACING)
+        message.height_cache = (width, message.revision, height)
+        return QSize(width, height)
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex) -> None:
+        message: ChatMessage = index.data(MessageRole)
+        if message is None:
+            return
+
+        style = MESSAGE_STYLES.get(message.sender, DEFAULT_STYLE)
+        margin_left, margin_right = style['margins']
+        rect = QRectF(option.rect).adjusted(
+            margin_left, self.SPACING / 2, -margin_right, -self.SPACING / 2
+        )
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        # Пузырь
+        if message.highlighted:
+            painter.setPen(QPen(QColor('#FFC107'), 2))
+        elif option.state & QStyle.State_Selected:
+            painter.setPen(QPen(QColor(255, 255, 255, 160), 1.5))
         else:
-            # Ошибки - красный фон
-            self.setStyleSheet("""
-                MessageWidget {
-                    background-color: #D32F2F;
-                    color: white;
-                    border-radius: 8px;
-                    margin-left: 20px;
-                    margin-right: 20px;
-                }
-            """)
+            painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(style['background']))
+        painter.drawRoundedRect(rect, style['radius'], style['radius'])
+
+        # Заголовок: отправитель слева, время справа
+        header = QRectF(rect.left() + self.PADDING_X, rect.top() + self.PADDING_Y,
+                        rect.width() - 2 * self.PADDING_X, self.header_height)
+        painter.setPen(QColor(style['color']))
+        painter.setFont(self.header_font)
+        painter.drawText(header, Qt.AlignLeft | Qt.AlignVCenter, message.sender)
+        painter.setPen(QColor('#888888'))
+        painter.setFont(self.time_font)
+        painter.drawText(header, Qt.AlignRight | Qt.AlignVCenter, message.timestamp.strftime("%H:%M"))
+
+        # Текст
+        painter.setPen(QColor(style['color']))
+        layout = self._layout(message, self._text_width(message, option.rect.width()))
+        layout.draw(painter, QPointF(header.left(), header.bottom() + self.HEADER_GAP))
+
+        painter.restore()
+
+    def invalidate(self) -> None:
+        """Сбрасывает кэш раскладок"""
+        self.layouts.clear()
+
+    def _row_width(self) -> int:
+        return max(1, self.view.viewport().width())
+
+    def _text_width(self, message: ChatMessage, row_width: int) -> int:
+        margin_left, margin_right = MESSAGE_STYLES.get(message.sender, DEFAULT_STYLE)['margins']
+        return max(20, row_width - margin_left - margin_right - 2 * self.PADDING_X)
+
+    def _layout(self, message: ChatMessage, width: int) -> QTextLayout:
+        """Раскладка текста сообщения под заданную ширину (из кэша, если есть)"""
+        key = (message.uid, message.revision, width)
+        layout = self.layouts.get(key)
+        if layout is not None:
+            self.layouts.move_to_end(key)
+            return layout
+
+        italic = MESSAGE_STYLES.get(message.sender, DEFAULT_STYLE)['italic']
+        # QTextLayout переносит строки только по разделителю строк Unicode
+        layout = QTextLayout(message.message.replace('\n', '\u2028'), self.italic_font if italic else self.body_font)
+        text_option = QTextOption()
+        text_option.setWrapMode(QTextOption.WrapAtWordBoundaryOrAnywhere)
+        layout.setTextOption(text_option)
+
+        layout.beginLayout()
+        height = 0.0
+        while True:
+            line = layout.createLine()
+            if not line.isValid():
+                break
+            line.setLineWidth(width)
+            line.setPosition(QPointF(0, height))
+            height += line.height()
+        layout.endLayout()
+
+        self.layouts[key] = layout
+        if len(self.layouts) > self.layout_cache_size:
+            self.layouts.popitem(last=False)
+        return layout
 
 
 class ChatWidget(QWidget):
     """Виджет чата с прокруткой"""
-    
+
     message_sent = pyqtSignal(str)
-    
-    def __init__(self):
+
+    def __init__(self, updates: Optional[UpdateCoalescer] = None):
         super().__init__()
-        self.messages = []
+        self.model = ChatModel(config.get('gui.chat_max_messages', 20000), self)
+
+        # Перерисовка измененных сообщений и прокрутка - не чаще раза за кадр
+        self.updates = updates or UpdateCoalescer(config.get('gui.update_interval_ms', 16), self)
+
+        # Постоянная история: более старые сообщения подгружаются при прокрутке вверх
+        self.history_store = None
+        self.history_page_size = 100
+        self.history_cursor: Optional[int] = None  # id самого старого загруженного сообщения
+        self.history_exhausted = True
+
+        # Поиск по мере набора: запрос выполняется после паузы в наборе
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.run_search)
 
-        # Таймер для автопрокрутки
-        self.scroll_timer = QTimer()
-        self.scroll_timer.setSingleShot(True)
-        self.scroll_timer.timeout.connect(self.scroll_to_bottom)
-        
         self.setup_ui()
-    
+
+    @property
+    def messages(self) -> List[ChatMessage]:
+        """Сообщения чата (от старых к новым)"""
+        return self.model.messages
+
     def setup_ui(self):
         """Настройка интерфейса чата"""
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
         layout.setSpacing(0)
-        
-        # Область прокрутки
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        
-        # Контейнер для сообщений
-        self.messages_widget = QWidget()
-        self.messages_layout = QVBoxLayout(self.messages_widget)
-        self.messages_layout.setAlignment(Qt.AlignTop)
-        self.messages_layout.setSpacing(8)
-        
-        self.scroll_area.setWidget(self.messages_widget)
-        layout.addWidget(self.scroll_area)
-        
+
+        # Строка поиска и результаты (скрыты до вызова show_search)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск по истории...")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(lambda: self.search_timer.start())
+        self.search_edit.returnPressed.connect(self.open_first_result)
+        self.search_edit.hide()
+        layout.addWidget(self.search_edit)
+
+        self.search_results = QListWidget()
+        self.search_results.setMaximumHeight(200)
+        self.search_results.itemActivated.connect(self.open_search_result)
+        self.search_results.itemClicked.connect(self.open_search_result)
+        self.search_results.hide()
+        layout.addWidget(self.search_results)
+
+        QShortcut(QKeySequence(Qt.Key_Escape), self.search_edit, activated=self.hide_search)
+
+        # Список сообщений: высоты строк разные, раскладка считается пачками
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        self.delegate = ChatDelegate(self.list_view)
+        self.list_view.setItemDelegate(self.delegate)
+        self.list_view.setUniformItemSizes(False)
+        self.list_view.setLayoutMode(QListView.Batched)
+        self.list_view.setBatchSize(200)
+        self.list_view.setResizeMode(QListView.Adjust)
+        self.list_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.list_view.verticalScrollBar().setSingleStep(20)
+        self.list_view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.list_view.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        self.list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.list_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.list_view.setFocusPolicy(Qt.StrongFocus)
+        self.list_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.list_view.customContextMenuRequested.connect(self.show_context_menu)
+        self.list_view.installEventFilter(self)
+        self.list_view.verticalScrollBar().valueChanged.connect(self.on_scroll)
+
+        layout.addWidget(self.list_view)
+
         # Стиль
-        self.setStyleSheet("""
-            QScrollArea {
-                border: none;
-                background-color: #2b2b2b;
-            }
-            QWidget {
-                background-color: #2b2b2b;
-            }
-            QScrollBar:vertical {
-                background-color: #3c3c3c;
-                width: 12px;
-                border-radius: 6px;
-            }
-            QScrollBar::handle:vertical {
-                background-color: #606060;
-                border-radius: 6px;
-                min-height: 20px;
-            }
-            QScrollBar::handle:vertical:hover {
-                background-color: #707070;
-            }
-        """)
-        
+        self.apply_theme(config.get('gui.theme', 'dark'))
+
         # Приветственное сообщение
         self.add_system_message("Привет! Я Сакура, твоя виртуальная вайфу-геймер! 🌸\nМожешь писать мне текстом или говорить в микрофон!")
-    
-    def add_message(self, message: str, sender: str, timestamp: Optional[datetime] = None):
+
+    def add_message(self, message: str, sender: str, timestamp: Optional[datetime] = None) -> ChatMessage:
         """Добавление сообщения в чат"""
-        message_widget = MessageWidget(message, sender, timestamp)
-        self.messages_layout.addWidget(message_widget)
-        self.messages.append(message_widget)
-        
+        chat_message = ChatMessage(message, sender, timestamp)
+        self.model.append(chat_message)
+
         # Автопрокрутка
-        self.scroll_timer.start(100)
-        
-        # Ограничение количества сообщений (для производительности)
-        max_messages = 1000
-        if len(self.messages) > max_messages:
-            old_message = self.messages.pop(0)
-            old_message.deleteLater()
-    
-    def add_user_message(self, message: str):
+        self.request_scroll()
+
+        return chat_message
+
+    def add_user_message(self, message: str) -> ChatMessage:
         """Добавление сообщения пользователя"""
-        self.add_message(message, "Вы")
-    
-    def add_assistant_message(self, message: str):
+        return self.add_message(message, "Вы")
+
+    def add_assistant_message(self, message: str) -> ChatMessage:
         """Добавление сообщения ИИ"""
-        self.add_message(message, "Сакура")
-    
-    def add_system_message(self, message: str):
+        return self.add_message(message, "Сакура")
+
+    def add_system_message(self, message: str) -> ChatMessage:
         """Добавление системного сообщения"""
-        self.add_message(message, "Система")
-    
-    def add_error_message(self, message: str):
+        return self.add_message(message, "Система")
+
+    def add_error_message(self, message: str) -> ChatMessage:
         """Добавление сообщения об ошибке"""
-        self.add_message(message, "Ошибка")
-    
+        return self.add_message(message, "Ошибка")
+
+    def append_to_message(self, chat_message: ChatMessage, text: str):
+        """Дописывает текст в существующее сообщение и прокручивает чат"""
+        # Текст меняется сразу, а перерисовка и пересчет высоты - раз за кадр
+        chat_message.append_text(text)
+        self.updates.request(('changed', chat_message.uid), lambda: self.model.message_changed(chat_message))
+        self.request_scroll()
+
+    def request_scroll(self):
+        """Запрашивает прокрутку к последнему сообщению в ближайшем кадре"""
+        self.updates.request(('scroll', id(self)), self.scroll_to_bottom)
+
+    def set_history_store(self, history_store, page_size: int = 100):
+        """Подключает постоянную историю и загружает последнюю страницу"""
+        self.history_store = history_store
+        self.history_page_size = page_size
+        self.history_cursor = None
+        self.history_exhausted = False
+        self.load_older_messages()
+        self.request_scroll()
+
+    def load_older_messages(self) -> int:
+        """Подгружает страницу сообщений старше загруженных; возвращает их число"""
+        if self.history_store is None or self.history_exhausted:
+            return 0
+
+        records = self.history_store.load_page(self.history_cursor, self.history_page_size)
+        if len(records) < self.history_page_size:
+            self.history_exhausted = True
+        if not records:
+            return 0
+        self.history_cursor = records[0].id
+
+        messages = []
+        for record in records:
+            chat_message = ChatMessage(
+                record.content,
+                ROLE_SENDERS.get(record.role, record.role),
+                datetime.fromtimestamp(record.created_at)
+            )
+            chat_message.record_id = record.id
+            messages.append(chat_message)
+
+        # Сохраняем положение прокрутки относительно верхнего видимого сообщения
+        anchor = self.list_view.indexAt(QPoint(0, 0))
+        anchor_message = anchor.data(MessageRole) if anchor.isValid() else None
+        anchor_offset = self.list_view.visualRect(anchor).top() if anchor.isValid() else 0
+
+        self.model.prepend(messages)
+
+        if anchor_message is not None:
+            self.list_view.scrollTo(self.model.index_of(anchor_message), QAbstractItemView.PositionAtTop)
+            scrollbar = self.list_view.verticalScrollBar()
+            scrollbar.setValue(scrollbar.value() - anchor_offset)
+
+        return len(messages)
+
+    def on_scroll(self, value: int):
+        """Прокрутка к началу списка подгружает более старые сообщения"""
+        if value == 0 and not self.history_exhausted and self.list_view.verticalScrollBar().maximum() > 0:
+            # Не из обработчика прокрутки: вставка строк сама меняет прокрутку
+            QTimer.singleShot(0, self.load_older_messages)
+
     def scroll_to_bottom(self):
         """Прокрутка к последнему сообщению"""
-        scrollbar = self.scroll_area.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
-    
+        self.list_view.scrollToBottom()
+
     def clear(self):
         """Очистка чата"""
-        # Удаляем все виджеты сообщений
-        for message in self.messages:
-            message.deleteLater()
-        
-        self.messages.clear()
-        
+        self.model.clear()
+        self.delegate.invalidate()
+        # Более ранние сообщения относятся к прошлому разговору
+        self.history_exhausted = True
+
         # Добавляем сообщение о очистке
         self.add_system_message("Чат очищен")
-    
+
     def export_to_text(self) -> str:
         """Экспорт чата в текстовый формат"""
         lines = []
-        for message_widget in self.messages:
-            timestamp_str = message_widget.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            lines.append(f"[{timestamp_str}] {message_widget.sender}: {message_widget.message}")
-        
+        for chat_message in self.messages:
+            timestamp_str = chat_message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
+            lines.append(f"[{timestamp_str}] {chat_message.sender}: {chat_message.message}")
+
         return "\n".join(lines)
-    
+
     def get_message_count(self) -> int:
         """Получение количества сообщений"""
         return len(self.messages)
-    
+
     def get_last_messages(self, count: int = 10) -> list:
         """Получение последних сообщений"""
-        return self.messages[-count:] if count <= len(self.messages) else self.messages
-    
+        return self.messages[-count:] if count <= len(self.messages) else list(self.messages)
+
     def find_messages(self, query: str) -> list:
         """Поиск сообщений по тексту"""
         found_messages = []
         query_lower = query.lower()
-        
-        for message_widget in self.messages:
-            if query_lower in message_widget.message.lower():
-                found_messages.append(message_widget)
-        
+
+        for chat_message in self.messages:
+            if query_lower in chat_message.message.lower():
+                found_messages.append(chat_message)
+
         return found_messages
-    
-    def highlight_message(self, message_widget: MessageWidget):
+
+    def show_search(self):
+        """Показывает строку поиска"""
+        self.search_edit.show()
+        self.search_edit.setFocus()
+        self.search_edit.selectAll()
+        if self.search_edit.text():
+            self.run_search()
+
+    def hide_search(self):
+        """Скрывает строку поиска и результаты"""
+        self.search_timer.stop()
+        self.search_edit.hide()
+        self.search_results.hide()
+        self.list_view.setFocus()
+
+    def run_search(self):
+        """Выполняет поиск: по всему архиву, если подключена история, иначе по чату"""
+        query = self.search_edit.text()
+        self.search_results.clear()
+        if not tokenize(query):
+            self.search_results.hide()
+            return
+
+        if self.history_store is not None:
+            results = [
+                (record, ROLE_SENDERS.get(record.role, record.role), record.content,
+                 datetime.fromtimestamp(record.created_at))
+                for record in self.history_store.search(query, 50)
+            ]
+        else:
+            results = [
+                (chat_message, chat_message.sender, chat_message.message, chat_message.timestamp)
+                for chat_message in self.model.search(query, 50)
+            ]
+
+        for result, sender, text, timestamp in results:
+            item = QListWidgetItem(f"{timestamp.strftime('%d.%m.%y %H:%M')}  {sender}: {self._snippet(text, query)}")
+            item.setToolTip(text[:1000])
+            item.setData(Qt.UserRole, result)
+            self.search_results.addItem(item)
+
+        if not results:
+            self.search_results.addItem("Ничего не найдено")
+        self.search_results.setVisible(True)
+
+    def open_first_result(self):
+        """Enter в строке поиска открывает первый результат"""
+        if self.search_results.count():
+            self.open_search_result(self.search_results.item(0))
+
+    def open_search_result(self, item: QListWidgetItem):
+        """Показывает найденное сообщение в чате"""
+        result = item.data(Qt.UserRole)
+        if result is None:
+            return
+        if isinstance(result, ChatMessage):
+            self.highlight_message(result)
+            return
+
+        chat_message = self._find_record(result.id)
+        if chat_message is None:
+            # Сообщение прошлого разговора в чат не загружается: показываем отдельно
+            QMessageBox.information(
+                self,
+                "Сообщение из истории",
+                f"{datetime.fromtimestamp(result.created_at).strftime('%d.%m.%Y %H:%M')}, "
+                f"{ROLE_SENDERS.get(result.role, result.role)}:\n\n{result.content}"
+            )
+            return
+        self.highlight_message(chat_message)
+
+    def _find_record(self, record_id: int) -> Optional[ChatMessage]:
+        """Сообщение чата по id в истории; при необходимости подгружает страницы"""
+        while True:
+            for chat_message in self.messages:
+                if chat_message.record_id == record_id:
+                    return chat_message
+            if self.history_cursor is not None and record_id >= self.history_cursor:
+                return None
+            if not self.load_older_messages():
+                return None
+
+    @staticmethod
+    def _snippet(text: str, query: str, width: int = 90) -> str:
+        """Однострочный фрагмент текста вокруг первого найденного слова"""
+        line = ' '.join(text.split())
+        folded = fold_text(line)
+        terms = tokenize(query)
+        position = folded.find(terms[0]) if terms else -1
+        start = max(0, position - width // 3) if position > 0 else 0
+        snippet = line[start:start + width]
+        return ('…' if start else '') + snippet + ('…' if start + width < len(line) else '')
+
+    def highlight_message(self, chat_message: ChatMessage):
         """Подсветка сообщения"""
-        # Сохраняем оригинальный стиль
-        original_style = message_widget.styleSheet()
-        
-        # Применяем подсветку
-        message_widget.setStyleSheet(original_style + """
-            border: 2px solid #FFC107;
-        """)
-        
+        chat_message.highlighted = True
+        self.model.message_changed(chat_message)
+
         # Убираем подсветку через 2 секунды
-        QTimer.singleShot(2000, lambda: message_widget.setStyleSheet(original_style))
-        
+        def unhighlight():
+            chat_message.highlighted = False
+            self.model.message_changed(chat_message)
+
+        QTimer.singleShot(2000, unhighlight)
+
         # Прокручиваем к сообщению
-        self.scroll_area.ensureWidgetVisible(message_widget)
+        index = self.model.index_of(chat_message)
+        if index.isValid():
+            self.list_view.scrollTo(index, QAbstractItemView.PositionAtCenter)
+
+    def copy_selected(self):
+        """Копирует выделенные сообщения в буфер обмена"""
+        rows = sorted(index.row() for index in self.list_view.selectionModel().selectedIndexes())
+        if rows:
+            QApplication.clipboard().setText("\n\n".join(self.messages[row].message for row in rows))
+
+    def show_context_menu(self, position):
+        """Контекстное меню списка сообщений"""
+        menu = QMenu(self)
+        copy_action = menu.addAction("Копировать")
+        copy_action.setEnabled(self.list_view.selectionModel().hasSelection())
+        copy_action.triggered.connect(self.copy_selected)
+        menu.exec_(self.list_view.viewport().mapToGlobal(position))
+
+    def eventFilter(self, obj, event):
+        """Ctrl+C в списке сообщений копирует выделенные сообщения"""
+        if obj is self.list_view and event.type() == event.KeyPress and event.matches(QKeySequence.Copy):
+            self.copy_selected()
+            return True
+        return super().eventFilter(obj, event)
+
+    def apply_theme(self, theme: str):
+        """Применение темы к виджету чата"""
+        if theme == 'light':
+            background, scrollbar, handle, handle_hover = '#ffffff', '#f0f0f0', '#c0c0c0', '#a0a0a0'
+        else:
+            background, scrollbar, handle, handle_hover = '#2b2b2b', '#3c3c3c', '#606060', '#707070'
+
+        self.setStyleSheet(f"""
+            QListView {{
+                border: none;
+                background-color: {background};
+                outline: none;
+            }}
+            QScrollBar:vertical {{
+                background-color: {scrollbar};
+                width: 12px;
+                border-radius: 6px;
+            }}
+            QScrollBar::handle:vertical {{
+                background-color: {handle};
+                border-radius: 6px;
+                min-height: 20px;
+            }}
+            QScrollBar::handle:vertical:hover {{
+                background-color: {handle_hover};
+            }}
+        """)
@@ -272,8 +272,10 @@ class PersonalityTab(QScrollArea):
 class ModulesTab(QScrollArea):
     """Вкладка настройки модулей"""
     
-    def __init__(self):
+    def __init__(self, tts=None):
         super().__init__()
+        # Синтезатор главного окна: у каждого экземпляра свой аудиопоток и пул потоков
+        self.tts = tts
         self.setWidgetResizable(True)
         self.setup_ui()
     
@@ -324,6 +326,18 @@ class ModulesTab(QScrollArea):
         volume_layout.addWidget(self.tts_volume_label)
         tts_layout.addRow("Громкость:", volume_layout)
         
+        # Скорость речи
+        speed_layout = QHBoxLayout()
+        self.tts_speed_slider = QSlider(Qt.Horizontal)
+        self.tts_speed_slider.setRange(50, 200)
+        self.tts_speed_label = QLabel("x1.00")
+        self.tts_speed_slider.valueChanged.connect(
+            lambda v: self.tts_speed_label.setText(f"x{v / 100:.2f}")
+        )
+        speed_layout.addWidget(self.tts_speed_slider)
+        speed_layout.addWidget(self.tts_speed_label)
+        tts_layout.addRow("Скорость речи:", speed_layout)
+        
         # Тест TTS
         self.tts_test_btn = QPushButton("Тест голоса")
         self.tts_test_btn.clicked.connect(self.test_tts)
@@ -404,6 +418,17 @@ class ModulesTab(QScrollArea):
         self.silence_timeout_spin.setSuffix(" сек")
         audio_layout.addRow("Таймаут тишины:", self.silence_timeout_spin)
         
+        # VAD перед распознаванием
+        self.vad_enabled_check = QCheckBox("Распознавать только при наличии речи (VAD)")
+        audio_layout.addRow(self.vad_enabled_check)
+        
+        # Минимальная длительность речи
+        self.min_speech_spin = QDoubleSpinBox()
+        self.min_speech_spin.setRange(0.1, 5.0)
+        self.min_speech_spin.setSingleStep(0.1)
+        self.min_speech_spin.setSuffix(" сек")
+        audio_layout.addRow("Мин. длительность речи:", self.min_speech_spin)
+        
         layout.addWidget(audio_group)
         layout.addStretch()
     
@@ -419,11 +444,11 @@ class ModulesTab(QScrollArea):
     
     def test_tts(self):
         """Тест синтеза речи"""
-        from tts.silero_tts import SileroTTS
-        
         try:
-            tts = SileroTTS()
-            tts.test_speech()
+            if self.tts is None or not self.tts.is_available():
+                QMessageBox.warning(self, "Ошибка", "Модель TTS не загружена")
+                return
+            self.tts.test_speech()
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Ошибка тестирования TTS:\n{e}")
     
@@ -449,6 +474,7 @@ class ModulesTab(QScrollArea):
         self.tts_sample_rate_combo.setCurrentText(str(config.get('tts.sample_rate', 48000)))
         self.tts_device_combo.setCurrentText(config.get('tts.device', 'cpu'))
         self.tts_volume_slider.setValue(int(config.get('tts.volume', 0.8) * 100))
+        self.tts_speed_slider.setValue(int(config.get('tts.speed', 1.0) * 100))
         
         # STT
         self.stt_enabled_check.setChecked(config.get('stt.enabled', True))
@@ -460,6 +486,8 @@ class ModulesTab(QScrollArea):
         # Audio
         self.vad_threshold_slider.setValue(int(config.get('audio.vad_threshold', 0.3) * 100))
         self.silence_timeout_spin.setValue(config.get('audio.silence_timeout', 2.0))
+        self.vad_enabled_check.setChecked(config.get('stt.vad_enabled', False))
+        self.min_speech_spin.setValue(config.get('audio.min_speech_duration', 0.5))
     
     def save_settings(self):
         """Сохранение настроек"""
@@ -470,6 +498,7 @@ class ModulesTab(QScrollArea):
         config.set('tts.sample_rate', int(self.tts_sample_rate_combo.currentText()))
         config.set('tts.device', self.tts_device_combo.currentText())
         config.set('tts.volume', self.tts_volume_slider.value() / 100)
+        config.set('tts.speed', self.tts_speed_slider.value() / 100)
         
         # STT
         config.set('stt.enabled', self.stt_enabled_check.isChecked())
@@ -481,3 +510,5 @@ class ModulesTab(QScrollArea):
         # Audio
         config.set('audio.vad_threshold', self.vad_threshold_slider.value() / 100)
         config.set('audio.silence_timeout', self.silence_timeout_spin.value())
+        config.set('stt.vad_enabled', self.vad_enabled_check.isChecked())
+        config.set('audio.min_speech_duration', self.min_speech_spin.value())
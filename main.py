@@ -39,7 +39,12 @@ class SakuraAIApplication:
         log_level = config.get('logging.level', 'INFO')
         log_file = config.get('logging.file', 'logs/sakura_ai.log')
         global logger
-        logger = setup_logger("SakuraAI", log_level, log_file)
+        logger = setup_logger(
+            "SakuraAI", log_level, log_file,
+            max_size=config.get('logging.max_size', '10MB'),
+            backups=config.get('logging.backups', 5),
+            queue_size=config.get('logging.queue_size', 10000)
+        )
         
         logger.info("=" * 50)
         logger.info("Запуск Sakura AI")
@@ -0,0 +1,289 @@
+"""
+Постоянная история чата в SQLite (режим WAL).
+Запись идет только добавлением и выполняется фоновым потоком пачками,
+чтение - страницами от новых сообщений к старым; поиск - через FTS5
+"""
+
+import os
+import time
+import queue
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from utils.logger import logger
+from .search_index import fold_text, tokenize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Полнотекстовый индекс хранит нормализованный текст (fold_text), rowid = id сообщения
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Роли, которые попадают в контекст модели
+CONTEXT_ROLES = ('user', 'assistant')
+
+
+class HistoryRecord:
+    """Сохраненное сообщение"""
+
+    __slots__ = ('id', 'role', 'content', 'created_at')
+
+    def __init__(self, record_id: int, role: str, content: str, created_at: float):
+        self.id = record_id
+        self.role = role
+        self.content = content
+        self.created_at = created_at
+
+    def to_message(self) -> Dict[str, str]:
+        """Сообщение в формате истории Ollama"""
+        return {'role': self.role, 'content': self.content}
+
+
+class ChatHistoryStore:
+    """
+    Хранилище истории чата.
+
+    id сообщений выдаются сразу при добавлении (последовательно от максимального
+    в базе), поэтому вызывающий поток не ждет записи на диск. Очистка чата
+    не удаляет архив: она сдвигает начало текущего разговора (context_start)
+    """
+
+    def __init__(self,
+                 db_file: str = "data/chat_history.db",
+                 batch_size: int = 100,
+                 flush_interval: float = 0.5):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        # Соединение для чтения (поток GUI и поиск); писатель открывает свое
+        self._read_conn = self._connect()
+        self._read_conn.executescript(SCHEMA)
+        self._read_lock = threading.Lock()
+        self.fts_enabled = self._init_fts()
+
+        row = self._read_conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()
+        self._next_id = row[0] + 1
+        self._id_lock = threading.Lock()
+        # Добавленные сообщения, еще не записанные в базу
+        self.pending_writes = 0
+        self.context_start = int(self._get_meta('context_start', '0'))
+
+        self._queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self.written = 0
+        self._writer = threading.Thread(target=self._writer_loop, name="ChatHistoryWriter", daemon=True)
+        self._writer.start()
+
+        logger.info(f"История чата: {db_file}, сообщений: {self._next_id - 1}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.create_function('fold', 1, fold_text, deterministic=True)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL NORMAL не теряет целостность, а fsync делается только при контрольных точках
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append(self, role: str, content: str, created_at: Optional[float] = None) -> HistoryRecord:
+        """Добавляет сообщение в очередь записи и сразу возвращает запись с id"""
+        with self._id_lock:
+            record = HistoryRecord(self._next_id, role, content, created_at or time.time())
+            self._next_id += 1
+            self.pending_writes += 1
+        self._queue.put(('insert', record))
+        return record
+
+    def reset_context(self) -> None:
+        """Начинает новый разговор: более ранние сообщения не загружаются в чат и контекст"""
+        with self._id_lock:
+            self.context_start = self._next_id
+        self._queue.put(('meta', ('context_start', str(self.context_start))))
+
+    def load_page(self, before_id: Optional[int] = None, limit: int = 100) -> List[HistoryRecord]:
+        """
+        Страница сообщений текущего разговора старше before_id
+        (по умолчанию - последние), в хронологическом порядке
+        """
+        if before_id is None:
+            before_id = self._next_id
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT id, role, content, created_at FROM messages "
+                "WHERE id < ? AND id >= ? ORDER BY id DESC LIMIT ?",
+                (before_id, self.context_start, limit)
+            ).fetchall()
+        return [HistoryRecord(*row) for row in reversed(rows)]
+
+    def load_context(self, limit: int = 50) -> List[Dict[str, str]]:
+        """
+        Последние сообщения текущего разговора для восстановления контекста модели.
+        Запросы, оставшиеся без ответа (прерванные до первого токена или
+        при ошибке), пропускаются, чтобы не было двух запросов пользователя подряд
+        """
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT role, content FROM messages "
+                f"WHERE id >= ? AND role IN ({','.join('?' * len(CONTEXT_ROLES))}) "
+                "ORDER BY id DESC LIMIT ?",
+                (self.context_start, *CONTEXT_ROLES, limit)
+            ).fetchall()
+
+        messages = []
+        next_role = None
+        # rows идут от новых к старым: next_role - роль следующего по времени сообщения
+        for role, content in rows:
+            if role == 'user' and next_role in ('user', None):
+                continue
+            messages.append({'role': role, 'content': content})
+            next_role = role
+        messages.reverse()
+        return messages
+
+    def search(self, query: str, limit: int = 50) -> List[HistoryRecord]:
+        """
+        Поиск по всему архиву: все слова запроса по префиксу,
+        по убыванию релевантности (bm25), при равенстве - более новые
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        # Сообщения из еще не записанной пачки тоже должны находиться
+        if self.pending_writes:
+            self.flush(timeout=1.0)
+
+        with self._read_lock:
+            if self.fts_enabled:
+                match = ' '.join(f'"{term}"*' for term in terms)
+                rows = self._read_conn.execute(
+                    "SELECT m.id, m.role, m.content, m.created_at FROM messages_fts "
+                    "JOIN messages AS m ON m.id = messages_fts.rowid "
+                    "WHERE messages_fts MATCH ? "
+                    "ORDER BY bm25(messages_fts), m.id DESC LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+            else:
+                # Без FTS5: поиск подстрок просмотром таблицы
+                conditions = ' AND '.join("fold(content) LIKE ?" for _ in terms)
+                rows = self._read_conn.execute(
+                    "SELECT id, role, content, created_at FROM messages "
+                    f"WHERE {conditions} ORDER BY id DESC LIMIT ?",
+                    (*[f"%{term}%" for term in terms], limit)
+                ).fetchall()
+        return [HistoryRecord(*row) for row in rows]
+
+    def count(self) -> int:
+        """Число сообщений в архиве (включая еще не записанные)"""
+        return self._next_id - 1
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Дожидается записи всех поставленных в очередь сообщений"""
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Дописывает очередь и закрывает базу"""
+        if not self._writer.is_alive():
+            return
+        self._queue.put(('stop', None))
+        self._writer.join(timeout=10)
+        with self._read_lock:
+            self._read_conn.close()
+        logger.info(f"История чата закрыта, записано сообщений: {self.written}")
+
+    def _init_fts(self) -> bool:
+        """Создает полнотекстовый индекс и дописывает в него непроиндексированные сообщения"""
+        try:
+            self._read_conn.executescript(FTS_SCHEMA)
+            with self._read_conn:
+                cursor = self._read_conn.execute(
+                    "INSERT INTO messages_fts (rowid, content) "
+                    "SELECT id, fold(content) FROM messages "
+                    "WHERE id > (SELECT COALESCE(MAX(rowid), 0) FROM messages_fts)"
+                )
+            if cursor.rowcount > 0:
+                logger.info(f"Проиндексировано сообщений истории: {cursor.rowcount}")
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 недоступен, поиск по истории будет медленным: {e}")
+            return False
+
+    def _get_meta(self, key: str, default: str) -> str:
+        with self._read_lock:
+            row = self._read_conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _writer_loop(self) -> None:
+        """Поток записи: собирает операции в пачку и пишет одной транзакцией"""
+        conn = self._connect()
+        stopping = False
+
+        while not stopping:
+            operation, payload = self._queue.get()
+            batch = [(operation, payload)]
+
+            # Добираем пачку: все, что пришло за flush_interval, но не больше batch_size
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and operation not in ('flush', 'stop'):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    operation, payload = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append((operation, payload))
+
+            waiters = []
+            try:
+                with conn:
+                    for operation, payload in batch:
+                        if operation == 'insert':
+                            conn.execute(
+                                "INSERT INTO messages (id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                                (payload.id, payload.role, payload.content, payload.created_at)
+                            )
+                            if self.fts_enabled:
+                                conn.execute(
+                                    "INSERT INTO messages_fts (rowid, content) VALUES (?, ?)",
+                                    (payload.id, fold_text(payload.content))
+                                )
+                            self.written += 1
+                        elif operation == 'meta':
+                            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", payload)
+                        elif operation == 'flush':
+                            waiters.append(payload)
+                        elif operation == 'stop':
+                            stopping = True
+            except Exception as e:
+                logger.error(f"Ошибка записи истории чата: {e}")
+
+            # Пачка записана или потеряна: ждать ее больше не нужно
+            with self._id_lock:
+                self.pending_writes -= sum(1 for operation, _ in batch if operation == 'insert')
+
+            for waiter in waiters:
+                waiter.set()
+
+        conn.close()
+
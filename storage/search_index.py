@@ -0,0 +1,121 @@
+"""
+Поиск по тексту сообщений: нормализация слов и инвертированный индекс в памяти
+"""
+
+import re
+import math
+import bisect
+import heapq
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def fold_text(text: str) -> str:
+    """Приводит текст к виду для поиска: нижний регистр, ё → е"""
+    return text.lower().replace('ё', 'е')
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова текста в нормализованном виде"""
+    return WORD_PATTERN.findall(fold_text(text))
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс: слово → документы с числом вхождений.
+    Слова запроса ищутся по префиксу (поиск по мере набора),
+    документ должен содержать все слова запроса
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.documents: Dict[int, Counter] = {}
+        # Отсортированный словарь для поиска по префиксу; пересобирается лениво
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+
+    def add(self, doc_id: int, text: str) -> None:
+        """Индексирует документ (повторное добавление заменяет старый текст)"""
+        if doc_id in self.documents:
+            self.remove(doc_id)
+
+        counts = Counter(tokenize(text))
+        self.documents[doc_id] = counts
+        for token, count in counts.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                self._vocabulary_dirty = True
+            postings[doc_id] = count
+
+    def remove(self, doc_id: int) -> None:
+        """Удаляет документ из индекса"""
+        counts = self.documents.pop(doc_id, None)
+        if counts is None:
+            return
+        for token in counts:
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[token]
+                self._vocabulary_dirty = True
+
+    def clear(self) -> None:
+        self.postings.clear()
+        self.documents.clear()
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[int, float]]:
+        """
+        Документы, содержащие все слова запроса (по префиксу), по убыванию
+        релевантности (tf-idf), при равенстве - более новые первыми
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        total = max(1, len(self.documents))
+        scores: Dict[int, float] = {}
+        matched: Set[int] = set()
+
+        for position, term in enumerate(terms):
+            term_scores: Dict[int, float] = {}
+            for token in self._expand(term):
+                postings = self.postings[token]
+                idf = math.log(1 + total / len(postings))
+                for doc_id, count in postings.items():
+                    score = (1 + math.log(count)) * idf
+                    if score > term_scores.get(doc_id, 0.0):
+                        term_scores[doc_id] = score
+
+            docs = set(term_scores)
+            matched = docs if position == 0 else matched & docs
+            if not matched:
+                return []
+            for doc_id in matched:
+                scores[doc_id] = scores.get(doc_id, 0.0) + term_scores[doc_id]
+
+        ranked = heapq.nsmallest(limit, matched, key=lambda doc_id: (-scores[doc_id], -doc_id))
+        return [(doc_id, scores[doc_id]) for doc_id in ranked]
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _expand(self, prefix: str) -> List[str]:
+        """Слова словаря, начинающиеся с prefix"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self.postings)
+            self._vocabulary_dirty = False
+
+        vocabulary = self._vocabulary
+        position = bisect.bisect_left(vocabulary, prefix)
+        tokens = []
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            tokens.append(vocabulary[position])
+            position += 1
+        return tokens
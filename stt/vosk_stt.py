@@ -4,27 +4,34 @@
 
 import os
 import json
+import time
 import queue
 import threading
 import pyaudio
 import vosk
 import urllib.request
 import zipfile
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict, Tuple
 from config.config_manager import config
 from utils.logger import logger
+from utils.tracing import tracer
+from utils.audio_utils import VoiceActivityDetector, SpeechGate
 
 
 class VoskSTT:
     """Класс для работы с Vosk STT"""
     
-    def __init__(self):
+    def __init__(self, init_microphone: bool = True):
         self.model = None
         self.recognizer = None
         self.microphone = None
-        self.audio_queue = queue.Queue()
         self.is_listening = False
         self.is_recording = False
+        self.processing_thread: Optional[threading.Thread] = None
+        
+        # Без микрофона доступно только распознавание файлов (бенчмарки, сервер)
+        self.init_microphone = init_microphone
+        self.ready = threading.Event()
         
         # Настройки из конфигурации
         self.model_path = config.get('stt.model_path', 'models/vosk-model-ru-0.42')
@@ -33,10 +40,42 @@ class VoskSTT:
         self.chunk_size = config.get('stt.chunk_size', 4096)
         self.auto_download = config.get('stt.auto_download', True)
         
+        # Ограниченная очередь между callback PyAudio и распознаванием.
+        # При переполнении выбрасываются самые старые блоки: задержка
+        # распознавания не растет, а память ограничена.
+        # Элемент: блок PCM16 и момент его получения (time.monotonic)
+        self.audio_queue: "queue.Queue[Optional[Tuple[bytes, float]]]" = queue.Queue(
+            maxsize=config.get('stt.queue_size', 50)
+        )
+        self.received_chunks = 0
+        self.dropped_chunks = 0
+        
+        # Момент получения последнего блока, в котором распознавание продвинулось:
+        # приблизительный конец речи, если VAD-шлюз выключен
+        self.last_partial_text = ""
+        self.last_voice_time: Optional[float] = None
+        
+        # Необязательный VAD-шлюз: в тишине распознаватель не получает аудио
+        self.speech_gate: Optional[SpeechGate] = None
+        if config.get('stt.vad_enabled', False):
+            # audio.vad_threshold задается ползунком 0-100%, где 100% соответствует RMS 0.1
+            detector = VoiceActivityDetector(
+                threshold=config.get('audio.vad_threshold', 0.3) * 0.1,
+                window_size=int(self.sample_rate * 0.03)
+            )
+            self.speech_gate = SpeechGate(
+                detector,
+                sample_rate=self.sample_rate,
+                pre_roll=config.get('stt.vad_pre_roll', 0.5),
+                silence_timeout=config.get('audio.silence_timeout', 2.0),
+                min_speech_duration=config.get('audio.min_speech_duration', 0.5)
+            )
+        
         # Callbacks
         self.on_partial_result: Optional[Callable[[str], None]] = None
         self.on_final_result: Optional[Callable[[str], None]] = None
         self.on_error: Optional[Callable[[str], None]] = None
+        self.on_ready: Optional[Callable[[bool], None]] = None
         
         logger.info(f"Vosk STT инициализирован. Модель: {self.model_path}")
         
@@ -54,12 +93,22 @@ class VoskSTT:
             self._load_model()
             
             # Инициализируем микрофон
-            self._init_microphone()
+            if self.init_microphone:
+                self._init_microphone()
             
             logger.info("Vosk STT успешно инициализирован")
             
         except Exception as e:
             logger.error(f"Ошибка инициализации Vosk STT: {e}")
+        finally:
+            self.ready.set()
+            if self.on_ready:
+                self.on_ready(self.is_available())
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Ожидает окончания инициализации и возвращает готовность модели"""
+        self.ready.wait(timeout)
+        return self.model is not None and self.recognizer is not None
     
     def _ensure_model(self) -> bool:
         """Проверяет наличие модели и скачивает при необходимости"""
@@ -164,6 +213,24 @@ class VoskSTT:
         try:
             logger.info("Начинаем прослушивание...")
             
+            # Дожидаемся завершения обработчика предыдущей сессии
+            if self.processing_thread is not None and self.processing_thread.is_alive():
+                self.processing_thread.join(timeout=1.0)
+                if self.processing_thread.is_alive():
+                    # Он еще распознает блок: очистка очереди удалила бы его сигнал
+                    # остановки, и два обработчика делили бы один распознаватель
+                    logger.warning("Обработка предыдущей сессии еще не завершена, повторите позже")
+                    return False
+            
+            # Сбрасываем остатки предыдущей сессии
+            self._drain_queue()
+            self.received_chunks = 0
+            self.dropped_chunks = 0
+            self.last_partial_text = ""
+            self.last_voice_time = None
+            if self.speech_gate is not None:
+                self.speech_gate.reset()
+            
             # Открываем поток аудио
             self.audio_stream = self.microphone.open(
                 format=pyaudio.paInt16,
@@ -178,7 +245,8 @@ class VoskSTT:
             self.audio_stream.start_stream()
             
             # Запускаем обработку аудио в отдельном потоке
-            threading.Thread(target=self._process_audio, daemon=True).start()
+            self.processing_thread = threading.Thread(target=self._process_audio, daemon=True)
+            self.processing_thread.start()
             
             logger.info("Прослушивание активировано")
             return True
@@ -201,51 +269,140 @@ class VoskSTT:
                 self.audio_stream.stop_stream()
                 self.audio_stream.close()
             
-            logger.info("Прослушивание остановлено")
+            # Будим поток обработки, ожидающий данных
+            self._put_chunk(None)
+            
+            logger.info(
+                f"Прослушивание остановлено. Получено блоков: {self.received_chunks}, "
+                f"отброшено: {self.dropped_chunks}"
+            )
+            if self.speech_gate is not None:
+                logger.info(
+                    f"VAD: в распознаватель передано {self.speech_gate.passed_time:.1f} с, "
+                    f"пропущено тишины {self.speech_gate.skipped_time:.1f} с"
+                )
             
         except Exception as e:
             logger.error(f"Ошибка остановки прослушивания: {e}")
     
     def _audio_callback(self, in_data, frame_count, time_info, status):
-        """Callback для получения аудио данных"""
+        """Callback для получения аудио данных (не блокируется)"""
         if self.is_listening:
-            self.audio_queue.put(in_data)
+            self.received_chunks += 1
+            self._put_chunk((in_data, time.monotonic()))
         return (None, pyaudio.paContinue)
     
+    def _put_chunk(self, audio_data: Optional[Tuple[bytes, float]]) -> None:
+        """Кладет блок в очередь, при переполнении выбрасывая самый старый"""
+        while True:
+            try:
+                self.audio_queue.put_nowait(audio_data)
+                return
+            except queue.Full:
+                try:
+                    self.audio_queue.get_nowait()
+                    self.dropped_chunks += 1
+                except queue.Empty:
+                    pass
+    
+    def _drain_queue(self) -> None:
+        """Очищает очередь аудио"""
+        try:
+            while True:
+                self.audio_queue.get_nowait()
+        except queue.Empty:
+            pass
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Возвращает счетчики очереди аудио"""
+        return {
+            'received_chunks': self.received_chunks,
+            'dropped_chunks': self.dropped_chunks,
+            'queued_chunks': self.audio_queue.qsize()
+        }
+    
     def _process_audio(self) -> None:
         """Обрабатывает аудио данные из очереди"""
         while self.is_listening:
             try:
-                # Получаем аудио данные
-                if not self.audio_queue.empty():
-                    audio_data = self.audio_queue.get(timeout=0.1)
-                    
-                    # Отправляем в распознаватель
-                    if self.recognizer.AcceptWaveform(audio_data):
-                        # Финальный результат
-                        result = json.loads(self.recognizer.Result())
-                        text = result.get('text', '').strip()
-                        
-                        if text and self.on_final_result:
-                            self.on_final_result(text)
-                    else:
-                        # Частичный результат
-                        partial = json.loads(self.recognizer.PartialResult())
-                        text = partial.get('partial', '').strip()
+                # Ждем данные без активного опроса; None - сигнал остановки
+                item = self.audio_queue.get()
+                if item is None:
+                    break
+                audio_data, received_at = item
+                
+                if self.speech_gate is None:
+                    self._accept_audio(audio_data, received_at)
+                    continue
+                
+                # Через VAD-шлюз: в распознаватель попадает только речь с предзаписью
+                chunks, event = self.speech_gate.process(audio_data)
+                for chunk in chunks:
+                    self._accept_audio(chunk, received_at)
+                
+                if event == 'end':
+                    # Конец фразы по таймауту тишины: забираем остаток результата.
+                    # Речь закончилась раньше на накопленную тишину
+                    decode_start = time.monotonic()
+                    result = json.loads(self.recognizer.FinalResult())
+                    speech_end = received_at - self.speech_gate.silence_time
+                    self._emit_final(result.get('text', '').strip(), decode_start, speech_end)
+                elif event == 'discard':
+                    # Слишком короткий звук - считаем шумом
+                    self.recognizer.Reset()
+                    self.last_partial_text = ""
+                    self.last_voice_time = None
                         
-                        if text and self.on_partial_result:
-                            self.on_partial_result(text)
-                            
-            except queue.Empty:
-                continue
             except Exception as e:
                 logger.error(f"Ошибка обработки аудио: {e}")
                 if self.on_error:
                     self.on_error(str(e))
     
+    def _accept_audio(self, audio_data: bytes, received_at: float) -> None:
+        """Передает блок в распознаватель и рассылает результаты"""
+        decode_start = time.monotonic()
+        if self.recognizer.AcceptWaveform(audio_data):
+            # Финальный результат (конечная точка Vosk)
+            result = json.loads(self.recognizer.Result())
+            self._emit_final(result.get('text', '').strip(), decode_start, self.last_voice_time)
+        else:
+            # Частичный результат
+            partial = json.loads(self.recognizer.PartialResult())
+            text = partial.get('partial', '').strip()
+            
+            if text != self.last_partial_text:
+                # Распознавание продвинулось: в этом блоке еще звучала речь
+                self.last_partial_text = text
+                self.last_voice_time = received_at
+            
+            if text and self.on_partial_result:
+                self.on_partial_result(text)
+    
+    def _emit_final(self, text: str, decode_start: float, speech_end: Optional[float] = None) -> None:
+        """
+        Рассылает финальный результат. Ход разговора начинается с конца речи
+        (speech_end), а не с выдачи результата: ожидание конечной точки и
+        таймаута тишины входит в задержку, которую замечает пользователь
+        """
+        self.last_partial_text = ""
+        self.last_voice_time = None
+        if not text:
+            return
+        
+        final_time = time.monotonic()
+        turn = tracer.start_turn('voice', start=speech_end if speech_end is not None else decode_start)
+        if turn is not None:
+            turn.add_span('stt_decode', decode_start, final_time)
+            turn.mark('stt_final', final_time)
+            turn.set('stt_chars', len(text))
+        
+        if self.on_final_result:
+            self.on_final_result(text)
+    
     def recognize_file(self, audio_file: str) -> Optional[str]:
         """Распознает речь из аудио файла"""
-        if not self.is_available():
+        # Микрофон для распознавания файла не нужен, достаточно модели
+        if self.model is None:
             logger.error("STT не готов к работе")
             return None
         
@@ -260,6 +417,8 @@ class VoskSTT:
             if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getframerate() != self.sample_rate:
                 logger.warning(f"Параметры файла не оптимальны. Нужно: 1 канал, 16 бит, {self.sample_rate} Hz")
             
+            # Отдельный распознаватель: не мешаем прослушиванию микрофона
+            recognizer = vosk.KaldiRecognizer(self.model, wf.getframerate())
             results = []
             
             # Читаем и обрабатываем файл по частям
@@ -268,14 +427,14 @@ class VoskSTT:
                 if len(data) == 0:
                     break
                 
-                if self.recognizer.AcceptWaveform(data):
-                    result = json.loads(self.recognizer.Result())
+                if recognizer.AcceptWaveform(data):
+                    result = json.loads(recognizer.Result())
                     text = result.get('text', '').strip()
                     if text:
                         results.append(text)
             
             # Получаем финальный результат
-            final_result = json.loads(self.recognizer.FinalResult())
+            final_result = json.loads(recognizer.FinalResult())
             text = final_result.get('text', '').strip()
             if text:
                 results.append(text)
@@ -294,11 +453,20 @@ class VoskSTT:
     def set_callbacks(self, 
                      on_partial: Optional[Callable[[str], None]] = None,
                      on_final: Optional[Callable[[str], None]] = None,
-                     on_error: Optional[Callable[[str], None]] = None) -> None:
-        """Устанавливает callback функции"""
+                     on_error: Optional[Callable[[str], None]] = None,
+                     on_ready: Optional[Callable[[bool], None]] = None) -> None:
+        """
+        Устанавливает callback функции. Они вызываются из потоков распознавания
+        и инициализации, а не из потока GUI
+        """
         self.on_partial_result = on_partial
         self.on_final_result = on_final
         self.on_error = on_error
+        self.on_ready = on_ready
+        
+        # Инициализация могла закончиться до подписки
+        if on_ready and self.ready.is_set():
+            on_ready(self.is_available())
     
     def test_microphone(self) -> bool:
         """Тестирует микрофон"""
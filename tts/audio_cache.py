@@ -0,0 +1,189 @@
+"""
+Кэш синтезированных фраз: LRU в памяти и ограниченное по размеру хранилище на диске
+"""
+
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from utils.logger import logger
+
+
+class AudioCache:
+    """Контентно-адресуемый кэш аудио (ключ - хэш текста и параметров синтеза)"""
+
+    def __init__(self,
+                 cache_dir: str = "cache/tts",
+                 max_disk_bytes: int = 200 * 1024 * 1024,
+                 max_memory_items: int = 64,
+                 dtype: str = "int16"):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_items = max_memory_items
+        self.dtype = np.int16 if dtype == "int16" else np.float32
+
+        self.memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.disk_usage = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # Запись на диск идет в фоне, чтобы не задерживать воспроизведение
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts-cache')
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.disk_usage = sum(
+                entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and entry.name.endswith('.npy')
+            )
+        except Exception as e:
+            logger.error(f"Ошибка инициализации кэша TTS: {e}")
+
+    @staticmethod
+    def make_key(text: str, **params) -> str:
+        """Формирует ключ из текста и параметров синтеза"""
+        payload = json.dumps({'text': text, **params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Возвращает аудио (float32) из кэша или None"""
+        with self._lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return audio
+
+        path = self._path(key)
+        try:
+            stored = np.load(path, allow_pickle=False)
+            # Обновляем время доступа: по нему вытесняются старые файлы
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Поврежденная запись кэша TTS {key[:12]}: {e}")
+            self._remove_file(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        audio = self._from_storage(stored)
+        with self._lock:
+            self.hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: np.ndarray) -> None:
+        """Сохраняет аудио в памяти сразу, а на диске - в фоновом потоке"""
+        audio = np.asarray(audio, dtype=np.float32)
+        with self._lock:
+            self._remember(key, audio)
+        try:
+            self._writer.submit(self._write_file, key, audio)
+        except RuntimeError:
+            # Кэш уже закрыт: фраза остается только в памяти
+            pass
+
+    def close(self) -> None:
+        """Дописывает поставленные в очередь файлы"""
+        self._writer.shutdown(wait=True)
+
+    def _write_file(self, key: str, audio: np.ndarray) -> None:
+        """Записывает аудио на диск и вытесняет старые файлы при превышении лимита"""
+        path = self._path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            # Пишем во временный файл и атомарно переименовываем
+            with open(temp_path, 'wb') as f:
+                np.save(f, self._to_storage(audio), allow_pickle=False)
+            size = os.path.getsize(temp_path)
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+
+            with self._lock:
+                self.disk_usage += size - replaced
+                over_limit = self.disk_usage > self.max_disk_bytes
+
+            if over_limit:
+                self._evict()
+
+        except Exception as e:
+            logger.error(f"Ошибка записи в кэш TTS: {e}")
+            self._remove_file(temp_path)
+
+    def clear(self) -> None:
+        """Очищает кэш в памяти и на диске"""
+        with self._lock:
+            self.memory.clear()
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.npy'):
+                self._remove_file(entry.path)
+        with self._lock:
+            self.disk_usage = 0
+        logger.info("Кэш TTS очищен")
+
+    def _remember(self, key: str, audio: np.ndarray) -> None:
+        """Кладет аудио в LRU в памяти (вызывается под блокировкой)"""
+        self.memory[key] = audio
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict(self) -> None:
+        """Удаляет давно не использованные файлы, пока кэш не станет меньше лимита"""
+        try:
+            entries = sorted(
+                (entry for entry in os.scandir(self.cache_dir)
+                 if entry.is_file() and entry.name.endswith('.npy')),
+                key=lambda entry: entry.stat().st_mtime
+            )
+        except Exception as e:
+            logger.error(f"Ошибка вытеснения из кэша TTS: {e}")
+            return
+
+        # Оставляем запас 10%, чтобы не вытеснять на каждой записи
+        target = int(self.max_disk_bytes * 0.9)
+        removed = 0
+        for entry in entries:
+            with self._lock:
+                if self.disk_usage <= target:
+                    break
+            size = entry.stat().st_size
+            if self._remove_file(entry.path):
+                with self._lock:
+                    self.disk_usage -= size
+                removed += 1
+
+        logger.info(f"Из кэша TTS вытеснено файлов: {removed}")
+
+    def _to_storage(self, audio: np.ndarray) -> np.ndarray:
+        """Преобразует аудио к формату хранения"""
+        if self.dtype == np.int16:
+            return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        return audio
+
+    @staticmethod
+    def _from_storage(stored: np.ndarray) -> np.ndarray:
+        """Преобразует сохраненное аудио обратно в float32"""
+        if stored.dtype == np.int16:
+            return stored.astype(np.float32) / 32767
+        return stored.astype(np.float32, copy=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    @staticmethod
+    def _remove_file(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
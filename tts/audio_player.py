@@ -0,0 +1,361 @@
+"""
+Потоковый вывод звука: постоянный аудиопоток с кольцевым буфером,
+очередью высказываний без пауз между ними и отменой отдельных высказываний
+"""
+
+import time
+import itertools
+import threading
+import numpy as np
+import sounddevice as sd
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+from utils.logger import logger
+
+
+class _Utterance:
+    """Участок кольцевого буфера, занятый одним высказыванием"""
+
+    __slots__ = ('utt_id', 'start', 'end', 'closing', 'begin_time', 'first_play_time', 'done')
+
+    def __init__(self, utt_id: int, start: Optional[int]):
+        self.utt_id = utt_id
+        self.start = start  # None, пока впереди в очереди есть незакрытое высказывание
+        self.end: Optional[int] = None  # известен после end_utterance
+        self.closing = False  # end_utterance вызван до начала записи
+        self.begin_time = time.monotonic()
+        self.first_play_time: Optional[float] = None
+        self.done = threading.Event()
+
+
+class AudioPlayer:
+    """
+    Проигрыватель поверх одного sd.OutputStream.
+
+    Кольцевой буфер с одним читателем (callback аудиопотока) и одним писателем:
+    индексы чтения и записи абсолютные и монотонные, каждый изменяется только
+    своей стороной, поэтому callback работает без блокировок. Очередь
+    высказываний меняют только писатели под _write_lock; callback снимает
+    доигранные высказывания со своей очереди play_queue и лишь помечает их
+    завершенными, а из segments их убирают писатели. Запись разных
+    высказываний упорядочивается блокировкой на стороне писателей: в буфер
+    пишет только самое раннее незакрытое высказывание, а следующие ждут в
+    очереди, пока предыдущее не будет закрыто или отменено.
+    """
+
+    def __init__(self,
+                 sample_rate: int = 48000,
+                 buffer_seconds: float = 30.0,
+                 blocksize: int = 0,
+                 latency: Any = 'low'):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.latency = latency
+
+        self.capacity = max(1, int(sample_rate * buffer_seconds))
+        self.buffer = np.zeros(self.capacity, dtype=np.float32)
+        self.read_index = 0
+        self.write_index = 0
+
+        self.segments: Deque[_Utterance] = deque()
+        # Очередь воспроизведения: писатели только добавляют, callback только снимает с головы
+        self.play_queue: Deque[_Utterance] = deque()
+        self.segments_by_id: Dict[int, _Utterance] = {}
+        self.cancelled: Set[int] = set()
+        # Недавно отмененные: отмена видна и после снятия высказывания с очереди
+        self.recent_cancelled: Deque[int] = deque(maxlen=64)
+
+        # Статистика
+        self.underruns = 0
+        self.underrun_frames = 0
+        self.device_underflows = 0
+        self.played_frames = 0
+        self.latencies: Deque[Tuple[int, float, float]] = deque(maxlen=64)
+
+        self.stream: Optional[sd.OutputStream] = None
+        self._ids = itertools.count(1)
+        self._write_lock = threading.Lock()
+        self._stream_lock = threading.Lock()
+        self._space_event = threading.Event()
+
+    def begin_utterance(self) -> int:
+        """Открывает новое высказывание в конце очереди и возвращает его id"""
+        if not self._ensure_stream():
+            # Без аудиопотока высказывание сразу считается завершенным
+            return next(self._ids)
+
+        with self._write_lock:
+            self._collect_finished()
+            # Высказывания идут в буфере подряд: за незакрытым предыдущим новое ждет своей очереди
+            if self.segments and self.segments[-1].end is None:
+                start = None
+            else:
+                start = self.write_index
+
+            utterance = _Utterance(next(self._ids), start)
+            self.segments_by_id[utterance.utt_id] = utterance
+            self.segments.append(utterance)
+            self.play_queue.append(utterance)
+
+        return utterance.utt_id
+
+    def write(self, utt_id: int, audio: np.ndarray, timeout: Optional[float] = None) -> bool:
+        """
+        Дописывает аудио высказывания. Блокируется, пока в буфере нет места
+        или пока не закрыто предыдущее высказывание. Возвращает False,
+        если высказывание отменено или поток вывода недоступен
+        """
+        data = np.asarray(audio, dtype=np.float32).reshape(-1)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        position = 0
+
+        while position < len(data):
+            if utt_id in self.cancelled or self.stream is None:
+                return False
+
+            self._space_event.clear()
+            with self._write_lock:
+                utterance = self.segments_by_id.get(utt_id)
+                if utterance is None or utterance.end is not None or utterance.closing:
+                    logger.warning(f"Запись в закрытое высказывание {utt_id}")
+                    return False
+
+                if utterance.start is None:
+                    # Еще пишется предыдущее высказывание
+                    free = 0
+                else:
+                    free = self.capacity - (self.write_index - self.read_index)
+                count = min(free, len(data) - position)
+                if count > 0:
+                    self._copy_in(data[position:position + count])
+                    # Индекс публикуется после копирования данных
+                    self.write_index += count
+                    position += count
+                    continue
+
+            # Буфер заполнен или очередь высказывания еще не подошла
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            self._space_event.wait(0.05)
+
+        return True
+
+    def end_utterance(self, utt_id: int) -> None:
+        """Сообщает, что данных высказывания больше не будет"""
+        with self._write_lock:
+            utterance = self.segments_by_id.get(utt_id)
+            if utterance is None or utterance.end is not None:
+                return
+            if utterance.start is None:
+                utterance.closing = True
+                return
+            utterance.end = self.write_index
+            self._collect_finished()
+            self._start_next()
+        self._space_event.set()
+
+    def cancel(self, utt_id: int) -> None:
+        """Отменяет высказывание: его данные пропускаются при воспроизведении"""
+        utterance = self.segments_by_id.get(utt_id)
+        if utterance is None:
+            return
+        self.cancelled.add(utt_id)
+        self.recent_cancelled.append(utt_id)
+        self._space_event.set()
+
+        # Без аудиопотока пропускать данные некому
+        if self.stream is None:
+            utterance.done.set()
+
+    def cancel_all(self) -> None:
+        """Отменяет все высказывания в очереди"""
+        with self._write_lock:
+            self._collect_finished()
+            utt_ids = [utterance.utt_id for utterance in self.segments]
+        for utt_id in utt_ids:
+            self.cancel(utt_id)
+
+    def is_cancelled(self, utt_id: int) -> bool:
+        """Проверяет, отменено ли высказывание"""
+        return utt_id in self.cancelled or utt_id in self.recent_cancelled
+
+    def is_busy(self) -> bool:
+        """Есть ли неотмененные высказывания в очереди"""
+        with self._write_lock:
+            self._collect_finished()
+            return any(utterance.utt_id not in self.cancelled for utterance in self.segments)
+
+    def wait(self, utt_id: int, timeout: Optional[float] = None) -> bool:
+        """Ожидает окончания воспроизведения (или отмены) высказывания"""
+        utterance = self.segments_by_id.get(utt_id)
+        if utterance is None:
+            return True
+        return utterance.done.wait(timeout)
+
+    def get_latency(self, utt_id: int) -> Optional[float]:
+        """Время от begin_utterance до первого звука высказывания"""
+        timing = self._get_timing(utt_id)
+        return timing[1] - timing[0] if timing is not None else None
+
+    def get_first_play_time(self, utt_id: int) -> Optional[float]:
+        """Момент (time.monotonic) начала воспроизведения высказывания"""
+        timing = self._get_timing(utt_id)
+        return timing[1] if timing is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику воспроизведения"""
+        return {
+            'underruns': self.underruns,
+            'underrun_frames': self.underrun_frames,
+            'device_underflows': self.device_underflows,
+            'played_frames': self.played_frames,
+            'buffered_frames': self.write_index - self.read_index,
+            'queued_utterances': len(self.play_queue)
+        }
+
+    def close(self) -> None:
+        """Отменяет воспроизведение и закрывает аудиопоток"""
+        self.cancel_all()
+        with self._stream_lock:
+            stream = self.stream
+            self.stream = None
+        if stream is not None:
+            try:
+                stream.abort()
+                stream.close()
+            except Exception as e:
+                logger.error(f"Ошибка закрытия аудиопотока: {e}")
+
+        # Высказывания, которые больше некому доиграть
+        with self._write_lock:
+            for utterance in self.segments:
+                utterance.done.set()
+            self.segments.clear()
+            self.play_queue.clear()
+            self.segments_by_id.clear()
+            self.cancelled.clear()
+            self.read_index = self.write_index
+
+        logger.info(f"Аудиопоток закрыт. Статистика: {self.get_stats()}")
+
+    def _ensure_stream(self) -> bool:
+        """Открывает аудиопоток при первом использовании"""
+        with self._stream_lock:
+            if self.stream is not None:
+                return True
+            try:
+                stream = sd.OutputStream(
+                    samplerate=self.sample_rate,
+                    channels=1,
+                    dtype='float32',
+                    blocksize=self.blocksize,
+                    latency=self.latency,
+                    callback=self._callback
+                )
+                stream.start()
+                self.stream = stream
+                logger.info(f"Аудиопоток вывода открыт: {self.sample_rate} Гц, задержка {stream.latency:.3f} с")
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка открытия аудиопотока: {e}")
+                return False
+
+    def _collect_finished(self) -> None:
+        """Убирает доигранные callback-ом высказывания с головы очереди (под _write_lock)"""
+        while self.segments and self.segments[0].done.is_set():
+            utterance = self.segments.popleft()
+            self.segments_by_id.pop(utterance.utt_id, None)
+            self.cancelled.discard(utterance.utt_id)
+            if utterance.first_play_time is not None:
+                self.latencies.append((utterance.utt_id, utterance.begin_time, utterance.first_play_time))
+
+    def _get_timing(self, utt_id: int) -> Optional[Tuple[float, float]]:
+        """Моменты begin_utterance и первого звука высказывания"""
+        with self._write_lock:
+            self._collect_finished()
+            utterance = self.segments_by_id.get(utt_id)
+            if utterance is not None:
+                if utterance.first_play_time is None:
+                    return None
+                return utterance.begin_time, utterance.first_play_time
+            for latency_id, begin_time, first_play_time in self.latencies:
+                if latency_id == utt_id:
+                    return begin_time, first_play_time
+        return None
+
+    def _start_next(self) -> None:
+        """Начинает запись высказываний, стоявших за только что закрытым (под _write_lock)"""
+        for utterance in self.segments:
+            if utterance.start is not None:
+                continue
+            utterance.start = self.write_index
+            if not utterance.closing:
+                break
+            # Закрыто, не успев начаться (пустое или отмененное)
+            utterance.end = self.write_index
+
+    def _copy_in(self, data: np.ndarray) -> None:
+        """Копирует данные в буфер с учетом перехода через конец"""
+        position = self.write_index % self.capacity
+        first = min(len(data), self.capacity - position)
+        self.buffer[position:position + first] = data[:first]
+        if first < len(data):
+            self.buffer[:len(data) - first] = data[first:]
+
+    def _copy_out(self, out: np.ndarray, count: int) -> None:
+        """Копирует данные из буфера с учетом перехода через конец"""
+        position = self.read_index % self.capacity
+        first = min(count, self.capacity - position)
+        out[:first] = self.buffer[position:position + first]
+        if first < count:
+            out[first:count] = self.buffer[:count - first]
+
+    def _finish_head(self, utterance: _Utterance) -> None:
+        """Снимает высказывание с головы очереди воспроизведения"""
+        self.play_queue.popleft()
+        utterance.done.set()
+
+    def _callback(self, outdata, frames, time_info, status) -> None:
+        """Callback аудиопотока: без блокировок, логирования и выделения памяти"""
+        if status.output_underflow:
+            self.device_underflows += 1
+
+        out = outdata[:, 0]
+        filled = 0
+
+        while filled < frames and self.play_queue:
+            utterance = self.play_queue[0]
+            write_index = self.write_index
+            end = utterance.end
+
+            if utterance.utt_id in self.cancelled:
+                # Пропускаем уже записанные данные отмененного высказывания
+                self.read_index = max(self.read_index, end if end is not None else write_index)
+                if end is None:
+                    break
+                self._finish_head(utterance)
+                continue
+
+            available = (end if end is not None else write_index) - self.read_index
+            if available <= 0:
+                if end is not None:
+                    self._finish_head(utterance)
+                    continue
+                # Высказывание уже звучит, а следующий фрагмент еще не готов
+                if utterance.first_play_time is not None:
+                    self.underruns += 1
+                    self.underrun_frames += frames - filled
+                break
+
+            if utterance.first_play_time is None:
+                utterance.first_play_time = time.monotonic()
+
+            count = min(available, frames - filled)
+            self._copy_out(out[filled:filled + count], count)
+            self.read_index += count
+            self.played_frames += count
+            filled += count
+
+        out[filled:] = 0
+        if filled:
+            self._space_event.set()
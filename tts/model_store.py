@@ -0,0 +1,212 @@
+"""
+Локальное хранилище моделей Silero TTS: загрузка .pt пакета без torch.hub
+"""
+
+import os
+import json
+import time
+import hashlib
+import zipfile
+import tempfile
+import urllib.request
+from typing import Any, Dict, Optional
+from torch.package import PackageImporter
+from utils.logger import logger
+
+
+# Адреса пакетов моделей (torch.package), которые использует silero-models
+MODEL_URLS = {
+    'v4_ru': 'https://models.silero.ai/models/tts/ru/v4_ru.pt',
+    'v3_1_ru': 'https://models.silero.ai/models/tts/ru/v3_1_ru.pt',
+}
+
+# Закрепленные SHA-256 пакетов (по имени модели). Скачанный пакет модели из
+# этой таблицы принимается только при совпадении суммы; для моделей без записи
+# сумма запоминается при первой загрузке (после проверки целостности архива)
+MODEL_SHA256: Dict[str, str] = {}
+
+# Имя файла с контрольными суммами внутри каталога моделей
+MANIFEST_FILE = 'manifest.json'
+
+
+class ModelStore:
+    """Хранилище .pt пакетов Silero с проверкой контрольной суммы"""
+
+    def __init__(self, models_dir: str = "models/silero", auto_download: bool = True):
+        self.models_dir = models_dir
+        self.auto_download = auto_download
+        self.manifest_path = os.path.join(self.models_dir, MANIFEST_FILE)
+
+    def get_model_path(self, model_name: str) -> str:
+        """Путь к локальному файлу модели"""
+        return os.path.join(self.models_dir, f"{model_name}.pt")
+
+    def load(self, model_name: str, expected_sha256: str = "", url: str = "") -> Optional[Any]:
+        """
+        Загружает модель из локального пакета. Если файла нет, скачивает его
+        (при разрешенной автозагрузке). Контрольная сумма сверяется с заданной
+        в конфигурации, затем с закрепленной в MODEL_SHA256, а если их нет -
+        с записанной при первой загрузке
+        """
+        path = self.get_model_path(model_name)
+
+        if not os.path.exists(path):
+            if not self.auto_download:
+                logger.error(f"Локальная модель TTS не найдена: {path}")
+                return None
+            if not self._download(model_name, path, url, expected_sha256):
+                return None
+
+        start_time = time.monotonic()
+
+        if not self.verify(model_name, expected_sha256):
+            return None
+        verify_time = time.monotonic() - start_time
+
+        try:
+            importer = PackageImporter(path)
+            model = importer.load_pickle("tts_models", "model")
+        except Exception as e:
+            # Например, файл обрезан, а контрольной суммы для сравнения не было
+            logger.error(f"Ошибка чтения пакета модели {path}: {e}")
+            self.quarantine(model_name)
+            return None
+
+        logger.info(
+            f"Модель TTS {model_name} загружена из {path} за {time.monotonic() - start_time:.2f} с "
+            f"(проверка контрольной суммы {verify_time:.2f} с)"
+        )
+        return model
+
+    def verify(self, model_name: str, expected_sha256: str = "") -> bool:
+        """Проверяет контрольную сумму файла модели"""
+        path = self.get_model_path(model_name)
+        expected = self.pinned_sha256(model_name, expected_sha256) or \
+            self._read_manifest().get(f"{model_name}.pt", "")
+
+        actual = self.file_sha256(path)
+        if not expected:
+            # Файл положен вручную: доверяем ему, только если архив цел,
+            # и запоминаем его сумму для следующих проверок
+            if not self.check_archive(path):
+                return False
+            logger.warning(f"Для модели {model_name} нет контрольной суммы, сохраняем текущую: {actual}")
+            self._write_manifest_entry(f"{model_name}.pt", actual)
+            return True
+
+        if actual != expected.lower():
+            logger.error(f"Контрольная сумма модели {model_name} не совпадает: {actual} != {expected}")
+            return False
+
+        return True
+
+    def quarantine(self, model_name: str) -> None:
+        """
+        Переименовывает поврежденный файл модели, чтобы он не загружался снова,
+        и удаляет его контрольную сумму: при следующем запуске модель скачается заново
+        """
+        path = self.get_model_path(model_name)
+        try:
+            os.replace(path, f"{path}.corrupt")
+            logger.warning(f"Поврежденная модель перемещена в {path}.corrupt")
+        except OSError as e:
+            logger.error(f"Не удалось переместить поврежденную модель {path}: {e}")
+        self._write_manifest_entry(f"{model_name}.pt", None)
+
+    @staticmethod
+    def pinned_sha256(model_name: str, expected_sha256: str = "") -> str:
+        """Известная заранее сумма: из конфигурации или из MODEL_SHA256"""
+        return (expected_sha256 or MODEL_SHA256.get(model_name, "")).lower()
+
+    @staticmethod
+    def check_archive(path: str) -> bool:
+        """Проверяет целостность пакета: torch.package - zip-архив с CRC каждого файла"""
+        try:
+            with zipfile.ZipFile(path) as archive:
+                broken = archive.testzip()
+            if broken is not None:
+                logger.error(f"Пакет модели {path} поврежден: {broken}")
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Пакет модели {path} поврежден: {e}")
+            return False
+
+    @staticmethod
+    def file_sha256(path: str) -> str:
+        """Вычисляет SHA-256 файла"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _download(self, model_name: str, path: str, url: str = "", expected_sha256: str = "") -> bool:
+        """Скачивает пакет модели; файл занимает свое место только после проверки"""
+        url = url or MODEL_URLS.get(model_name, "")
+        if not url:
+            logger.error(f"Неизвестная модель TTS {model_name}, укажите tts.model_url")
+            return False
+
+        temp_path = f"{path}.download"
+        try:
+            os.makedirs(self.models_dir, exist_ok=True)
+
+            logger.info(f"Скачиваем модель TTS с {url}")
+            urllib.request.urlretrieve(url, temp_path)
+
+            actual = self.file_sha256(temp_path)
+            expected = self.pinned_sha256(model_name, expected_sha256)
+            if expected and actual != expected:
+                raise ValueError(f"контрольная сумма не совпадает: {actual} != {expected}")
+            if not expected and not self.check_archive(temp_path):
+                raise ValueError("скачанный архив поврежден")
+
+            os.replace(temp_path, path)
+            self._write_manifest_entry(os.path.basename(path), actual)
+            logger.info(f"Модель TTS сохранена: {path}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Ошибка загрузки модели TTS: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+    def _read_manifest(self) -> Dict[str, str]:
+        """Читает сохраненные контрольные суммы"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Ошибка чтения {self.manifest_path}: {e}")
+            return {}
+
+    def _write_manifest_entry(self, file_name: str, sha256: Optional[str]) -> None:
+        """Записывает контрольную сумму файла в манифест (None - удаляет запись)"""
+        manifest = self._read_manifest()
+        if sha256 is None:
+            if manifest.pop(file_name, None) is None:
+                return
+        else:
+            manifest[file_name] = sha256
+
+        temp_file = None
+        try:
+            os.makedirs(self.models_dir, exist_ok=True)
+            # Временный файл рядом и атомарная замена: манифест не бывает записан наполовину
+            fd, temp_file = tempfile.mkstemp(dir=self.models_dir, prefix=MANIFEST_FILE + '.', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp_file, 0o644)
+            os.replace(temp_file, self.manifest_path)
+            temp_file = None
+        except Exception as e:
+            logger.error(f"Ошибка записи {self.manifest_path}: {e}")
+        finally:
+            if temp_file is not None and os.path.exists(temp_file):
+                os.remove(temp_file)
@@ -3,13 +3,24 @@
 """
 
 import os
+import time
 import torch
-import sounddevice as sd
 import numpy as np
 import threading
-from typing import Optional
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
 from config.config_manager import config
 from utils.logger import logger
+from utils.audio_utils import AudioProcessor
+from utils.tracing import tracer
+from .speech_pipeline import SpeechPipeline, split_sentences
+from .audio_cache import AudioCache
+from .model_store import ModelStore
+from .audio_player import AudioPlayer
+
+# Фраза проверки синтеза (настройки), заранее синтезируется в кэш
+TEST_PHRASE = "Привет! Меня зовут Сакура. Проверка синтеза речи."
 
 
 class SileroTTS:
@@ -24,8 +35,49 @@ class SileroTTS:
         self.volume = config.get('tts.volume', 0.8)
         self.speed = config.get('tts.speed', 1.0)
         
-        self.is_playing = False
-        self.current_audio = None
+        self.load_time: Optional[float] = None
+        self.inference_mode = config.get('tts.engine.inference_mode', True)
+        self.engine_report: Dict[str, Any] = {}
+        self.ready = threading.Event()
+        
+        # Локальное хранилище моделей (без torch.hub и сети при наличии файла)
+        self.model_store = ModelStore(
+            models_dir=config.get('tts.models_dir', 'models/silero'),
+            auto_download=config.get('tts.auto_download', True)
+        )
+        self.current_pipeline: Optional[SpeechPipeline] = None
+        
+        # Кэш коротких повторяющихся фраз (приветствия, тестовая фраза и т.п.);
+        # предложения ответов модели не кэшируются, чтобы не вытеснять их
+        self.cache: Optional[AudioCache] = None
+        self.cache_max_text_length = config.get('tts.cache_max_text_length', 200)
+        if config.get('tts.cache_enabled', True):
+            self.cache = AudioCache(
+                cache_dir=config.get('tts.cache_dir', 'cache/tts'),
+                max_disk_bytes=int(config.get('tts.cache_max_mb', 200) * 1024 * 1024),
+                max_memory_items=config.get('tts.cache_memory_items', 64),
+                dtype=config.get('tts.cache_dtype', 'int16')
+            )
+        
+        # Длинный текст синтезируется фрагментами параллельно на пуле потоков
+        self.max_chunk_chars = config.get('tts.max_chunk_chars', 500)
+        self.workers = max(1, config.get('tts.engine.workers', 2))
+        self._configure_threads()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tts')
+        
+        # Постоянный аудиопоток: фрагменты воспроизводятся подряд без пауз
+        self.player = AudioPlayer(
+            sample_rate=self.sample_rate,
+            buffer_seconds=config.get('tts.player_buffer_seconds', 30),
+            blocksize=config.get('tts.player_blocksize', 0),
+            latency=config.get('tts.player_latency', 'low')
+        )
+        
+        # Callbacks (вызываются из фоновых потоков загрузки и озвучивания)
+        self.on_ready: Optional[Callable[[bool], None]] = None
+        self.on_speech_started: Optional[Callable[[int], None]] = None
+        self.on_speech_finished: Optional[Callable[[int, bool], None]] = None
+        self.on_error: Optional[Callable[[str], None]] = None
         
         logger.info(f"Silero TTS инициализирован. Модель: {self.model_name}, Спикер: {self.speaker}")
         
@@ -36,29 +88,229 @@ class SileroTTS:
         """Загружает модель Silero TTS"""
         try:
             logger.info("Загрузка модели Silero TTS...")
+            start_time = time.monotonic()
             
-            # Загружаем модель из torch.hub
-            self.model, example_text = torch.hub.load(
-                repo_or_dir='snakers4/silero-models',
-                model='silero_tts',
-                language='ru',
-                speaker=self.model_name
+            # Сначала локальный пакет из models/
+            model = self.model_store.load(
+                self.model_name,
+                expected_sha256=config.get('tts.model_sha256', ''),
+                url=config.get('tts.model_url', '')
             )
             
-            self.model.to(self.device)
+            if model is None and config.get('tts.allow_hub_fallback', True):
+                logger.warning("Локальная модель недоступна, загружаем через torch.hub")
+                model, example_text = torch.hub.load(
+                    repo_or_dir='snakers4/silero-models',
+                    model='silero_tts',
+                    language='ru',
+                    speaker=self.model_name
+                )
+            
+            if model is None:
+                raise RuntimeError(f"Модель {self.model_name} недоступна")
+            
+            model.to(self.device)
+            self.load_time = time.monotonic() - start_time
             
-            logger.info("Модель Silero TTS успешно загружена")
+            logger.info(f"Модель Silero TTS успешно загружена за {self.load_time:.2f} с")
+            
+            # Модель становится доступной только после оптимизаций и прогрева
+            self.model = self._tune_model(model)
+            self.prefetch([TEST_PHRASE] + list(config.get('tts.prefetch_phrases', [])))
             
         except Exception as e:
             logger.error(f"Ошибка загрузки модели Silero TTS: {e}")
             self.model = None
+        finally:
+            self.ready.set()
+            self.notify('on_ready', self.is_available())
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Ожидает окончания загрузки модели и возвращает ее доступность"""
+        self.ready.wait(timeout)
+        return self.is_available()
+    
+    def set_callbacks(self,
+                      on_ready: Optional[Callable[[bool], None]] = None,
+                      on_speech_started: Optional[Callable[[int], None]] = None,
+                      on_speech_finished: Optional[Callable[[int, bool], None]] = None,
+                      on_error: Optional[Callable[[str], None]] = None) -> None:
+        """
+        Устанавливает callback функции. Они вызываются из фоновых потоков
+        и не должны блокировать озвучивание
+        """
+        self.on_ready = on_ready
+        self.on_speech_started = on_speech_started
+        self.on_speech_finished = on_speech_finished
+        self.on_error = on_error
+        
+        # Модель могла загрузиться до подписки
+        if on_ready and self.ready.is_set():
+            on_ready(self.is_available())
+    
+    def notify(self, name: str, *args) -> None:
+        """Вызывает callback, если он установлен; ошибки подписчика не прерывают озвучивание"""
+        callback = getattr(self, name)
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика {name}: {e}")
+    
+    def _configure_threads(self) -> None:
+        """Задает число потоков torch так, чтобы все воркеры вместе занимали ядра без переподписки"""
+        threads = config.get('tts.engine.threads', 0)
+        if threads <= 0:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+        
+        try:
+            torch.set_num_threads(threads)
+            logger.info(f"TTS: воркеров синтеза {self.workers}, потоков torch {threads}")
+        except Exception as e:
+            logger.error(f"Ошибка настройки потоков torch: {e}")
+    
+    def _inference_context(self):
+        """Контекст выполнения модели без отслеживания градиентов"""
+        return torch.inference_mode() if self.inference_mode else torch.no_grad()
+    
+    def _measure_rtf(self, model: Any, text: str) -> float:
+        """Real-time factor: время синтеза, деленное на длительность полученного аудио"""
+        start_time = time.perf_counter()
+        with self._inference_context():
+            audio = model.apply_tts(text=text, speaker=self.speaker, sample_rate=self.sample_rate)
+        elapsed = time.perf_counter() - start_time
+        return elapsed / max(len(audio) / self.sample_rate, 1e-6)
+    
+    def _tune_model(self, model: Any) -> Any:
+        """Применяет оптимизации из tts.engine и прогревает модель, сообщая RTF до и после"""
+        warmup = config.get('tts.engine.warmup', True)
+        warmup_text = config.get('tts.engine.warmup_text', "Привет! Проверка синтеза речи.")
+        report: Dict[str, Any] = {'optimizations': []}
+        
+        # Внутренний модуль пакета Silero (TorchScript), если он есть
+        inner = getattr(model, 'model', None)
+        original_inner = inner
+        
+        try:
+            if warmup:
+                # Первый вызов включает разовые накладные расходы
+                report['rtf_cold'] = self._measure_rtf(model, warmup_text)
+                report['rtf_before'] = self._measure_rtf(model, warmup_text)
+            
+            if config.get('tts.engine.jit_freeze', False):
+                if isinstance(inner, torch.jit.ScriptModule):
+                    inner = torch.jit.freeze(inner.eval())
+                    model.model = inner
+                    report['optimizations'].append('jit_freeze')
+                else:
+                    logger.warning("JIT freeze доступен только для TorchScript-модели, пропускаем")
+            
+            if warmup:
+                # Оптимизированный TorchScript перекомпилируется на первых вызовах
+                self._measure_rtf(model, warmup_text)
+                report['rtf_after'] = self._measure_rtf(model, warmup_text)
+                
+        except Exception as e:
+            logger.error(f"Ошибка оптимизации модели TTS, используется исходная модель: {e}")
+            if original_inner is not None and inner is not original_inner:
+                model.model = original_inner
+            report['optimizations'] = []
+        
+        self.engine_report = report
+        if 'rtf_after' in report:
+            logger.info(
+                f"RTF синтеза: первый вызов {report['rtf_cold']:.3f}, "
+                f"до настройки {report['rtf_before']:.3f}, после {report['rtf_after']:.3f} "
+                f"(оптимизации: {', '.join(report['optimizations']) or 'нет'}, "
+                f"inference_mode: {self.inference_mode}, потоков torch: {torch.get_num_threads()})"
+            )
+        return model
     
     def is_available(self) -> bool:
         """Проверяет доступность TTS"""
         return self.model is not None
     
-    def synthesize_audio(self, text: str) -> Optional[np.ndarray]:
-        """Синтезирует аудио из текста"""
+    @property
+    def is_playing(self) -> bool:
+        """Идет ли воспроизведение"""
+        return self.player.is_busy()
+    
+    def get_cache_key(self, text: str) -> str:
+        """Ключ кэша: все параметры, влияющие на результат синтеза"""
+        return AudioCache.make_key(
+            text,
+            speaker=self.speaker,
+            sample_rate=self.sample_rate,
+            model=self.model_name,
+            volume=round(self.volume, 3),
+            speed=round(self.speed, 3)
+        )
+    
+    def split_text(self, text: str) -> List[str]:
+        """Делит текст на фрагменты не длиннее max_chunk_chars по границам предложений и фраз"""
+        chunks = []
+        current = ""
+        for sentence in split_sentences(text, max_chars=self.max_chunk_chars):
+            # Первое предложение - отдельным фрагментом, чтобы звук начался быстрее
+            if chunks and current and len(current) + 1 + len(sentence) <= self.max_chunk_chars:
+                current = f"{current} {sentence}"
+                continue
+            if current:
+                chunks.append(current)
+            current = sentence
+            if not chunks:
+                chunks.append(current)
+                current = ""
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def synthesize_chunks(self, text: str, cache: bool = False) -> Iterator[np.ndarray]:
+        """
+        Синтезирует текст фрагментами на пуле потоков и отдает аудио по порядку.
+        Одновременно в работе не больше workers + 1 фрагментов, поэтому память
+        ограничена независимо от длины текста. cache - сохранять фрагменты в кэш
+        """
+        chunks = self.split_text(text)
+        pending: Deque[Future] = deque()
+        next_chunk = 0
+        
+        try:
+            while next_chunk < len(chunks) or pending:
+                while next_chunk < len(chunks) and len(pending) <= self.workers:
+                    pending.append(self.executor.submit(self._synthesize_chunk, chunks[next_chunk], cache))
+                    next_chunk += 1
+                
+                audio = pending.popleft().result()
+                if audio is not None:
+                    yield audio
+        finally:
+            # Генератор закрыт досрочно (отмена): недошедшие до работы фрагменты не синтезируем
+            for future in pending:
+                future.cancel()
+    
+    def synthesize_audio(self, text: str, cache: bool = False) -> Optional[np.ndarray]:
+        """Синтезирует аудио из текста (cache - сохранить результат в кэш)"""
+        if len(text) <= self.max_chunk_chars:
+            return self._synthesize_chunk(text, cache)
+        
+        parts = list(self.synthesize_chunks(text, cache))
+        if not parts:
+            return None
+        return np.concatenate(parts)
+    
+    def _synthesize_chunk(self, text: str, cache: bool = False) -> Optional[np.ndarray]:
+        """Синтезирует один фрагмент текста; в кэш попадает, только если cache=True"""
+        # Короткие фразы сначала ищем в кэше: модель при этом не нужна вовсе
+        cache_key = None
+        if self.cache is not None and len(text) <= self.cache_max_text_length:
+            cache_key = self.get_cache_key(text)
+            audio = self.cache.get(cache_key)
+            if audio is not None:
+                logger.info(f"Речь взята из кэша: {text[:50]}...")
+                return audio
+        
         if not self.is_available():
             logger.error("Модель TTS не загружена")
             return None
@@ -67,11 +319,12 @@ class SileroTTS:
             logger.info(f"Синтез речи: {text[:50]}...")
             
             # Генерируем аудио
-            audio = self.model.apply_tts(
-                text=text,
-                speaker=self.speaker,
-                sample_rate=self.sample_rate
-            )
+            with self._inference_context():
+                audio = self.model.apply_tts(
+                    text=text,
+                    speaker=self.speaker,
+                    sample_rate=self.sample_rate
+                )
             
             # Применяем громкость
             if self.volume != 1.0:
@@ -81,6 +334,15 @@ class SileroTTS:
             if isinstance(audio, torch.Tensor):
                 audio = audio.detach().cpu().numpy()
             
+            # Меняем темп без изменения высоты голоса
+            if abs(self.speed - 1.0) >= 1e-3:
+                stretch_start = time.monotonic()
+                audio = AudioProcessor.time_stretch(audio, self.speed, self.sample_rate)
+                logger.debug(f"Темп речи x{self.speed} применен за {time.monotonic() - stretch_start:.3f} с")
+            
+            if cache and cache_key is not None:
+                self.cache.put(cache_key, audio)
+            
             logger.info("Синтез речи завершен")
             return audio
             
@@ -88,39 +350,59 @@ class SileroTTS:
             logger.error(f"Ошибка синтеза речи: {e}")
             return None
     
-    def speak(self, text: str, blocking: bool = False) -> None:
-        """Озвучивает текст"""
+    def speak(self, text: str, blocking: bool = False, cache: bool = False) -> None:
+        """Озвучивает текст (cache - для повторяющихся системных фраз)"""
         if not text.strip():
             return
         
+        # Останавливаем текущее воспроизведение и занимаем место в очереди
+        # вывода сразу: stop() во время синтеза отменит это высказывание
+        self.stop()
+        utt_id = self.player.begin_utterance()
+        turn = tracer.current()
+        
         def _speak():
-            # Останавливаем текущее воспроизведение
-            self.stop()
-            
-            # Синтезируем аудио
-            audio = self.synthesize_audio(text)
-            if audio is None:
-                return
-            
+            started = False
             try:
-                self.is_playing = True
-                self.current_audio = audio
+                if self.player.is_cancelled(utt_id):
+                    return
                 
-                logger.info("Начало воспроизведения речи")
-                
-                # Воспроизводим аудио
-                sd.play(audio, samplerate=self.sample_rate)
-                sd.wait()  # Ждем завершения воспроизведения
-                
-                self.is_playing = False
-                self.current_audio = None
-                
-                logger.info("Воспроизведение речи завершено")
+                # Синтезируем по фрагментам: первый звучит, пока синтезируются следующие
+                chunks = self.synthesize_chunks(text, cache)
+                try:
+                    for audio in chunks:
+                        if turn is not None:
+                            turn.mark('tts_first_chunk')
+                        if not self.player.write(utt_id, audio):
+                            logger.info("Озвучивание отменено")
+                            break
+                        if not started:
+                            started = True
+                            self.notify('on_speech_started', utt_id)
+                finally:
+                    chunks.close()
                 
             except Exception as e:
                 logger.error(f"Ошибка воспроизведения: {e}")
-                self.is_playing = False
-                self.current_audio = None
+                self.notify('on_error', str(e))
+                
+            finally:
+                self.player.end_utterance(utt_id)
+            
+            # Ждем завершения воспроизведения
+            self.player.wait(utt_id)
+            if started:
+                self.notify('on_speech_finished', utt_id, self.player.is_cancelled(utt_id))
+            
+            if turn is not None and not self.player.is_cancelled(utt_id):
+                first_play_time = self.player.get_first_play_time(utt_id)
+                if first_play_time is not None:
+                    turn.mark('audio_start', first_play_time)
+                tracer.finish_turn(turn)
+            
+            latency = self.player.get_latency(utt_id)
+            if latency is not None:
+                logger.info(f"Воспроизведение речи завершено (задержка до звука {latency:.2f} с)")
         
         if blocking:
             _speak()
@@ -128,16 +410,30 @@ class SileroTTS:
             # Запускаем в отдельном потоке
             threading.Thread(target=_speak, daemon=True).start()
     
+    def start_stream(self) -> SpeechPipeline:
+        """Создает конвейер для озвучивания текста по мере его генерации"""
+        self.stop()
+        self.current_pipeline = SpeechPipeline(self)
+        return self.current_pipeline
+    
     def stop(self) -> None:
-        """Останавливает воспроизведение"""
+        """Останавливает воспроизведение и отменяет незавершенный синтез"""
+        if self.current_pipeline is not None:
+            self.current_pipeline.cancel()
+            self.current_pipeline = None
+        
+        # Отменяются только высказывания этого проигрывателя, поток вывода остается открытым
         if self.is_playing:
-            try:
-                sd.stop()
-                self.is_playing = False
-                self.current_audio = None
-                logger.info("Воспроизведение остановлено")
-            except Exception as e:
-                logger.error(f"Ошибка остановки воспроизведения: {e}")
+            self.player.cancel_all()
+            logger.info("Воспроизведение остановлено")
+    
+    def close(self) -> None:
+        """Останавливает воспроизведение и закрывает аудиопоток"""
+        self.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.player.close()
+        if self.cache is not None:
+            self.cache.close()
     
     def save_audio(self, text: str, filename: str) -> bool:
         """Сохраняет синтезированную речь в файл"""
@@ -192,7 +488,22 @@ class SileroTTS:
         else:
             return ['default']
     
+    def prefetch(self, phrases: List[str]) -> None:
+        """Заранее синтезирует фразы в кэш (в фоновом потоке)"""
+        if self.cache is None:
+            return
+        
+        def _prefetch():
+            for phrase in phrases:
+                # В кэш попадают те же фрагменты, на которые speak() делит фразу
+                for chunk in self.split_text(phrase):
+                    if len(chunk) > self.cache_max_text_length:
+                        continue
+                    if self.cache.get(self.get_cache_key(chunk)) is None:
+                        self._synthesize_chunk(chunk, cache=True)
+        
+        threading.Thread(target=_prefetch, daemon=True).start()
+    
     def test_speech(self) -> None:
         """Тестирует синтез речи"""
-        test_text = "Привет! Меня зовут Сакура. Проверка синтеза речи."
-        self.speak(test_text)
+        self.speak(TEST_PHRASE, cache=True)
@@ -0,0 +1,191 @@
+"""
+Конвейер озвучивания: нарезка потока токенов на предложения,
+синтез следующего предложения во время воспроизведения предыдущего
+"""
+
+import re
+import time
+import queue
+import threading
+from typing import List, Optional, TYPE_CHECKING
+from utils.logger import logger
+from utils.tracing import tracer
+
+if TYPE_CHECKING:
+    from .silero_tts import SileroTTS
+
+
+# Конец предложения: знак препинания, за которым следует пробел или перевод строки
+SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+# Границы фраз внутри слишком длинного предложения
+CLAUSE_END_RE = re.compile(r'(?<=[,;:—])\s+')
+
+
+class SentenceSplitter:
+    """Нарезает поступающий поток текста на законченные предложения"""
+
+    def __init__(self, min_chars: int = 3, max_chars: int = 300):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Добавляет текст и возвращает готовые предложения"""
+        self.buffer += text
+        sentences = []
+
+        position = 0
+        while True:
+            match = SENTENCE_END_RE.search(self.buffer, position)
+            if match is None:
+                break
+
+            sentence = self.buffer[:match.start()].strip()
+            if not sentence:
+                self.buffer = self.buffer[match.end():]
+                position = 0
+                continue
+
+            # Слишком короткий фрагмент ("1." в списке) присоединяем к следующему
+            if len(sentence) < self.min_chars:
+                position = match.end()
+                continue
+
+            sentences.append(sentence)
+            self.buffer = self.buffer[match.end():]
+            position = 0
+
+        # Длинный текст без точек режем по границе фразы или по пробелу
+        while len(self.buffer) > self.max_chars:
+            head = self.buffer[:self.max_chars]
+            cut = None
+            for match in CLAUSE_END_RE.finditer(head):
+                cut = match
+            if cut is not None:
+                sentences.append(head[:cut.start()].strip())
+                self.buffer = self.buffer[cut.end():]
+                continue
+
+            space = head.rfind(' ')
+            if space <= 0:
+                space = self.max_chars
+            sentences.append(head[:space].strip())
+            self.buffer = self.buffer[space:].lstrip()
+
+        return sentences
+
+    def flush(self) -> List[str]:
+        """Возвращает остаток буфера как последнее предложение"""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+def split_sentences(text: str, max_chars: int = 300) -> List[str]:
+    """Разбивает готовый текст на предложения"""
+    splitter = SentenceSplitter(max_chars=max_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+class SpeechPipeline:
+    """Потоковое озвучивание ответа по предложениям"""
+
+    def __init__(self, tts: 'SileroTTS'):
+        self.tts = tts
+        self.player = tts.player
+        self.splitter = SentenceSplitter()
+
+        # Очередь предложений на синтез; готовое аудио сразу дописывается
+        # в буфер проигрывателя, заполненный буфер притормаживает синтез
+        self.text_queue: "queue.Queue[Optional[str]]" = queue.Queue()
+
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.utt_id = self.player.begin_utterance()
+        self.turn = tracer.current()
+
+        self._synth_thread = threading.Thread(target=self._synthesis_worker, daemon=True)
+        self._synth_thread.start()
+
+    def feed(self, text: str) -> None:
+        """Передает очередной фрагмент текста (токен) в конвейер"""
+        if self.cancelled.is_set():
+            return
+        for sentence in self.splitter.feed(text):
+            self._enqueue(sentence)
+
+    def finish(self) -> None:
+        """Сообщает, что текст закончился"""
+        if self.cancelled.is_set():
+            return
+        for sentence in self.splitter.flush():
+            self._enqueue(sentence)
+        self.text_queue.put(None)
+
+    def cancel(self) -> None:
+        """Прерывает синтез и воспроизведение"""
+        if self.cancelled.is_set():
+            return
+        self.cancelled.set()
+        self.text_queue.put(None)
+        self.player.cancel(self.utt_id)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ожидает завершения воспроизведения"""
+        return self.finished.wait(timeout)
+
+    def _enqueue(self, sentence: str) -> None:
+        """Ставит предложение в очередь, пропуская фрагменты без слов (эмодзи и т.п.)"""
+        if any(ch.isalnum() for ch in sentence):
+            self.text_queue.put(sentence)
+
+    def _synthesis_worker(self) -> None:
+        """Синтезирует предложения по очереди и передает их проигрывателю"""
+        started = False
+        try:
+            while not self.cancelled.is_set():
+                sentence = self.text_queue.get()
+                if sentence is None or self.cancelled.is_set():
+                    break
+
+                synthesis_start = time.monotonic()
+                audio = self.tts.synthesize_audio(sentence)
+                if self.turn is not None:
+                    self.turn.add_span('tts_synthesis', synthesis_start, time.monotonic())
+                if audio is None or self.cancelled.is_set():
+                    continue
+
+                if not self.player.write(self.utt_id, audio):
+                    break
+
+                if not started:
+                    started = True
+                    logger.info("Начало потокового воспроизведения речи")
+                    self.tts.notify('on_speech_started', self.utt_id)
+
+        except Exception as e:
+            logger.error(f"Ошибка потокового воспроизведения: {e}")
+            self.tts.notify('on_error', str(e))
+        finally:
+            self.player.end_utterance(self.utt_id)
+
+        # Дожидаемся проигрывания хвоста буфера
+        self.player.wait(self.utt_id)
+        self.finished.set()
+        if started:
+            self.tts.notify('on_speech_finished', self.utt_id, self.cancelled.is_set())
+
+        if self.turn is not None and not self.cancelled.is_set():
+            first_play_time = self.player.get_first_play_time(self.utt_id)
+            if first_play_time is not None:
+                self.turn.mark('audio_start', first_play_time)
+            self.turn.set('tts_underruns', self.player.get_stats()['underruns'])
+            tracer.finish_turn(self.turn)
+        
+        latency = self.player.get_latency(self.utt_id)
+        if latency is not None:
+            logger.info(
+                f"Потоковое воспроизведение речи завершено. Задержка до звука: {latency:.2f} с, "
+                f"опустошений буфера: {self.player.get_stats()['underruns']}"
+            )
@@ -7,8 +7,9 @@ import pyaudio
 import wave
 import threading
 import time
-from typing import List, Optional, Tuple, Callable
-from ..utils.logger import logger
+from collections import deque
+from typing import Deque, List, Optional, Tuple, Callable
+from utils.logger import logger
 
 
 class AudioDeviceManager:
@@ -160,6 +161,118 @@ class VoiceActivityDetector:
         """Устанавливает порог детекции"""
         self.threshold = threshold
         logger.info(f"Порог VAD установлен: {threshold}")
+    
+    def has_speech(self, audio_data: np.ndarray) -> bool:
+        """
+        Проверяет блок по окнам window_size: речь есть, если хотя бы одно окно
+        громче порога. Так короткое начало слова не усредняется тишиной блока
+        """
+        try:
+            if audio_data.dtype == np.int16:
+                audio_data = audio_data.astype(np.float32) / 32768.0
+            
+            frames = len(audio_data) // self.window_size
+            if frames == 0:
+                return self.is_speech(audio_data)
+            
+            windows = audio_data[:frames * self.window_size].reshape(frames, self.window_size)
+            rms = np.sqrt(np.mean(windows ** 2, axis=1))
+            
+            threshold = self.noise_level if self.calibrated else self.threshold
+            return bool(np.any(rms > threshold))
+            
+        except Exception as e:
+            logger.error(f"Ошибка детекции голоса: {e}")
+            return False
+
+
+class SpeechGate:
+    """
+    Шлюз перед распознавателем: пропускает аудио только при наличии речи.
+    Хранит предзапись (чтобы не обрезать начало слова), продолжает пропускать
+    аудио в течение silence_timeout после речи и сообщает о конце фразы
+    """
+    
+    def __init__(self,
+                 detector: VoiceActivityDetector,
+                 sample_rate: int = 16000,
+                 pre_roll: float = 0.5,
+                 silence_timeout: float = 2.0,
+                 min_speech_duration: float = 0.5):
+        self.detector = detector
+        self.sample_rate = sample_rate
+        self.pre_roll = pre_roll
+        self.silence_timeout = silence_timeout
+        self.min_speech_duration = min_speech_duration
+        
+        self.in_speech = False
+        self.speech_time = 0.0
+        self.silence_time = 0.0
+        self.pre_roll_time = 0.0
+        self.pre_roll_buffer: Deque[Tuple[bytes, float]] = deque()
+        
+        # Статистика: сколько аудио не отправлено в распознаватель
+        self.passed_time = 0.0
+        self.skipped_time = 0.0
+    
+    def process(self, chunk: bytes) -> Tuple[List[bytes], Optional[str]]:
+        """
+        Обрабатывает блок PCM16. Возвращает блоки для распознавателя и событие:
+        'start' - началась речь, 'end' - фраза закончилась,
+        'discard' - фраза короче min_speech_duration (шум), None - без изменений
+        """
+        audio = np.frombuffer(chunk, dtype=np.int16)
+        duration = len(audio) / self.sample_rate
+        is_speech = self.detector.has_speech(audio)
+        
+        if not self.in_speech:
+            if not is_speech:
+                # Тишина: копим предзапись ограниченной длины
+                self.pre_roll_buffer.append((chunk, duration))
+                self.pre_roll_time += duration
+                while self.pre_roll_buffer and self.pre_roll_time - self.pre_roll_buffer[0][1] >= self.pre_roll:
+                    _, dropped = self.pre_roll_buffer.popleft()
+                    self.pre_roll_time -= dropped
+                self.skipped_time += duration
+                return [], None
+            
+            # Начало речи: отдаем предзапись вместе с текущим блоком
+            chunks = [buffered for buffered, _ in self.pre_roll_buffer]
+            chunks.append(chunk)
+            self.pre_roll_buffer.clear()
+            self.pre_roll_time = 0.0
+            
+            self.in_speech = True
+            self.speech_time = duration
+            self.silence_time = 0.0
+            self.passed_time += duration
+            return chunks, 'start'
+        
+        self.passed_time += duration
+        
+        if is_speech:
+            self.speech_time += duration
+            self.silence_time = 0.0
+            return [chunk], None
+        
+        # Тишина внутри фразы: пропускаем до истечения таймаута
+        self.silence_time += duration
+        if self.silence_time < self.silence_timeout:
+            return [chunk], None
+        
+        self.in_speech = False
+        event = 'end' if self.speech_time >= self.min_speech_duration else 'discard'
+        return [chunk], event
+    
+    def reset(self) -> None:
+        """Сбрасывает состояние шлюза"""
+        self.in_speech = False
+        self.speech_time = 0.0
+        self.silence_time = 0.0
+        self.pre_roll_time = 0.0
+        self.pre_roll_buffer.clear()
+        self.passed_time = 0.0
+        self.skipped_time = 0.0
 
 
 class AudioRecorder:
@@ -328,6 +441,58 @@ class AudioProcessor:
             logger.error(f"Ошибка применения усиления: {e}")
             return audio
     
+    @staticmethod
+    def window_rms(audio_float: np.ndarray, starts: np.ndarray, window_size: int) -> np.ndarray:
+        """
+        RMS окон [start, start + window_size) без цикла по окнам: суммы квадратов
+        считаются один раз по отрезкам между границами окон
+        """
+        boundaries = np.union1d(starts, starts + window_size)
+        squares = np.square(audio_float[:boundaries[-1]])
+        
+        segment_energy = np.add.reduceat(squares, boundaries[:-1])
+        energy = np.zeros(len(boundaries), dtype=np.float64)
+        np.cumsum(segment_energy, dtype=np.float64, out=energy[1:])
+        
+        begin = np.searchsorted(boundaries, starts)
+        finish = np.searchsorted(boundaries, starts + window_size)
+        window_energy = np.maximum(energy[finish] - energy[begin], 0.0)
+        return np.sqrt(window_energy / window_size)
+    
+    @staticmethod
+    def mark_windows(mask: np.ndarray, voiced_starts: np.ndarray, window_size: int) -> None:
+        """Отмечает в маске окна с речью, сливая перекрывающиеся окна в сплошные участки"""
+        if len(voiced_starts) == 0:
+            return
+        
+        breaks = np.nonzero(voiced_starts[1:] > voiced_starts[:-1] + window_size)[0]
+        run_starts = voiced_starts[np.concatenate(([0], breaks + 1))]
+        run_ends = voiced_starts[np.concatenate((breaks, [len(voiced_starts) - 1]))] + window_size
+        
+        for run_start, run_end in zip(run_starts, run_ends):
+            mask[run_start:run_end] = True
+    
+    @staticmethod
+    def speech_mask(audio_float: np.ndarray, threshold: float, window_size: int) -> np.ndarray:
+        """
+        Маска участков с речью: окна длиной window_size с шагом window_size // 4,
+        RMS которых выше порога, помечаются целиком
+        """
+        hop = window_size // 4
+        if hop <= 0:
+            raise ValueError(f"Слишком маленькое окно анализа тишины: {window_size}")
+        
+        n = len(audio_float)
+        speech_mask = np.zeros(n, dtype=bool)
+        if n - window_size <= 0:
+            return speech_mask
+        
+        # Начала окон те же, что у range(0, n - window_size, hop)
+        starts = np.arange(0, n - window_size, hop)
+        rms = AudioProcessor.window_rms(audio_float, starts, window_size)
+        AudioProcessor.mark_windows(speech_mask, starts[rms > threshold], window_size)
+        return speech_mask
+    
     @staticmethod
     def remove_silence(audio: np.ndarray, 
                       threshold: float = 0.01, 
@@ -345,14 +510,7 @@ class AudioProcessor:
                 audio_float = audio.astype(np.float32)
             
             # Находим участки с речью
-            speech_mask = np.zeros(len(audio_float), dtype=bool)
-            
-            for i in range(0, len(audio_float) - window_size, window_size // 4):
-                window = audio_float[i:i + window_size]
-                rms = np.sqrt(np.mean(window ** 2))
-                
-                if rms > threshold:
-                    speech_mask[i:i + window_size] = True
+            speech_mask = AudioProcessor.speech_mask(audio_float, threshold, window_size)
             
             # Оставляем только участки с речью
             speech_audio = audio[speech_mask]
@@ -363,6 +521,158 @@ class AudioProcessor:
         except Exception as e:
             logger.error(f"Ошибка удаления тишины: {e}")
             return audio
+    
+    @staticmethod
+    def time_stretch(audio: np.ndarray,
+                     speed: float,
+                     sample_rate: int = 48000,
+                     frame_duration: float = 0.02,
+                     tolerance: float = 0.005,
+                     decimation: int = 4) -> np.ndarray:
+        """
+        Изменяет темп речи без изменения высоты тона (WSOLA).
+        Каждый следующий кадр берется со сдвигом speed * hop и подстраивается
+        в пределах tolerance под естественное продолжение предыдущего кадра.
+        Сдвиг ищется по корреляции сначала с прореживанием в decimation раз,
+        затем уточняется с полным разрешением
+        """
+        if abs(speed - 1.0) < 1e-3 or len(audio) == 0:
+            return audio
+        
+        try:
+            x = np.asarray(audio, dtype=np.float32).reshape(-1)
+            
+            frame_size = max(4 * decimation, int(sample_rate * frame_duration) // 2 * 2)
+            synthesis_hop = frame_size // 2
+            analysis_hop = synthesis_hop * speed
+            delta = max(decimation, int(sample_rate * tolerance))
+            
+            # Периодическое окно Ханна при перекрытии 50% дает в сумме единицу
+            window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame_size) / frame_size)).astype(np.float32)
+            
+            output_length = int(len(x) / speed)
+            frames = output_length // synthesis_hop + 1
+            
+            # Запас нулей с обеих сторон, чтобы окна поиска не выходили за границы
+            pad = delta + frame_size
+            required = pad + int(round((frames - 1) * analysis_hop)) + delta + 2 * frame_size
+            padded = np.zeros(max(required, pad + len(x) + pad), dtype=np.float32)
+            padded[pad:pad + len(x)] = x
+            
+            output = np.zeros(frames * synthesis_hop + frame_size, dtype=np.float32)
+            weights = np.zeros_like(output)
+            
+            position = pad
+            for k in range(frames):
+                if k > 0:
+                    # Естественное продолжение предыдущего выбранного кадра
+                    template = padded[position + synthesis_hop:position + synthesis_hop + frame_size]
+                    center = pad + int(round(k * analysis_hop))
+                    region = padded[center - delta:center + delta + frame_size]
+                    candidates = np.lib.stride_tricks.sliding_window_view(region, frame_size)
+                    
+                    coarse = candidates[::decimation, ::decimation] @ template[::decimation]
+                    best = int(np.argmax(coarse)) * decimation
+                    
+                    low = max(0, best - decimation + 1)
+                    high = min(len(candidates), best + decimation)
+                    fine = candidates[low:high] @ template
+                    position = center - delta + low + int(np.argmax(fine))
+                
+                start = k * synthesis_hop
+                output[start:start + frame_size] += padded[position:position + frame_size] * window
+                weights[start:start + frame_size] += window
+            
+            # Края, где окна не перекрываются, выравниваем по сумме весов
+            np.divide(output, weights, out=output, where=weights > 1e-3)
+            return output[:output_length].astype(audio.dtype, copy=False)
+            
+        except Exception as e:
+            logger.error(f"Ошибка изменения темпа аудио: {e}")
+            return audio
+
+
+class StreamingSilenceRemover:
+    """
+    Потоковый вариант AudioProcessor.remove_silence для аудио, поступающего блоками.
+    Результат конкатенации process(...) + flush() совпадает с remove_silence
+    для всего сигнала; задержка выдачи - не больше одного окна анализа
+    """
+    
+    def __init__(self,
+                 threshold: float = 0.01,
+                 min_silence_duration: float = 0.5,
+                 sample_rate: int = 16000):
+        self.threshold = threshold
+        self.window_size = int(min_silence_duration * sample_rate)
+        self.hop = self.window_size // 4
+        if self.hop <= 0:
+            raise ValueError(f"Слишком маленькое окно анализа тишины: {self.window_size}")
+        
+        self.reset()
+    
+    def reset(self) -> None:
+        """Сбрасывает состояние"""
+        # Хвост сигнала, еще не выданный наружу; base - его абсолютное смещение
+        self.buffer: Optional[np.ndarray] = None
+        self.buffer_float = np.zeros(0, dtype=np.float32)
+        self.buffer_mask = np.zeros(0, dtype=bool)
+        self.base = 0
+        
+        # Абсолютное начало следующего окна для анализа
+        self.next_start = 0
+    
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """Принимает очередной блок и возвращает готовые семплы с речью"""
+        if chunk.dtype == np.int16:
+            chunk_float = chunk.astype(np.float32) / 32768.0
+        else:
+            chunk_float = chunk.astype(np.float32)
+        
+        if self.buffer is None:
+            self.buffer = chunk.copy()
+        else:
+            self.buffer = np.concatenate([self.buffer, chunk])
+        self.buffer_float = np.concatenate([self.buffer_float, chunk_float])
+        self.buffer_mask = np.concatenate([self.buffer_mask, np.zeros(len(chunk), dtype=bool)])
+        
+        total = self.base + len(self.buffer_float)
+        
+        # Окно анализируется, только когда за ним есть хотя бы один семпл:
+        # в пакетной версии условие start < n - window_size строгое
+        last_start = total - self.window_size - 1
+        if last_start >= self.next_start:
+            starts = np.arange(self.next_start, last_start + 1, self.hop)
+            self._mark_windows(starts)
+            self.next_start = int(starts[-1]) + self.hop
+        
+        # Семплы до next_start больше не попадут ни в одно новое окно
+        return self._emit(self.next_start)
+    
+    def flush(self) -> np.ndarray:
+        """Выдает остаток сигнала (после последнего блока)"""
+        if self.buffer is None:
+            return np.zeros(0, dtype=np.float32)
+        result = self._emit(self.base + len(self.buffer_float))
+        self.reset()
+        return result
+    
+    def _mark_windows(self, starts: np.ndarray) -> None:
+        """Считает RMS окон (абсолютные начала starts) и отмечает речь"""
+        local = starts - self.base
+        rms = AudioProcessor.window_rms(self.buffer_float, local, self.window_size)
+        AudioProcessor.mark_windows(self.buffer_mask, local[rms > self.threshold], self.window_size)
+    
+    def _emit(self, until: int) -> np.ndarray:
+        """Отдает семплы буфера до абсолютной позиции until"""
+        count = max(0, min(until - self.base, len(self.buffer_float)))
+        result = self.buffer[:count][self.buffer_mask[:count]]
+        
+        self.buffer = self.buffer[count:]
+        self.buffer_float = self.buffer_float[count:]
+        self.buffer_mask = self.buffer_mask[count:]
+        self.base += count
+        return result
 
 
 # Глобальные экземпляры
@@ -1,26 +1,91 @@
 """
-Настройки логирования для приложения Sakura AI
+Настройки логирования для приложения Sakura AI.
+Потоки приложения только кладут записи в ограниченную очередь,
+форматирование и запись в консоль и файл выполняет один фоновый поток
 """
 
 import os
+import re
+import queue
+import atexit
 import logging
 import logging.handlers
-from typing import Optional
+import threading
+from typing import List, Optional, Set
 from colorlog import ColoredFormatter
 
+# Размер очереди записей лога: при переполнении новые записи отбрасываются
+DEFAULT_QUEUE_SIZE = 10000
 
-def setup_logger(name: str = "SakuraAI", level: str = "INFO", log_file: Optional[str] = None) -> logging.Logger:
-    """
-    Настраивает логгер с цветным выводом в консоль и опциональным файлом
-    """
-    logger = logging.getLogger(name)
-    logger.setLevel(getattr(logging, level.upper()))
-    
-    # Если уже настроен, возвращаем существующий
-    if logger.handlers:
-        return logger
-    
-    # Цветной форматтер для консоли
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(value, default: int = 10 * 1024 * 1024) -> int:
+    """Разбирает размер вида "10MB", "512 KB" или число байт"""
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*', str(value), re.IGNORECASE)
+    if not match:
+        return default
+    number, unit = match.groups()
+    unit = unit.upper()
+    if unit in ('K', 'M', 'G'):
+        unit += 'B'
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Кладет записи в очередь без блокировки; при переполнении считает потерянные"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.reported = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+
+        # Как только место появилось, сообщаем о потерянных записях
+        with self._lock:
+            lost = self.dropped - self.reported
+            self.reported = self.dropped
+        if lost:
+            notice = logging.LogRecord(
+                record.name, logging.WARNING, __file__, 0,
+                f"Очередь лога переполнена, пропущено записей: {lost}", None, None
+            )
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                with self._lock:
+                    self.reported -= lost
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """QueueListener, который дожидается места для сигнала остановки"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel, timeout=1.0)
+
+
+# Состояние фонового журнала (один на процесс)
+_listener: Optional[_QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+_queue_size = 0
+_log_file: Optional[str] = None
+# Имена логгеров, к которым подключен общий обработчик очереди
+_logger_names: Set[str] = set()
+
+
+def _console_handler() -> logging.Handler:
+    """Цветной вывод в консоль"""
     console_formatter = ColoredFormatter(
         "%(log_color)s%(asctime)s [%(levelname)s] %(name)s: %(message)s",
         datefmt="%H:%M:%S",
@@ -32,31 +97,106 @@ def setup_logger(name: str = "SakuraAI", level: str = "INFO", log_file: Optional
             'CRITICAL': 'red,bg_white',
         }
     )
-    
-    # Консольный хендлер
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
-    
-    # Файловый хендлер (опционально)
+    return console_handler
+
+
+def _file_handler(log_file: str, max_bytes: int, backups: int) -> logging.Handler:
+    """Файл с ротацией по размеру"""
+    log_dir = os.path.dirname(log_file)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    file_formatter = logging.Formatter(
+        "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=max_bytes,
+        backupCount=backups,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(file_formatter)
+    return file_handler
+
+
+def _start_listener(handlers: List[logging.Handler]) -> None:
+    """Запускает поток записи журнала с заданными обработчиками"""
+    global _listener
+    _listener = _QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Дописывает оставшиеся записи и останавливает поток записи"""
+    global _listener
+    if _listener is None:
+        return
+    listener = _listener
+    _listener = None
+    try:
+        listener.stop()
+    except queue.Full:
+        pass
+    for handler in listener.handlers:
+        handler.close()
+
+
+def get_dropped_count() -> int:
+    """Число записей, потерянных из-за переполнения очереди"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def setup_logger(name: str = "SakuraAI",
+                 level: str = "INFO",
+                 log_file: Optional[str] = None,
+                 max_size="10MB",
+                 backups: int = 5,
+                 queue_size: int = DEFAULT_QUEUE_SIZE) -> logging.Logger:
+    """
+    Настраивает логгер с цветным выводом в консоль и опциональным файлом.
+    Все настроенные логгеры пишут в одну очередь. Повторный вызов меняет
+    уровень, а при смене файла журнала или размера очереди пересоздает их
+    """
+    global _queue_handler, _queue_size, _log_file
+
+    logger = logging.getLogger(name)
+    logger.setLevel(getattr(logging, level.upper()))
+    _logger_names.add(name)
+
+    # Уже настроен с тем же файлом и очередью - только подключаем обработчик
+    if _queue_handler is not None and log_file == _log_file and queue_size == _queue_size:
+        if _queue_handler not in logger.handlers:
+            logger.addHandler(_queue_handler)
+        return logger
+
+    handlers: List[logging.Handler] = [_console_handler()]
     if log_file:
-        os.makedirs(os.path.dirname(log_file), exist_ok=True)
-        
-        file_formatter = logging.Formatter(
-            "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S"
-        )
-        
-        # Ротация файлов (10MB, 5 бэкапов)
-        file_handler = logging.handlers.RotatingFileHandler(
-            log_file, 
-            maxBytes=10 * 1024 * 1024,  # 10MB
-            backupCount=5,
-            encoding='utf-8'
-        )
-        file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
-    
+        handlers.append(_file_handler(log_file, parse_size(max_size), backups))
+
+    previous = _queue_handler
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    if previous is None:
+        atexit.register(stop_logging)
+    else:
+        # Счетчик потерянных записей продолжается с новой очередью
+        _queue_handler.dropped = previous.dropped
+        _queue_handler.reported = previous.reported
+
+    for logger_name in _logger_names:
+        configured = logging.getLogger(logger_name)
+        if previous is not None:
+            configured.removeHandler(previous)
+        configured.addHandler(_queue_handler)
+
+    # Записи, уже стоящие в старой очереди, дописываются старыми обработчиками
+    stop_logging()
+
+    _queue_size = queue_size
+    _log_file = log_file
+    _start_listener(handlers)
     return logger
 
 
@@ -0,0 +1,185 @@
+"""
+Трассировка задержек хода разговора: STT → LLM → TTS.
+Каждый ход получает номер, этапы отмечаются по монотонным часам,
+итог пишется в JSONL и передается подписчикам (панель статуса)
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from config.config_manager import config
+from utils.logger import logger
+
+
+class Turn:
+    """Один ход: от конца речи (или ввода текста) до окончания озвучивания ответа"""
+
+    def __init__(self, turn_id: int, source: str, start: Optional[float] = None):
+        self.turn_id = turn_id
+        self.source = source
+        self.start = start if start is not None else time.monotonic()
+        self.started_at = time.time() - (time.monotonic() - self.start)
+        self.marks: Dict[str, float] = {}
+        self.spans: List[Dict[str, Any]] = []
+        self.attributes: Dict[str, Any] = {}
+        self.status: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def mark(self, name: str, at: Optional[float] = None) -> None:
+        """Отмечает момент этапа (повторная отметка с тем же именем игнорируется)"""
+        offset = (at if at is not None else time.monotonic()) - self.start
+        with self._lock:
+            self.marks.setdefault(name, offset)
+
+    def add_span(self, name: str, start: float, end: float) -> None:
+        """Добавляет интервал, измеренный по time.monotonic()"""
+        with self._lock:
+            self.spans.append({
+                'name': name,
+                'start_ms': round((start - self.start) * 1000, 1),
+                'duration_ms': round((end - start) * 1000, 1)
+            })
+
+    def set(self, key: str, value: Any) -> None:
+        """Сохраняет произвольный атрибут хода"""
+        with self._lock:
+            self.attributes[key] = value
+
+    def set_ollama_stats(self, chunk: Dict[str, Any]) -> None:
+        """Сохраняет статистику Ollama из последнего чанка ответа (наносекунды → мс)"""
+        for key in ('total_duration', 'load_duration', 'prompt_eval_duration', 'eval_duration'):
+            if chunk.get(key) is not None:
+                self.set(f"ollama_{key}_ms", round(chunk[key] / 1e6, 1))
+        for key in ('prompt_eval_count', 'eval_count'):
+            if chunk.get(key) is not None:
+                self.set(f"ollama_{key}", chunk[key])
+
+    def summary(self) -> Dict[str, float]:
+        """Длительности этапов в секундах по имеющимся отметкам"""
+        marks = dict(self.marks)
+
+        def between(first: str, second: str) -> Optional[float]:
+            if first in marks and second in marks:
+                return round(marks[second] - marks[first], 3)
+            return None
+
+        result = {
+            # От конца речи до финального результата распознавания (конечная точка, VAD)
+            'speech_end_to_final': round(marks['stt_final'], 3) if 'stt_final' in marks else None,
+            'input_to_request': between('input', 'llm_request'),
+            'time_to_first_token': between('llm_request', 'llm_first_token'),
+            'generation': between('llm_request', 'llm_done'),
+            'first_token_to_audio': between('llm_first_token', 'audio_start'),
+            # Главная метрика: от конца речи (или ввода) до первого звука
+            'to_first_audio': round(marks['audio_start'], 3) if 'audio_start' in marks else None,
+            'total': round(max(marks.values()), 3) if marks else 0.0
+        }
+        return {key: value for key, value in result.items() if value is not None}
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'turn_id': self.turn_id,
+                'source': self.source,
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+                'status': self.status,
+                'marks_ms': {name: round(offset * 1000, 1) for name, offset in self.marks.items()},
+                'spans': list(self.spans),
+                'attributes': dict(self.attributes),
+                'summary': self.summary()
+            }
+
+
+class Tracer:
+    """Журнал ходов разговора"""
+
+    def __init__(self):
+        self.enabled = config.get('tracing.enabled', True)
+        self.trace_file = config.get('tracing.file', 'logs/trace.jsonl')
+
+        self.current_turn: Optional[Turn] = None
+        self.next_id = 1
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """Подписывает на завершенные ходы (вызывается из потока, завершившего ход)"""
+        self._listeners.append(callback)
+
+    def start_turn(self, source: str, start: Optional[float] = None) -> Optional[Turn]:
+        """Начинает новый ход; незавершенный предыдущий считается прерванным"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            previous = self.current_turn
+            turn = Turn(self.next_id, source, start)
+            self.next_id += 1
+            self.current_turn = turn
+
+        if previous is not None:
+            self.finish_turn(previous, status='interrupted')
+        return turn
+
+    def claim_turn(self, source: str = 'text') -> Optional[Turn]:
+        """
+        Возвращает ход для нового запроса к ИИ: ход, начатый распознаванием речи,
+        если он еще не использован, иначе новый ход
+        """
+        turn = self.current()
+        if turn is None or 'input' in turn.marks:
+            turn = self.start_turn(source)
+        if turn is not None:
+            turn.mark('input')
+        return turn
+
+    def current(self) -> Optional[Turn]:
+        """Текущий незавершенный ход"""
+        return self.current_turn
+
+    def finish_turn(self, turn: Optional[Turn], status: str = 'completed') -> None:
+        """Завершает ход: пишет запись в файл и уведомляет подписчиков"""
+        if turn is None:
+            return
+
+        with self._lock:
+            if turn.status is not None:
+                return
+            turn.status = status
+            if self.current_turn is turn:
+                self.current_turn = None
+
+        turn.mark('end')
+        record = turn.to_dict()
+        self._write(record)
+
+        summary = record['summary']
+        if 'to_first_audio' in summary:
+            logger.info(f"Ход #{turn.turn_id} ({status}): до первого звука {summary['to_first_audio']:.2f} с")
+
+        for listener in list(self._listeners):
+            try:
+                listener(record)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика трассировки: {e}")
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        """Дописывает запись в JSONL-файл"""
+        if not self.trace_file:
+            return
+        try:
+            with self._file_lock:
+                trace_dir = os.path.dirname(self.trace_file)
+                if trace_dir:
+                    os.makedirs(trace_dir, exist_ok=True)
+                with open(self.trace_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.error(f"Ошибка записи трассировки: {e}")
+
+
+# Глобальный трассировщик
+tracer = Tracer()